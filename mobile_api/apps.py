@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class MobileApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mobile_api'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save
+        from rest_framework.authtoken.models import Token
+
+        from myApp.models import Profile
+        from .authentication import _profile_saved, _token_deleted, _user_saved
+
+        # Drop cached token authentications when what they captured changes
+        post_save.connect(_user_saved, sender=get_user_model(), dispatch_uid="mobile_token_user_saved")
+        post_delete.connect(_user_saved, sender=get_user_model(), dispatch_uid="mobile_token_user_deleted")
+        post_save.connect(_profile_saved, sender=Profile, dispatch_uid="mobile_token_profile_saved")
+        post_delete.connect(_token_deleted, sender=Token, dispatch_uid="mobile_token_deleted")
@@ -0,0 +1,132 @@
+"""
+Token authentication with a per-process cache for the mobile API.
+
+DRF's TokenAuthentication runs a token + user query on every request, and most
+views then load the profile (plan, language) again. CachedTokenAuthentication
+keeps the token with its user and profile in the "local" (in-process) cache
+for TOKEN_AUTH_CACHE_SECONDS, so a repeat request needs no query to know who
+the caller is and what plan they are on (request.user.profile is already
+loaded).
+
+Saving a user (password change, deactivation, login) or profile, or deleting
+a token (logout, account deletion), drops the entry in this process (signals
+connected in MobileApiConfig.ready()) and writes a fresh per-user marker to the
+shared "default" cache. Other worker processes compare an entry's marker with
+the shared one at most every TOKEN_AUTH_RECHECK_SECONDS, so they can keep
+serving the old user, profile or a deleted token for up to that long.
+
+Changes that send no signal (QuerySet.update() on users or profiles, raw SQL)
+are not seen until the entry expires after TOKEN_AUTH_CACHE_SECONDS; keep that
+short. The same goes for a shared cache that cannot be reached.
+"""
+
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from myApp.models import Profile
+
+TOKEN_AUTH_CACHE_SECONDS = getattr(settings, "TOKEN_AUTH_CACHE_SECONDS", 60)
+TOKEN_AUTH_RECHECK_SECONDS = getattr(settings, "TOKEN_AUTH_RECHECK_SECONDS", 5)
+
+
+def _local_cache():
+    return caches["local"]
+
+
+def _cache_key(key) -> str:
+    return "mobile_token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _marker_key(user_id) -> str:
+    return f"mobile_token_marker:{user_id}"
+
+
+def _shared_marker(user_id):
+    try:
+        return cache.get(_marker_key(user_id))
+    except Exception:
+        return None  # shared cache down: entries live out their TTL
+
+
+def _bump_marker(user_id):
+    """A new marker makes every process's cached entries for the user stale on their next recheck."""
+    try:
+        cache.set(_marker_key(user_id), uuid.uuid4().hex, TOKEN_AUTH_CACHE_SECONDS + TOKEN_AUTH_RECHECK_SECONDS)
+    except Exception:
+        pass
+
+
+def invalidate_token(key, user_id=None):
+    _local_cache().delete(_cache_key(key))
+    if user_id is not None:
+        _bump_marker(user_id)
+
+
+def invalidate_user(user_id):
+    _bump_marker(user_id)
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+def get_profile(user) -> Profile:
+    """The profile loaded with the token (no query), creating it if missing."""
+    return Profile.for_user(user)
+
+
+def _cached_token(cache_key):
+    """The locally cached token, unless another process has invalidated its user since it was cached."""
+    entry = _local_cache().get(cache_key)
+    if entry is None:
+        return None
+    now = time.monotonic()
+    if now - entry["checked_at"] < TOKEN_AUTH_RECHECK_SECONDS:
+        return entry["token"]
+    if _shared_marker(entry["token"].user_id) != entry["marker"]:
+        _local_cache().delete(cache_key)
+        return None
+    remaining = TOKEN_AUTH_CACHE_SECONDS - (now - entry["cached_at"])
+    if remaining > 0:
+        _local_cache().set(cache_key, dict(entry, checked_at=now), remaining)
+    return entry["token"]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        token = _cached_token(cache_key)
+        if token is None:
+            try:
+                token = Token.objects.select_related("user", "user__profile").get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed("Invalid token.")
+            now = time.monotonic()
+            _local_cache().set(cache_key, {
+                "token": token,
+                "marker": _shared_marker(token.user_id),
+                "cached_at": now,
+                "checked_at": now,
+            }, TOKEN_AUTH_CACHE_SECONDS)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        return (token.user, token)
+
+
+# ---- Signal receivers (connected in apps.MobileApiConfig.ready) ----
+def _user_saved(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def _profile_saved(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+def _token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key, instance.user_id)
@@ -0,0 +1,118 @@
+"""
+Batched read requests for the mobile API (POST api/mobile/batch/).
+
+At launch the iOS app needs auth status, config, tones, settings, preferences
+and the chat list: six round trips, six token lookups and six connection
+checkouts when sent one by one. The batch endpoint takes them in one body
+
+    {"requests": [{"id": "tones", "path": "/api/tones/"},
+                  {"id": "sessions", "path": "/api/mobile/chat/sessions/",
+                   "headers": {"If-None-Match": "\"...\""}}]}
+
+and runs each against the existing view, in-process and in order, as the
+caller the batch already authenticated (DRF's forced authentication, so no
+second token lookup), answering
+
+    {"responses": [{"id": "tones", "status": 200, "headers": {"ETag": ...}, "body": {...}}, ...]}
+
+Only GETs of the read endpoints in BATCHABLE_VIEWS can be batched, so a batch
+never changes anything. Each item has its own status (304 when its
+If-None-Match still matches, 404 for an unknown path, ...); one failing item
+does not fail the others.
+"""
+
+import copy
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.datastructures import MultiValueDict
+
+from . import compat_views, views
+
+log = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = getattr(settings, "MOBILE_BATCH_MAX_REQUESTS", 20)
+
+BATCHABLE_VIEWS = frozenset({
+    views.health,
+    views.auth_status,
+    views.config,
+    views.tones,
+    views.tone_detail,
+    views.user_settings,
+    views.user_preferences,
+    views.chat_sessions,
+    views.chat_sync,
+    compat_views.config,
+    compat_views.tones,
+    compat_views.auth_status,
+    compat_views.user_settings,
+    compat_views.user_preferences,
+    compat_views.chat_sessions,
+})
+
+# Response headers copied into each item
+ITEM_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+def _item(item_id, status, body=None, headers=None) -> dict:
+    return {"id": item_id, "status": status, "headers": headers or {}, "body": body}
+
+
+def _sub_request(request, url, match, if_none_match=None):
+    """A GET for url on the batch's HttpRequest (same user, session and connection), pre-authenticated."""
+    sub = copy.copy(request._request)
+    sub.method = "GET"
+    sub.path = sub.path_info = url.path
+    sub.META = {k: v for k, v in sub.META.items() if not k.startswith(("CONTENT_", "HTTP_IF_"))}
+    sub.META.update(REQUEST_METHOD="GET", PATH_INFO=url.path, QUERY_STRING=url.query)
+    if if_none_match:
+        sub.META["HTTP_IF_NONE_MATCH"] = str(if_none_match)
+    sub.GET = QueryDict(url.query)
+    sub._post, sub._files = QueryDict(), MultiValueDict()
+    sub.resolver_match = match
+    # rest_framework.request.Request skips the authenticators when these are set
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def run_item(request, item) -> dict:
+    if not isinstance(item, dict):
+        return _item(None, 400, {"error": "Each request must be an object"})
+    item_id = item.get("id")
+    path = item.get("path")
+    if not isinstance(path, str) or not path.startswith("/"):
+        return _item(item_id, 400, {"error": "path must be an absolute path"})
+    if str(item.get("method") or "GET").upper() != "GET":
+        return _item(item_id, 405, {"error": "Only GET requests can be batched"})
+
+    url = urlsplit(path)
+    try:
+        match = resolve(url.path, getattr(request, "urlconf", None))
+    except Resolver404:
+        return _item(item_id, 404, {"error": "Not found"})
+    if match.func not in BATCHABLE_VIEWS:
+        return _item(item_id, 400, {"error": f"{url.path} cannot be batched"})
+
+    headers = item.get("headers") if isinstance(item.get("headers"), dict) else {}
+    sub = _sub_request(request, url, match, headers.get("If-None-Match"))
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception:
+        log.exception("Batch item %s failed", url.path)
+        return _item(item_id, 500, {"error": "Internal error"})
+
+    return _item(
+        item_id,
+        response.status_code,
+        getattr(response, "data", None),  # unrendered: the batch response encodes it once
+        {name: response[name] for name in ITEM_HEADERS if response.has_header(name)},
+    )
+
+
+def run_batch(request, items) -> list:
+    return [run_item(request, item) for item in items]
@@ -2,17 +2,23 @@
 Compatibility views to match iOS frontend expectations.
 These wrap the main views with the exact request/response formats the frontend expects.
 """
+import logging
 import uuid
 from django.utils import timezone
 from django.contrib.auth import authenticate, get_user_model
-from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes, renderer_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
 
+from myApp.conditional import etag, static_etag
+from .authentication import CachedTokenAuthentication, get_profile
+from .renderers import MOBILE_PARSERS, MOBILE_RENDERERS, MessagePackParser
+
 User = get_user_model()
+log = logging.getLogger(__name__)
 
 # ---- Helpers ----
 def user_payload(user):
@@ -28,70 +34,80 @@ def user_payload(user):
     }
 
 # ---- Public endpoints ----
+# Static catalogs: built once at import, served with a constant ETag
+TONES_PAYLOAD = {
+    "tones": [
+        {
+            "id": "PlainClinical",
+            "name": "Plain Clinical",
+            "description": "Warm but precise medical guidance"
+        },
+        {
+            "id": "Caregiver",
+            "name": "Caregiver",
+            "description": "Comforting health companion mode"
+        },
+        {
+            "id": "Faith",
+            "name": "Faith",
+            "description": "Faith-filled health guidance with spiritual support"
+        },
+        {
+            "id": "Clinical",
+            "name": "Clinical",
+            "description": "Structured SOAP notes for healthcare professionals"
+        },
+        {
+            "id": "Geriatric",
+            "name": "Geriatric",
+            "description": "Elderly care focused"
+        },
+        {
+            "id": "EmotionalSupport",
+            "name": "Emotional Support",
+            "description": "Emotional support mode"
+        }
+    ]
+}
+TONES_VERSION = static_etag(TONES_PAYLOAD)
+CONFIG_FEATURES = {
+    "signup": True,
+    "login": True,
+    "chat": True,
+    "summarize": True,
+}
+CONFIG_VERSION = static_etag(CONFIG_FEATURES)
+
 @api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
 @permission_classes([AllowAny])
+@etag(lambda request: [CONFIG_VERSION, request.build_absolute_uri('/api/')])
 def config(request):
     """
     Get API configuration (public endpoint).
     GET /api/config/
     Returns basic configuration info the app might need.
     """
-    from django.conf import settings
     return Response({
         "api_version": "1.0",
         "base_url": request.build_absolute_uri('/api/'),
-        "features": {
-            "signup": True,
-            "login": True,
-            "chat": True,
-            "summarize": True,
-        }
+        "features": CONFIG_FEATURES
     }, status=200)
 
 @api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
 @permission_classes([AllowAny])
+@etag(lambda request: TONES_VERSION)
 def tones(request):
     """
     Get available AI tones.
     GET /api/tones/
     Returns list of available tones with descriptions.
     """
-    return Response({
-        "tones": [
-            {
-                "id": "PlainClinical",
-                "name": "Plain Clinical",
-                "description": "Warm but precise medical guidance"
-            },
-            {
-                "id": "Caregiver",
-                "name": "Caregiver",
-                "description": "Comforting health companion mode"
-            },
-            {
-                "id": "Faith",
-                "name": "Faith",
-                "description": "Faith-filled health guidance with spiritual support"
-            },
-            {
-                "id": "Clinical",
-                "name": "Clinical",
-                "description": "Structured SOAP notes for healthcare professionals"
-            },
-            {
-                "id": "Geriatric",
-                "name": "Geriatric",
-                "description": "Elderly care focused"
-            },
-            {
-                "id": "EmotionalSupport",
-                "name": "Emotional Support",
-                "description": "Emotional support mode"
-            }
-        ]
-    }, status=200)
+    return Response(TONES_PAYLOAD, status=200)
 
 @api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
 @permission_classes([AllowAny])
 def auth_status(request):
     """
@@ -113,7 +129,8 @@ def auth_status(request):
         }, status=200)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
 @permission_classes([AllowAny])
 def signup(request):
     """
@@ -175,7 +192,8 @@ def signup(request):
     return Response(response_data, status=201)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
 @permission_classes([AllowAny])
 def login(request):
     """
@@ -225,7 +243,8 @@ def login(request):
 
 # ---- Authenticated endpoints ----
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def user_settings(request):
     """
@@ -235,8 +254,9 @@ def user_settings(request):
     return Response(user_payload(request.user), status=200)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def user_settings_update(request):
     """
@@ -268,8 +288,9 @@ def user_settings_update(request):
     return Response(user_payload(user), status=200)
 
 @api_view(['GET', 'PUT'])
-@parser_classes([JSONParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def user_preferences(request):
     """
@@ -277,9 +298,7 @@ def user_preferences(request):
     GET /api/user/preferences/
     PUT /api/user/preferences/
     """
-    from myApp.models import Profile
-    
-    profile, _ = Profile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
     if request.method == 'GET':
         return Response({
@@ -308,7 +327,8 @@ def user_preferences(request):
         }, status=200)
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def chat_sessions(request):
     """
@@ -323,17 +343,16 @@ def chat_sessions(request):
     ).order_by('-updated_at')[:50]
     
     # Transform messages to match iOS ChatMessage format
-    def transform_messages(msgs):
-        if not msgs:
-            return []
+    def transform_messages(session):
+        session.assign_message_ids()  # stable ids, so the client can cache and diff
         transformed = []
-        for msg in msgs:
+        for msg in session.messages or []:
             # Skip system messages for iOS
             if msg.get("role") == "system":
                 continue
             # Convert 'ts' to 'timestamp' for iOS compatibility
             transformed_msg = {
-                "id": str(uuid.uuid4()),  # Generate unique ID for iOS
+                "id": msg["id"],
                 "role": msg.get("role", ""),
                 "content": msg.get("content", ""),
                 "timestamp": msg.get("ts", ""),  # Rename ts -> timestamp
@@ -350,12 +369,13 @@ def chat_sessions(request):
         "updated_at": s.updated_at.isoformat(),
         "tone": s.tone or "PlainClinical",
         "lang": s.lang or "en-US",
-        "messages": transform_messages(s.messages or []),  # Transform messages!
+        "messages": transform_messages(s),  # Transform messages!
     } for s in sessions], status=200)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def create_chat_session(request):
     """
@@ -394,8 +414,9 @@ def create_chat_session(request):
     }, status=201)
 
 @api_view(['POST'])
-@parser_classes([JSONParser, MultiPartParser, FormParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MultiPartParser, FormParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def send_chat(request):
     """
@@ -410,178 +431,39 @@ def send_chat(request):
     - care_setting: string (optional, for Clinical/Caregiver tones)
     - faith_setting: string (optional, for Faith tone)
     - files[]: array of file data (multipart file uploads)
+    - upload_ids: ids of finalized resumable uploads (api/mobile/uploads/), instead of files[]
     
     Returns iOS ChatMessage format: {id, role, content, timestamp, session_id, metadata}
     """
-    # Real AI enabled! 🚀
-    USE_REAL_AI = True
+    from myApp.chat_service import ChatService, uploaded_files
+    from myApp.uploads import UploadError, open_uploads, upload_ids
+    from .views import chat_message_payload, upload_error
     
-    # Extract form fields (works for both multipart and JSON)
     user_message = (request.data.get("message") or "").strip()
-    tone_raw = request.data.get("tone", "PlainClinical")
-    lang = request.data.get("lang", "en-US")
-    care_setting = request.data.get("care_setting")
-    faith_setting = request.data.get("faith_setting")
+    files = uploaded_files(request.FILES)
+    ids = upload_ids(request.data)  # finalized resumable uploads (api/mobile/uploads/)
+    if not user_message and not files and not ids:
+        return Response({"error": "message or files required"}, status=400)
     
     # Parse session_id (frontend sends as string, but it's an integer)
-    incoming_session_id = None
-    session_id_str = request.data.get("session_id")
-    if session_id_str:
-        try:
-            incoming_session_id = int(session_id_str)
-        except (ValueError, TypeError):
-            print(f"⚠️ Invalid session_id format: {session_id_str}, ignoring")
-    
-    # Get files - frontend sends as "files[]" array
-    files = request.FILES.getlist("files[]")
-    
-    # Fallback for alternative field names (backwards compatibility)
-    if not files:
-        files = request.FILES.getlist("file") or ([request.FILES["file"]] if "file" in request.FILES else [])
-    
-    # Log file information for debugging
-    if files:
-        print(f"📎 Received {len(files)} file(s):")
-        for idx, f in enumerate(files):
-            print(f"  File {idx}: name={f.name}, size={f.size}, content_type={f.content_type}")
-    
-    # DEBUG: Log raw request data to diagnose issues
-    print(f"🔍 DEBUG: Request keys: {list(request.data.keys())}")
-    print(f"🔍 DEBUG: Tone from request: {repr(tone_raw)}")
-    print(f"🔍 DEBUG: Message: {user_message[:50] if user_message else '[empty]'}...")
-    print(f"🔍 DEBUG: Files: {len(files)} file(s)")
-    print(f"🔍 DEBUG: Session ID: {incoming_session_id}")
-    
-    if not user_message and not files:
-        return Response({"error": "message or files required"}, status=400)
+    try:
+        incoming_session_id = int(request.data.get("session_id"))
+    except (ValueError, TypeError):
+        incoming_session_id = None
     
-    # Real AI implementation
     try:
-        from myApp.views import (
-            normalize_tone, get_system_prompt, get_setting_prompt, get_faith_prompt,
-            norm_setting, norm_faith_setting, _classify_mode, _now_ts, _now_iso,
-            _trim_history, _ensure_session_for_user, summarize_single_file
-        )
-        from openai import OpenAI
-        
-        client = OpenAI()
-        
-        # Normalize tone (frontend may send "plain_clinical" but backend expects "PlainClinical")
-        # The normalize_tone function handles this conversion
-        tone = normalize_tone(tone_raw)
-        
-        print(f"💬 User={request.user.username}, Msg={user_message[:40] if user_message else '[files]'}..., Tone={tone} (normalized from {repr(tone_raw)})")
-        
-        # Classify mode
-        mode, topic_hint = _classify_mode(user_message, bool(files), request.session)
-        print(f"📊 Mode={mode}, Files={len(files)}")
-        
-        # Build layered system prompt
-        base = get_system_prompt(tone)
-        if tone == "Faith" and faith_setting:
-            sys_prompt = get_faith_prompt(base, norm_faith_setting(faith_setting))
-        elif tone in ("Clinical", "Caregiver") and care_setting:
-            sys_prompt = get_setting_prompt(base, norm_setting(care_setting))
-        else:
-            sys_prompt = base
-        sys_prompt = f"{sys_prompt}\n\n(Always respond in {lang} unless told otherwise.)"
-        
-        header = f"ResponseMode: {mode}" + (f"\nTopicHint: {topic_hint}" if topic_hint else "")
-        
-        # Session management
-        # incoming_session_id is already parsed as int above
-        sticky = request.session.get("active_chat_session_id")
-        chosen_id = incoming_session_id or sticky
-        sess, created = _ensure_session_for_user(request.user, tone, lang, user_message or "[files]", chosen_id)
-        request.session["active_chat_session_id"] = sess.id
-        request.session.modified = True
-        
-        # Build history (strip stale system prompts so tone swaps take effect)
-        hist = [
-            {"role": m.get("role"), "content": m.get("content")}
-            for m in (sess.messages or [])
-            if m.get("role") in ("user", "assistant") and m.get("content")
-        ]
-        chat_history = [
-            {"role": "system", "content": sys_prompt},
-            {"role": "system", "content": header},
-            *hist,
-        ]
-        
-        # Process files
-        if files:
-            sections = [
-                summarize_single_file(f, tone, sys_prompt, request.user, request)[1]
-                for f in files
-            ]
-            context = "\n\n".join(sections).strip()
-            if context:
-                chat_history.append({
-                    "role": "user",
-                    "content": f"(Medical context):\n{context}"
-                })
-        
-        if user_message:
-            chat_history.append({"role": "user", "content": user_message})
-        
-        # Two-pass AI
-        raw = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0.6,
-            messages=chat_history
-        ).choices[0].message.content.strip()
-        final = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0.3,
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "system", "content": header},
-                {"role": "user", "content": f"Rewrite warmly:\n\n{raw}"}
-            ]
-        ).choices[0].message.content.strip()
-        
-        # Save
-        existing = sess.messages or []
-        non_system_msgs = [m for m in existing if m.get("role") != "system"]
-        msgs = [
-            {"role": "system", "content": sys_prompt, "ts": _now_iso()},
-            {"role": "system", "content": header, "ts": _now_iso()},
-        ]
-        msgs.extend(non_system_msgs)
-        if files:
-            msgs.append({"role": "user", "content": "(Files uploaded)", "ts": _now_iso()})
-        if user_message:
-            msgs.append({"role": "user", "content": user_message, "ts": _now_iso()})
-        msgs.append({"role": "assistant", "content": final, "ts": _now_iso()})
-        sess.messages = _trim_history(msgs, 200)
-        sess.updated_at = timezone.now()
-        sess.save(update_fields=["messages", "updated_at"])
-        
-        # Soft memory
-        request.session["nm_last_mode"] = mode if mode != "QUICK" else "QUICK"
-        request.session["nm_last_short_msg"] = user_message if mode == "QUICK" else ""
-        request.session["nm_last_ts"] = _now_ts()
-        request.session.modified = True
-        
-        # Return iOS ChatMessage format (NOT document summary format)
-        # Required fields: id, role, content, timestamp, session_id, metadata
-        response_data = {
-            "id": str(uuid.uuid4()),
-            "role": "assistant",  # MUST be "assistant" for AI responses
-            "content": final,  # The AI's response text (NOT "summary")
-            "timestamp": timezone.now().isoformat(),  # ISO 8601 format (NOT "created_at")
-            "session_id": sess.id,  # Integer session ID (NOT string)
-            "metadata": None  # Optional, can be null
-        }
-        
-        print(f"✅ CHAT RESPONSE: Returning chat message format with {len(final)} chars")
-        return Response(response_data, status=200)
-        
+        with open_uploads(request.user, ids) as stored_files:
+            result = ChatService(request.session).send(
+                request.user, incoming_session_id, user_message, files + stored_files,
+                tone=request.data.get("tone", "PlainClinical"),
+                lang=request.data.get("lang", "en-US"),
+                care_setting=request.data.get("care_setting"),
+                faith_setting=request.data.get("faith_setting"),
+            )
+    except UploadError as e:
+        return upload_error(e)
     except Exception as e:
-        print(f"❌ CHAT ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-        # Return error in JSON format (not HTML)
+        log.exception("compat send_chat failed")
         # Always return JSON, never HTML error pages
         from django.conf import settings
         error_detail = str(e) if getattr(settings, 'DEBUG', False) else None
@@ -589,10 +471,14 @@ def send_chat(request):
             "error": "System busy. Try again in a moment.",
             "detail": error_detail
         }, status=503)
+    
+    # Return iOS ChatMessage format (NOT document summary format)
+    return Response(chat_message_payload(result, incoming_session_id), status=200)
 
 @api_view(['GET', 'POST'])
-@parser_classes([JSONParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def summarize(request):
     """
@@ -639,7 +525,8 @@ def summarize(request):
         }, status=201)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
 @permission_classes([AllowAny])
 def google_signin(request):
     """
@@ -693,8 +580,9 @@ def google_signin(request):
     }, status=501)
 
 @api_view(['POST'])
-@parser_classes([JSONParser])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes([JSONParser, MessagePackParser])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def clear_session(request):
     """
@@ -0,0 +1,124 @@
+"""
+Management command to compare JSON and MessagePack on chat session payloads.
+
+Builds the chat/sessions/ response (format_session_for_ios) either from a real
+user's sessions (--user) or from synthetic sessions shaped like production
+chats, then reports encode and decode time and payload size, raw and gzipped,
+for the renderer each Accept header selects.
+"""
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from mobile_api.renderers import MessagePackRenderer
+from mobile_api.views import format_session_for_ios
+from myApp.models import ChatSession
+
+WORDS = (
+    "blood pressure medication dosage symptoms patient history cardiology results lab "
+    "values within normal range follow up appointment recommended monitor daily hydration "
+    "inflammation chronic acute diagnosis treatment plan side effects consult physician "
+    "cholesterol glucose kidney function imaging report findings mild moderate severe"
+).split()
+
+ENCODINGS = (
+    ("json", JSONRenderer(), json.loads),
+    ("msgpack", MessagePackRenderer(), lambda data: msgpack.unpackb(data, raw=False)),
+)
+
+
+def _text(rng, min_words, max_words):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    lines, line = [], []
+    for word in words:
+        line.append(word)
+        if len(line) >= rng.randint(8, 20):
+            lines.append(("- " if rng.random() < 0.3 else "") + " ".join(line).capitalize() + ".")
+            line = []
+    if line:
+        lines.append(" ".join(line).capitalize() + ".")
+    return "\n".join(lines)
+
+
+def synthetic_sessions(count, messages, seed=0):
+    """Unsaved ChatSessions: short user turns, long markdown assistant answers."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    sessions = []
+    for pk in range(1, count + 1):
+        started = now - timedelta(days=rng.randint(0, 90), minutes=rng.randint(0, 1440))
+        history = []
+        for n in range(messages):
+            user_turn = n % 2 == 0
+            history.append({
+                "role": "user" if user_turn else "assistant",
+                "content": _text(rng, 10, 50) if user_turn else _text(rng, 120, 450),
+                "ts": (started + timedelta(minutes=n)).isoformat(),
+            })
+        session = ChatSession(
+            pk=pk, title=_text(rng, 3, 6)[:60], messages=history, tone="PlainClinical",
+            created_at=started, updated_at=started + timedelta(minutes=messages),
+        )
+        sessions.append(session)
+    return sessions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON vs MessagePack encoding of chat session payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username or id whose sessions to encode (default: synthetic sessions)')
+        parser.add_argument('--sessions', type=int, default=50, help='Number of sessions (default: 50)')
+        parser.add_argument('--messages', type=int, default=30, help='Messages per synthetic session (default: 30)')
+        parser.add_argument('--repeat', type=int, default=20, help='Encodes/decodes per format (default: 20)')
+
+    def _payload(self, options):
+        if options['user']:
+            User = get_user_model()
+            lookup = {'pk': options['user']} if options['user'].isdigit() else {'username': options['user']}
+            user = User.objects.filter(**lookup).first()
+            if user is None:
+                raise CommandError(f'No user {options["user"]!r}.')
+            sessions = list(ChatSession.objects.filter(user=user).order_by('-updated_at')[:options['sessions']])
+            if not sessions:
+                raise CommandError(f'{user} has no chat sessions.')
+        else:
+            sessions = synthetic_sessions(options['sessions'], options['messages'])
+        return [format_session_for_ios(s) for s in sessions]
+
+    def handle(self, *args, **options):
+        payload = self._payload(options)
+        repeat = max(1, options['repeat'])
+        messages = sum(len(s['messages']) for s in payload)
+        self.stdout.write(f'{len(payload)} sessions, {messages} messages, {repeat} runs each\n')
+        self.stdout.write(
+            f'{"format":<8} {"encode ms":>10} {"decode ms":>10} {"KB":>9} {"gzip KB":>9} {"vs json":>8}'
+        )
+
+        json_size = None
+        for name, renderer, decode in ENCODINGS:
+            encode_times, decode_times = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                data = renderer.render(payload)
+                encode_times.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                decode(data)
+                decode_times.append((time.perf_counter() - started) * 1000)
+            size = len(data)
+            json_size = json_size or size
+            self.stdout.write(
+                f'{name:<8} {statistics.median(encode_times):>10.2f} {statistics.median(decode_times):>10.2f} '
+                f'{size / 1024:>9.1f} {len(gzip.compress(data)) / 1024:>9.1f} {size / json_size:>8.0%}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Done (times are medians).'))
@@ -0,0 +1,79 @@
+"""
+MessagePack content negotiation for the mobile API.
+
+Clients that send `Accept: application/msgpack` get the same payloads as the
+JSON responses, packed as MessagePack: smaller (no quoting or escaping,
+compact ints and lengths) and cheaper to encode and decode for long chat
+histories. Request bodies may be sent as `Content-Type: application/msgpack`
+too. JSON stays the default, so existing clients are unaffected.
+
+Views opt in with @renderer_classes(MOBILE_RENDERERS) and
+@parser_classes(MOBILE_PARSERS); `manage.py bench_mobile_payloads` compares
+the two encodings on session payloads.
+"""
+
+import datetime
+import decimal
+import uuid
+
+import msgpack
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def _default(obj):
+    """Types JSONRenderer handles that msgpack doesn't, converted the same way."""
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        value = obj.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+def packb(data) -> bytes:
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return packb(data)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f"MessagePack parse error - {str(exc) or type(exc).__name__}")
+
+
+# JSON (and the browsable API) first, so clients that don't ask get JSON
+MOBILE_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+MOBILE_PARSERS = [*api_settings.DEFAULT_PARSER_CLASSES, MessagePackParser]
@@ -0,0 +1,135 @@
+"""
+Chat history delta sync for the iOS app (GET api/mobile/chat/sync/?since=<cursor>).
+
+The client stores the returned cursor and sends it back on the next sync; it
+gets only sessions whose updated_at moved since then (with just the messages
+newer than the cursor) and the ids of sessions deleted or archived since then
+(ChatSessionTombstone rows; archiving does not touch updated_at). Without a
+cursor, or with one older than CHAT_TOMBSTONE_DAYS, the response is a full
+sync (full=true) and the client should replace its copy. While has_more is
+true the client keeps fetching with the returned cursor; deleted and archived
+ids come on the last page.
+
+Cursors are opaque strings:
+- "t<us>": server time of the last completed sync. The next sync looks back
+  SYNC_OVERLAP from it, so a session committed while that sync ran is not
+  missed; messages carry stable ids, so the client de-duplicates the overlap.
+- "p<since>.<updated_at>.<pk>" / "f<started>.<updated_at>.<pk>": the next page
+  of an incremental / full sync, strictly after (updated_at, pk), so bulk
+  updated histories page without repeats.
+Times are integer microseconds since the epoch.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from myApp.models import ChatSession, ChatSessionTombstone
+
+SYNC_PAGE_SIZE = getattr(settings, "CHAT_SYNC_PAGE_SIZE", 100)
+SYNC_OVERLAP = timedelta(seconds=5)
+TOMBSTONE_DAYS = getattr(settings, "CHAT_TOMBSTONE_DAYS", 90)
+
+
+class SessionDelta(NamedTuple):
+    session: ChatSession
+    messages: list      # non-system messages to send
+    replace: bool       # True: messages is the whole history, not just the new ones
+
+
+class SyncPage(NamedTuple):
+    full: bool
+    sessions: list      # [SessionDelta]
+    deleted_ids: list
+    archived_ids: list
+    cursor: str
+    has_more: bool
+
+
+class _Cursor(NamedTuple):
+    full: bool
+    since: Optional[datetime]   # incremental: change horizon; full continuation: when the sync started
+    after: Optional[tuple]      # (updated_at, pk) of the last session sent, for page continuations
+
+
+def _us(dt) -> int:
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _from_us(value) -> datetime:
+    return datetime.fromtimestamp(int(value) / 1_000_000, tz=dt_timezone.utc)
+
+
+def decode_cursor(cursor: Optional[str]) -> _Cursor:
+    """Parse a cursor; missing, malformed or too old cursors mean a full sync."""
+    try:
+        kind, rest = (cursor or " ")[0], (cursor or " ")[1:]
+        if kind == "t":
+            since = _from_us(rest)
+            if since >= timezone.now() - timedelta(days=TOMBSTONE_DAYS):
+                return _Cursor(False, since - SYNC_OVERLAP, None)
+        elif kind in ("p", "f"):
+            since, updated_at, pk = rest.split(".")
+            return _Cursor(kind == "f", _from_us(since), (_from_us(updated_at), int(pk)))
+    except (ValueError, OverflowError, OSError):
+        pass
+    return _Cursor(True, None, None)
+
+
+def _message_time(msg):
+    ts = msg.get("ts") or msg.get("timestamp")
+    if not ts:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+def _delta(session, since) -> SessionDelta:
+    session.assign_message_ids()
+    visible = [m for m in session.messages or [] if isinstance(m, dict) and m.get("role") != "system"]
+    if since is None or session.created_at >= since:
+        return SessionDelta(session, visible, True)
+    # Messages without a timestamp can't be placed; resend them (ids de-duplicate)
+    new = [m for m in visible if (_message_time(m) or since) >= since]
+    # Nothing older survived: the history was cleared or rewritten, so replace it
+    return SessionDelta(session, new, len(new) == len(visible))
+
+
+def sync_page(user, cursor: Optional[str] = None, limit: int = SYNC_PAGE_SIZE) -> SyncPage:
+    now = timezone.now()
+    state = decode_cursor(cursor)
+
+    sessions = ChatSession.objects.filter(user=user)
+    if state.after is not None:
+        updated_at, pk = state.after
+        sessions = sessions.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk))
+    elif not state.full:
+        sessions = sessions.filter(updated_at__gte=state.since)
+    rows = list(sessions.order_by("updated_at", "pk")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Deletions and archives since the sync began (a single-page full sync needs none)
+    changed = {"deleted": [], "archived": []}
+    if not has_more and state.since is not None:
+        tombstones = ChatSessionTombstone.objects.filter(user=user, deleted_at__gte=state.since)
+        for kind, session_id in tombstones.values_list("kind", "session_id"):
+            changed[kind].append(session_id)
+
+    if has_more:
+        last = rows[-1]
+        origin = state.since or now
+        next_cursor = f"{'f' if state.full else 'p'}{_us(origin)}.{_us(last.updated_at)}.{last.pk}"
+    else:
+        next_cursor = f"t{_us(now)}"
+    message_since = None if state.full else state.since
+    return SyncPage(
+        state.full, [_delta(s, message_since) for s in rows], changed["deleted"], changed["archived"],
+        next_cursor, has_more,
+    )
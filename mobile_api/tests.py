@@ -1,3 +1,297 @@
-from django.test import TestCase
+import hashlib
+import os
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from myApp.models import ChatSession, ChatSessionTombstone, ChunkedUpload, UserMediaFile
+from myApp.tests import LOCMEM_CACHES, use_temp_media
+
+from . import authentication
+from .authentication import CachedTokenAuthentication
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches["local"].clear()
+        self.user = User.objects.create_user("token", "token@example.com", "pw")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_repeat_authentication_needs_no_query(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_invalidation_from_another_process_is_seen_after_recheck(self):
+        self.auth.authenticate_credentials(self.token.key)
+        # Another process deactivated the user: its signal bumped the shared marker, not our local entry
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        authentication._bump_marker(self.user.pk)
+
+        self.auth.authenticate_credentials(self.token.key)  # still within the recheck window
+        later = authentication.time.monotonic() + authentication.TOKEN_AUTH_RECHECK_SECONDS
+        with mock.patch.object(authentication.time, "monotonic", return_value=later):
+            with self.assertRaisesMessage(AuthenticationFailed, "User inactive or deleted."):
+                self.auth.authenticate_credentials(self.token.key)
+
+    def test_deleted_token_is_rejected_in_this_process(self):
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+        self.token.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, "Invalid token."):
+            self.auth.authenticate_credentials(key)
+
+
+class MobileApiTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches["local"].clear()
+        self.user = User.objects.create_user("mobile", "mobile@example.com", "pw")
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChatSyncTests(MobileApiTestCase):
+    def _session(self, title, age):
+        then = timezone.now() - age
+        session = ChatSession.objects.create(
+            user=self.user, title=title, created_at=then,
+            messages=[{"role": "user", "content": f"{title} question", "ts": then.isoformat()}],
+        )
+        ChatSession.objects.filter(pk=session.pk).update(updated_at=then)
+        return session
+
+    def _sync(self, **params):
+        response = self.api.get("/api/mobile/chat/sync/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_sync_then_only_changes_and_tombstones(self):
+        kept = self._session("kept", timedelta(hours=2))
+        changed = self._session("changed", timedelta(hours=2))
+        deleted = self._session("deleted", timedelta(hours=2))
+
+        first = self._sync()
+        self.assertTrue(first["full"])
+        self.assertEqual({s["id"] for s in first["sessions"]}, {kept.pk, changed.pk, deleted.pk})
+        self.assertTrue(first["cursor"].startswith("t"))
+
+        changed.messages = changed.messages + [{"role": "user", "content": "follow up", "ts": timezone.now().isoformat()}]
+        changed.save()
+        deleted_pk = deleted.pk
+        ChatSessionTombstone.record(self.user.pk, [deleted_pk])
+        deleted.delete()
+
+        second = self._sync(since=first["cursor"])
+        self.assertFalse(second["full"])
+        self.assertEqual([s["id"] for s in second["sessions"]], [changed.pk])
+        self.assertFalse(second["sessions"][0]["replace"])
+        self.assertEqual(len(second["sessions"][0]["messages"]), 1)
+        self.assertEqual(second["deleted_session_ids"], [deleted_pk])
+
+    def test_archived_sessions_come_as_ids(self):
+        kept = self._session("kept", timedelta(hours=2))
+        first = self._sync()
+
+        ChatSession.objects.filter(pk=kept.pk).update(archived=True)
+        ChatSessionTombstone.record(self.user.pk, [kept.pk], kind="archived")
+
+        second = self._sync(since=first["cursor"])
+        self.assertEqual(second["sessions"], [])
+        self.assertEqual((second["deleted_session_ids"], second["archived_session_ids"]), ([], [kept.pk]))
+
+    def test_pages_continue_without_repeats(self):
+        sessions = [self._session(f"s{i}", timedelta(hours=1)) for i in range(3)]
+        seen, cursor = [], None
+        while True:
+            page = self._sync(limit=2, **({"since": cursor} if cursor else {}))
+            seen += [s["id"] for s in page["sessions"]]
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+        self.assertEqual(sorted(seen), sorted(s.pk for s in sessions))
+
+    def test_bad_cursor_means_full_sync(self):
+        self._session("old", timedelta(hours=1))
+        self.assertTrue(self._sync(since="garbage")["full"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ETagTests(MobileApiTestCase):
+    url = "/api/mobile/chat/sessions/"
+
+    def test_unchanged_sessions_are_not_modified(self):
+        ChatSession.objects.create(user=self.user, title="one")
+        first = self.api.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header("ETag"))
+
+        again = self.api.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+        ChatSession.objects.create(user=self.user, title="two")
+        changed = self.api.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_static_catalog_etag(self):
+        first = self.api.get("/api/tones/")
+        self.assertEqual(self.api.get("/api/tones/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchTests(MobileApiTestCase):
+    url = "/api/mobile/batch/"
+
+    def _batch(self, items, client=None):
+        return (client or self.api).post(self.url, {"requests": items}, format="json")
+
+    def test_requires_authentication(self):
+        response = self._batch([{"id": "tones", "path": "/api/tones/"}], client=APIClient())
+        self.assertEqual(response.status_code, 401)
+
+    def test_items_run_as_the_caller(self):
+        ChatSession.objects.create(user=self.user, title="mine")
+        other = User.objects.create_user("other", "other@example.com", "pw")
+        ChatSession.objects.create(user=other, title="theirs")
+
+        responses = self._batch([
+            {"id": "settings", "path": "/api/mobile/user/settings/"},
+            {"id": "sessions", "path": "/api/mobile/chat/sessions/"},
+        ]).json()["responses"]
+        self.assertEqual([r["status"] for r in responses], [200, 200])
+        self.assertEqual(responses[0]["body"]["email"], "mobile@example.com")
+        self.assertNotIn("theirs", str(responses[1]["body"]))
+        self.assertIn("ETag", responses[1]["headers"])
+
+    def test_if_none_match_per_item(self):
+        etag = self.api.get("/api/tones/")["ETag"]
+        responses = self._batch([
+            {"id": "tones", "path": "/api/tones/", "headers": {"If-None-Match": etag}},
+            {"id": "fresh", "path": "/api/tones/"},
+        ]).json()["responses"]
+        self.assertEqual([r["status"] for r in responses], [304, 200])
+
+    def test_only_allowlisted_gets(self):
+        responses = self._batch([
+            {"id": "write", "path": "/api/mobile/chat/sessions/new/"},
+            {"id": "post", "path": "/api/mobile/chat/sessions/", "method": "POST"},
+            {"id": "missing", "path": "/api/mobile/nothing-here/"},
+            {"id": "relative", "path": "api/tones/"},
+        ]).json()["responses"]
+        self.assertEqual([r["status"] for r in responses], [400, 405, 404, 400])
+        self.assertFalse(ChatSession.objects.filter(user=self.user).exists())
+
+    def test_batch_size_is_capped(self):
+        from .batch import BATCH_MAX_REQUESTS
+
+        items = [{"id": str(i), "path": "/api/tones/"} for i in range(BATCH_MAX_REQUESTS + 1)]
+        self.assertEqual(self._batch(items).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChunkedUploadTests(MobileApiTestCase):
+    data = b"%PDF-1.4 lab results " * 50
+
+    def setUp(self):
+        super().setUp()
+        use_temp_media(self)
+
+    def _start(self):
+        response = self.api.post("/api/mobile/uploads/", {"filename": "labs.pdf", "size": len(self.data)}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["upload_id"]
+
+    def _put(self, upload_id, offset, chunk):
+        return self.api.put(
+            f"/api/mobile/uploads/{upload_id}/?offset={offset}", chunk, content_type="application/octet-stream",
+        )
+
+    def _finalize(self, upload_id, sha256):
+        return self.api.post(f"/api/mobile/uploads/{upload_id}/finalize/", {"sha256": sha256}, format="json")
+
+    def test_resume_after_dropped_chunk(self):
+        upload_id = self._start()
+        half = len(self.data) // 2
+        self.assertEqual(self._put(upload_id, 0, self.data[:half]).json()["offset"], half)
+
+        # The client lost the response and asks where to continue
+        self.assertEqual(self.api.get(f"/api/mobile/uploads/{upload_id}/").json()["offset"], half)
+        self.assertEqual(self._put(upload_id, half, self.data[half:]).json()["offset"], len(self.data))
+
+        response = self._finalize(upload_id, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "complete")
+        self.assertTrue(UserMediaFile.objects.filter(user=self.user, display_name="labs.pdf").exists())
+        # A retried finalize answers the same
+        self.assertEqual(self._finalize(upload_id, hashlib.sha256(self.data).hexdigest()).status_code, 200)
+
+    def test_offset_mismatch_reports_server_offset(self):
+        upload_id = self._start()
+        self._put(upload_id, 0, self.data[:10])
+        response = self._put(upload_id, 0, self.data[:10])  # a retry of a chunk that already landed
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 10)
+
+    def test_finalize_checks_hash(self):
+        upload_id = self._start()
+        self.assertEqual(self._finalize(upload_id, "0" * 64).status_code, 409)  # incomplete
+        self._put(upload_id, 0, self.data)
+
+        response = self._finalize(upload_id, hashlib.sha256(b"other bytes").hexdigest())
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload_id).exists())
+        self.assertFalse(UserMediaFile.objects.exists())
+
+    def test_concurrent_finalize_that_renamed_first(self):
+        upload_id = self._start()
+        self._put(upload_id, 0, self.data)
+        rename = os.replace
+
+        def rename_then_lose(src, dst):
+            rename(src, dst)  # the other finalize's rename...
+            raise FileNotFoundError(src)  # ...lands just before ours
+
+        with mock.patch("myApp.views.os.replace", side_effect=rename_then_lose):
+            response = self._finalize(upload_id, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "complete")
+
+    def test_open_uploads_are_limited(self):
+        with mock.patch("myApp.uploads.UPLOAD_MAX_OPEN", 2):
+            self._start()
+            self._start()
+            response = self.api.post("/api/mobile/uploads/", {"filename": "more.pdf", "size": 10}, format="json")
+        self.assertEqual(response.status_code, 429)
+
+    def test_abandoned_uploads_expire_without_a_new_upload(self):
+        from myApp.uploads import part_path
+
+        upload = ChunkedUpload.objects.get(pk=self._start())
+        ChunkedUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command("enforce_retention", "--skip-analytics", stdout=StringIO())
+
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(part_path(upload).exists())
+
+    def test_uploads_are_private(self):
+        upload_id = self._start()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user("other", "other@example.com", "pw"))
+        self.assertEqual(other.get(f"/api/mobile/uploads/{upload_id}/").status_code, 404)
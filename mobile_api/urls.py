@@ -18,10 +18,16 @@ urlpatterns = [
     
     # Chat endpoints
     path('chat/sessions/', views.chat_sessions, name='chat_sessions'),
+    path('chat/sync/', views.chat_sync, name='chat_sync'),
     path('chat/sessions/new/', views.create_chat_session, name='create_chat_session'),
     path('chat/clear-session/', views.clear_session, name='clear_session'),
     path('send-chat/', views.send_chat, name='send_chat'),
     
+    # Resumable uploads (referenced from send-chat as upload_ids)
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
+    
     # Tone management
     path('tones/', views.tones, name='tones'),
     path('tones/<str:tone_id>/', views.tone_detail, name='tone_detail'),
@@ -31,5 +37,8 @@ urlpatterns = [
     
     # App configuration
     path('config/', views.config, name='config'),
+    
+    # Several read requests in one round trip
+    path('batch/', views.batch, name='batch'),
 ]
 
@@ -1,10 +1,11 @@
 import uuid
 import json
+import logging
 from django.utils import timezone
 from django.contrib.auth import authenticate, get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes, renderer_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
 from rest_framework.response import Response
@@ -12,9 +13,13 @@ from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework import status
 
 User = get_user_model()
+log = logging.getLogger(__name__)
 
 # Import chat models and functions
 from myApp.models import ChatSession
+from myApp.conditional import chat_sessions_version, etag, preferences_version, static_etag, user_version
+from .authentication import CachedTokenAuthentication, get_profile
+from .renderers import MOBILE_PARSERS, MOBILE_RENDERERS, MessagePackParser
 
 # ---- Helpers ----
 def user_payload(user):
@@ -55,9 +60,11 @@ def _pascal_to_snake_case(tone: str) -> str:
         result.append(char.lower())
     return ''.join(result)
 
-def format_session_for_ios(session):
-    """Convert ChatSession to iOS expected format"""
-    messages = session.messages or []
+def format_session_for_ios(session, messages=None):
+    """Convert ChatSession to iOS expected format (messages defaults to the whole history)"""
+    session.assign_message_ids()  # stable ids, same on every call
+    if messages is None:
+        messages = session.messages or []
     formatted_messages = []
     
     for msg in messages:
@@ -84,9 +91,25 @@ def format_session_for_ios(session):
         "messages": formatted_messages  # ✅ Always includes messages array
     }
 
+def chat_message_payload(result, session_id=None):
+    """
+    iOS ChatMessage for a ChatService result. Errors (free chat limit, too
+    many files, timeouts) arrive as the assistant's reply, as iOS expects.
+    """
+    stored = result.message or {}
+    return {
+        "id": stored.get("id") or f"msg_{uuid.uuid4().hex[:12]}",
+        "role": "assistant",
+        "content": result.reply or "I apologize, but I'm having trouble processing your request right now. Please try again.",
+        "timestamp": stored.get("ts") or timezone.now().isoformat(),
+        "session_id": result.session_id if result.session_id is not None else session_id,
+        "metadata": None
+    }
+
 # ---- Public endpoints ----
 @csrf_exempt
 @api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
 @permission_classes([AllowAny])
 def health(request):
     """Health check endpoint"""
@@ -94,6 +117,8 @@ def health(request):
 
 @csrf_exempt
 @api_view(['POST'])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
 @permission_classes([AllowAny])
 def signup(request):
     """User registration endpoint - iOS compatible"""
@@ -161,6 +186,8 @@ def signup(request):
 
 @csrf_exempt
 @api_view(['POST'])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
 @permission_classes([AllowAny])
 def login(request):
     """User login endpoint - Returns token in iOS-expected format"""
@@ -189,7 +216,8 @@ def login(request):
 # ---- Authenticated endpoints ----
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def auth_status(request):
     """Check authentication status"""
@@ -197,15 +225,19 @@ def auth_status(request):
 
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@etag(user_version)
 def user_settings(request):
     """Get user settings"""
     return Response(user_payload(request.user))
     
 @csrf_exempt
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def user_settings_update(request):
     """Update user settings"""
@@ -225,8 +257,7 @@ def user_settings_update(request):
         request.user.email = email
         changed = True
     if language is not None:
-        from myApp.models import Profile
-        profile, _ = Profile.objects.get_or_create(user=request.user)
+        profile = get_profile(request.user)
         profile.language = language
         profile.save()
     
@@ -237,12 +268,13 @@ def user_settings_update(request):
 
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@etag(preferences_version)
 def user_preferences(request):
     """Get user preferences"""
-    from myApp.models import Profile
-    profile, _ = Profile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
     return Response({
         "defaultTone": "plain_clinical",  # Default tone
@@ -256,12 +288,13 @@ def user_preferences(request):
 
 @csrf_exempt
 @api_view(['PUT', 'POST'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def user_preferences_update(request):
     """Update user preferences"""
-    from myApp.models import Profile
-    profile, _ = Profile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
     default_tone = request.data.get("defaultTone", "plain_clinical")
     language = request.data.get("language", "en-US")
@@ -286,8 +319,10 @@ def user_preferences_update(request):
 # ---- Chat endpoints ----
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@etag(chat_sessions_version)
 def chat_sessions(request):
     """
     Get user's chat sessions with messages.
@@ -320,9 +355,47 @@ def chat_sessions(request):
             "detail": "Failed to load sessions"
         }, status=500)
 
+@csrf_exempt
+@api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def chat_sync(request):
+    """
+    Delta sync of chat history (see sync.py).
+    GET /api/mobile/chat/sync/?since=<cursor>
+    Returns {cursor, full, has_more, sessions, deleted_session_ids, archived_session_ids}; each session
+    carries only messages newer than the cursor unless "replace" is true.
+    """
+    from .sync import SYNC_PAGE_SIZE, sync_page
+    
+    try:
+        limit = min(max(int(request.query_params.get("limit", SYNC_PAGE_SIZE)), 1), SYNC_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = SYNC_PAGE_SIZE
+    page = sync_page(request.user, request.query_params.get("since"), limit)
+    
+    sessions = []
+    for delta in page.sessions:
+        data = format_session_for_ios(delta.session, delta.messages)
+        data["archived"] = delta.session.archived
+        data["replace"] = delta.replace
+        sessions.append(data)
+    
+    return Response({
+        "cursor": page.cursor,
+        "full": page.full,
+        "has_more": page.has_more,
+        "sessions": sessions,
+        "deleted_session_ids": page.deleted_ids,
+        "archived_session_ids": page.archived_ids,
+    }, status=200)
+
 @csrf_exempt
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def create_chat_session(request):
     """
@@ -369,327 +442,82 @@ def create_chat_session(request):
         "language": session.lang  # iOS spec uses "language" not "lang"
     }, status=201)
 
+def upload_error(exc):
+    return Response({"error": str(exc), **exc.details}, status=exc.status)
+
 @csrf_exempt
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication, SessionAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
-@parser_classes([JSONParser, MultiPartParser, FormParser])
+@parser_classes([JSONParser, MultiPartParser, FormParser, MessagePackParser])
 def send_chat(request):
     """
     Send a chat message.
     MUST accept both:
     1. application/json (text-only messages)
     2. multipart/form-data (messages with files)
+    Files uploaded beforehand with the resumable protocol (uploads/) are sent
+    as upload_ids instead.
     
     Returns message object in iOS-expected format.
     """
+    from myApp.chat_service import ChatService, uploaded_files
+    from myApp.uploads import UploadError, open_uploads, upload_ids
+    
+    message = (request.data.get('message') or '').strip()
+    tone = request.data.get('tone', 'plain_clinical') or ''
+    lang = request.data.get('lang', 'en-US')
+    files = uploaded_files(request.FILES)
+    ids = upload_ids(request.data)  # finalized resumable uploads (api/mobile/uploads/)
+    # Image-only upload: use placeholder message if empty (AI needs context)
+    if (files or ids) and not message:
+        message = "Please analyze this image."
+    if not message:
+        return Response({
+            "error": "Either 'message', 'files[]' or 'upload_ids' must be provided",
+            "detail": "Message or files required"
+        }, status=400)
+    
+    # Session ID is an integer in JSON, a string in multipart
     try:
-        # Check Content-Type and parse accordingly
-        content_type = request.META.get('CONTENT_TYPE', '')
-        
-        if 'application/json' in content_type:
-            # Format 1: JSON (text-only)
-            try:
-                if hasattr(request, 'body') and request.body:
-                    data = json.loads(request.body)
-                else:
-                    data = request.data
-                
-                message = data.get('message', '').strip()
-                tone = data.get('tone', 'plain_clinical')
-                lang = data.get('lang', 'en-US')
-                # Session ID in JSON is integer
-                session_id = data.get('session_id')
-                if session_id is not None:
-                    try:
-                        session_id = int(session_id)
-                    except (ValueError, TypeError):
-                        session_id = None
-                care_setting = data.get('care_setting')
-                faith_setting = data.get('faith_setting')
-                files = []  # No files in JSON format
-            except (json.JSONDecodeError, AttributeError):
-                return Response({
-                    "error": "Invalid JSON",
-                    "detail": "Could not parse JSON body"
-                }, status=400)
-        elif 'multipart/form-data' in content_type or 'application/x-www-form-urlencoded' in content_type:
-            # Format 2: Multipart (with or without files)
-            message = request.data.get('message', '').strip()
-            tone = request.data.get('tone', 'plain_clinical')
-            lang = request.data.get('lang', 'en-US')
-            # Session ID in multipart is string - convert to int
-            session_id = request.data.get('session_id')
-            if session_id:
-                try:
-                    session_id = int(session_id)
-                except (ValueError, TypeError):
-                    session_id = None
-            care_setting = request.data.get('care_setting')
-            faith_setting = request.data.get('faith_setting')
-            # Image upload: try files[] first (iOS), then file (single)
-            files = []
-            if hasattr(request, 'FILES') and request.FILES:
-                files = list(request.FILES.getlist('files[]') or request.FILES.getlist('file') or [])
-                if not files and 'file' in request.FILES:
-                    files = [request.FILES['file']]
-            # Image-only upload: use placeholder message if empty (AI needs context)
-            if files and not message:
-                message = "Please analyze this image."
-        else:
-            # Try to parse as JSON if content type is missing
-            try:
-                if hasattr(request, 'body') and request.body:
-                    data = json.loads(request.body)
-                    message = data.get('message', '').strip()
-                    tone = data.get('tone', 'plain_clinical')
-                    lang = data.get('lang', 'en-US')
-                    session_id = data.get('session_id')
-                    care_setting = data.get('care_setting')
-                    faith_setting = data.get('faith_setting')
-                    files = []
-                else:
-                    return Response({
-                        "detail": f"Unsupported media type \"{content_type}\" in request."
-                    }, status=415)
-            except (json.JSONDecodeError, AttributeError):
-                return Response({
-                    "detail": f"Unsupported media type \"{content_type}\" in request."
-                }, status=415)
-        
-        # Validate required fields
-        if not message and not files:
-            return Response({
-                "error": "Either 'message' or 'files[]' must be provided",
-                "detail": "Message or files required"
-            }, status=400)
-        
-        # Debug: log what we received (for image upload diagnosis)
-        print("=" * 50)
-        print("MOBILE_API send_chat: REQUEST RECEIVED")
-        print(f"  CONTENT_TYPE: {request.META.get('CONTENT_TYPE', '')}")
-        print(f"  Message: '{message[:80]}...' (len={len(message)})" if len(message) > 80 else f"  Message: '{message}' (len={len(message)})")
-        print(f"  Files count: {len(files)}")
-        if files:
-            for i, f in enumerate(files):
-                name = getattr(f, 'name', '?')
-                size = getattr(f, 'size', 0)
-                ctype = getattr(f, 'content_type', '?')
-                print(f"    File {i+1}: name={name!r}, size={size} bytes, type={ctype}")
-        else:
-            # Log why we might have no files (for diagnosis)
-            has_files = hasattr(request, 'FILES') and request.FILES
-            print(f"  request.FILES exists: {has_files}")
-            if has_files:
-                print(f"  request.FILES keys: {list(request.FILES.keys())}")
-                print(f"  getlist('files[]'): {list(request.FILES.getlist('files[]') or [])}")
-        print("=" * 50)
-        
-        # Normalize tone format
-        tone_map = {
-            "PlainClinical": "plain_clinical",
-            "Clinical": "clinical",
-            "Caregiver": "caregiver",
-            "Faith": "faith"
-        }
-        normalized_tone = tone_map.get(tone, tone.lower().replace(" ", "_"))
-        
-        # Create a NEW HttpRequest object from scratch instead of modifying the existing one
-        # This avoids all the read-only attribute issues
-        from django.http import HttpRequest, QueryDict
-        from myApp.views import send_chat as real_send_chat
-        
-        # Get the underlying Django HttpRequest to access session
-        django_request = request._request if hasattr(request, '_request') else request
-        
-        # Create a fresh HttpRequest with all necessary attributes
-        new_request = HttpRequest()
-        new_request.method = 'POST'
-        new_request.user = request.user
-        new_request.session = django_request.session  # Use session from underlying request
-        new_request.META = django_request.META.copy() if hasattr(django_request, 'META') else {}
-        
-        # CRITICAL: Set content type to application/x-www-form-urlencoded
-        # real_send_chat accepts both MultiPartParser and FormParser
-        # Since we're setting POST directly (not a multipart body), use form-urlencoded
-        # This allows FormParser to work without requiring multipart boundaries
-        new_request.META['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
-        new_request.META['HTTP_CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
-        
-        # Set attributes that DRF expects
-        # CRITICAL: DRF's FormParser reads from the body stream, not POST
-        # So we need to encode our data as form-urlencoded in the body
-        new_request._read_started = False
-        new_request._stream = None
-        if not hasattr(new_request, '_encoding'):
-            new_request._encoding = 'utf-8'
-        
-        # Create QueryDict with our data
-        chat_data = QueryDict(mutable=True)
-        chat_data['message'] = message
-        chat_data['tone'] = normalized_tone
-        chat_data['lang'] = lang
-        if session_id:
-            chat_data['session_id'] = str(session_id)
-        if care_setting:
-            chat_data['care_setting'] = care_setting
-        if faith_setting:
-            chat_data['faith_setting'] = faith_setting
-        chat_data._mutable = False
-        
-        # CRITICAL: DRF's FormParser reads from stream, not _body
-        # We need to encode the form data and create a BytesIO stream for FormParser
-        from urllib.parse import urlencode
-        import io
-        form_data = urlencode(chat_data, doseq=True)
-        body_bytes = form_data.encode('utf-8')
-        
-        # Create a BytesIO stream for DRF's FormParser to read from
-        body_stream = io.BytesIO(body_bytes)
-        
-        # Set both _body and _stream so DRF can read it
-        new_request._body = body_bytes
-        new_request._stream = body_stream
-        new_request.META['CONTENT_LENGTH'] = str(len(body_bytes))
-        
-        # Reset stream position to beginning
-        body_stream.seek(0)
-        
-        # Also set POST for compatibility
-        new_request.POST = chat_data
-        new_request._post = chat_data
-        
-        # Debug: verify everything is set
-        print(f"DEBUG: Setting message in body: '{message}' (length: {len(message)})")
-        print(f"DEBUG: Body length: {len(body_bytes)} bytes")
-        print(f"DEBUG: Body preview: {body_bytes[:100]}")
-        print(f"DEBUG: new_request.POST.get('message'): '{new_request.POST.get('message', 'NOT FOUND')}'")
-        
-        # Handle FILES - only if we have files
-        if files:
-            # Create a mock FILES object that myApp.send_chat expects
-            class MockFiles:
-                def __init__(self, file_list):
-                    self._files = file_list
-                
-                def getlist(self, key):
-                    if key in ('files[]', 'file'):
-                        return self._files
-                    return []
-                
-                def __contains__(self, key):
-                    return key in ('files[]', 'file') and bool(self._files)
-                
-                def get(self, key, default=None):
-                    return self._files[0] if self._files and key in ('files[]', 'file') else default
-            
-            new_request.FILES = MockFiles(files)
-            print(f"MOBILE_API: Passing {len(files)} file(s) to real_send_chat")
-        else:
-            # Empty dict for FILES when no files
-            new_request.FILES = {}
-        
-        # Debug: Check what DRF sees before calling real_send_chat
-        # Wrap the request in DRF Request to see what it parses
-        from rest_framework.request import Request
-        from rest_framework.parsers import FormParser
-        drf_request = Request(new_request, parsers=[FormParser()])
-        print(f"DEBUG: DRF request.data before calling real_send_chat: {dict(drf_request.data)}")
-        print(f"DEBUG: DRF request.data.get('message'): '{drf_request.data.get('message', 'NOT FOUND')}'")
-        
-        # Call the real send_chat function with the new request
-        try:
-            response = real_send_chat(new_request)
-            
-            # Parse the response - handle both JsonResponse and DRF Response
-            response_data = {}
-            if hasattr(response, 'render'):
-                # It's a TemplateResponse - render it first
-                response.render()
-                import json as json_lib
-                try:
-                    response_data = json_lib.loads(response.content)
-                except (json_lib.JSONDecodeError, AttributeError):
-                    pass
-            elif hasattr(response, 'content'):
-                # It's a JsonResponse - content is bytes, need to decode
-                import json as json_lib
-                try:
-                    content = response.content
-                    if isinstance(content, bytes):
-                        content = content.decode('utf-8')
-                    response_data = json_lib.loads(content)
-                except (json_lib.JSONDecodeError, AttributeError, TypeError) as e:
-                    print(f"DEBUG: Failed to parse JsonResponse: {e}")
-                    print(f"DEBUG: Content type: {type(response.content)}, Content: {response.content[:200] if hasattr(response.content, '__getitem__') else response.content}")
-                    response_data = {}
-            elif hasattr(response, 'data'):
-                # It's a DRF Response object
-                response_data = response.data if hasattr(response, 'data') else {}
-            
-            # Debug: print response structure to console
-            print(f"DEBUG: Response type: {type(response)}")
-            print(f"DEBUG: Response data: {response_data}")
-            print(f"DEBUG: Response data keys: {list(response_data.keys()) if isinstance(response_data, dict) else 'not a dict'}")
-            
-            # Extract the reply from the response
-            # The real send_chat returns {"reply": "...", "session_id": ...}
-            reply_text = response_data.get('reply', '')
-            print(f"DEBUG: Extracted reply_text: {reply_text[:100] if reply_text else 'EMPTY'}")
-            
-            if not reply_text:
-                # Try alternative field names
-                reply_text = response_data.get('content', '') or response_data.get('summary', '') or response_data.get('message', '')
-                print(f"DEBUG: After fallback, reply_text: {reply_text[:100] if reply_text else 'STILL EMPTY'}")
-            
-            if not reply_text:
-                # If still no reply, this is an error - log it
-                print(f"ERROR: No reply found in response. Response data: {response_data}")
-                reply_text = "I apologize, but I'm having trouble processing your request right now. Please try again."
-            
-            # Get session_id from response or use the one we sent
-            session_id_from_response = response_data.get('session_id')
-            final_session_id = None
-            if session_id_from_response is not None:
-                try:
-                    final_session_id = int(session_id_from_response)
-                except (ValueError, TypeError):
-                    pass
-            elif session_id is not None:
-                try:
-                    final_session_id = int(session_id)
-                except (ValueError, TypeError):
-                    pass
-            
-            # Return in iOS-expected format (exactly as specified)
-            now = timezone.now()
-            timestamp = now.isoformat()
-            return Response({
-                "id": f"msg_{uuid.uuid4().hex[:12]}",
-                "role": "assistant",
-                "content": reply_text,
-                "timestamp": timestamp,
-                "session_id": final_session_id,
-                "metadata": None
-            }, status=200)
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return Response({
-                "error": str(e),
-                "detail": "Failed to process chat message"
-            }, status=500)
+        session_id = int(request.data.get('session_id'))
+    except (ValueError, TypeError):
+        session_id = None
+    
+    # Normalize tone format
+    tone_map = {
+        "PlainClinical": "plain_clinical",
+        "Clinical": "clinical",
+        "Caregiver": "caregiver",
+        "Faith": "faith"
+    }
+    normalized_tone = tone_map.get(tone, tone.lower().replace(" ", "_"))
+    
+    try:
+        with open_uploads(request.user, ids) as stored_files:
+            result = ChatService(request.session).send(
+                request.user, session_id, message, files + stored_files,
+                tone=normalized_tone,
+                lang=lang,
+                care_setting=request.data.get('care_setting'),
+                faith_setting=request.data.get('faith_setting'),
+            )
+    except UploadError as e:
+        return upload_error(e)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("mobile send_chat failed")
         return Response({
             "error": str(e),
             "detail": "Failed to process chat message"
         }, status=500)
+    return Response(chat_message_payload(result, session_id), status=200)
 
 @csrf_exempt
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def summarize(request):
     """
@@ -699,132 +527,156 @@ def summarize(request):
     summary = text[:200] + ("…" if len(text) > 200 else "")
     return Response({"summary": summary}, status=200)
 
+# ---- Resumable Uploads ----
+@csrf_exempt
+@api_view(['POST'])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_start(request):
+    """
+    Start a resumable upload (see myApp/uploads.py).
+    POST /api/mobile/uploads/ {filename, size}
+    Returns {upload_id, offset, chunk_size, ...}; the bytes then go to uploads/<id>/.
+    """
+    from myApp.uploads import UploadError, start_upload, upload_payload
+    
+    try:
+        upload = start_upload(request.user, request.data.get("filename"), request.data.get("size"))
+    except UploadError as e:
+        return upload_error(e)
+    return Response(upload_payload(upload), status=201)
+
+@csrf_exempt
+@api_view(['GET', 'PUT'])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id):
+    """
+    GET /api/mobile/uploads/<id>/ - where to resume: {offset, status, ...}
+    PUT /api/mobile/uploads/<id>/?offset=N - one chunk as the raw body
+    (application/octet-stream), written straight to disk; returns the new offset.
+    A 409 carries the server's offset to continue from.
+    """
+    from myApp.uploads import UploadError, get_upload, upload_payload, write_chunk
+    
+    try:
+        upload = get_upload(request.user, upload_id)
+        if request.method == 'PUT':
+            # Read the body as a stream (never request.data), so it is not buffered
+            write_chunk(
+                upload, request.query_params.get("offset"),
+                request.stream, request.META.get("CONTENT_LENGTH"),
+            )
+    except UploadError as e:
+        return upload_error(e)
+    return Response(upload_payload(upload), status=200)
+
+@csrf_exempt
+@api_view(['POST'])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def upload_finalize(request, upload_id):
+    """
+    Finish a resumable upload.
+    POST /api/mobile/uploads/<id>/finalize/ {sha256}
+    The digest is checked against the received bytes (422 on mismatch: upload
+    again). The returned upload_id can then be sent to send-chat as upload_ids.
+    """
+    from myApp.uploads import UploadError, finalize_upload, get_upload, upload_payload
+    
+    try:
+        upload = finalize_upload(get_upload(request.user, upload_id), request.data.get("sha256"))
+    except UploadError as e:
+        return upload_error(e)
+    return Response(upload_payload(upload), status=200)
+
 # ---- Tone Management ----
+# Static catalogs: built once at import, served with a constant ETag
+TONE_CATALOG = [
+    {
+        "id": "plain_clinical",
+        "displayName": "Plain Clinical",
+        "description": "Clear & simple explanation.",
+        "iconName": "heart.text.square.fill",
+        "isAvailable": True,
+        "order": 1
+    },
+    {
+        "id": "caregiver",
+        "displayName": "Caregiver",
+        "description": "With care and understanding.",
+        "iconName": "person.2.fill",
+        "isAvailable": True,
+        "order": 2
+    },
+    {
+        "id": "faith",
+        "displayName": "Faith",
+        "description": "With comfort and hope.",
+        "iconName": "cross.fill",
+        "isAvailable": True,
+        "order": 3
+    },
+    {
+        "id": "clinical",
+        "displayName": "Clinical",
+        "description": "Structured SOAP notes for healthcare professionals.",
+        "iconName": "stethoscope",
+        "isAvailable": True,
+        "order": 4
+    },
+    {
+        "id": "geriatric",
+        "displayName": "Geriatric",
+        "description": "Elderly care focused.",
+        "iconName": "person.crop.circle.fill",
+        "isAvailable": True,
+        "order": 5
+    },
+    {
+        "id": "emotional_support",
+        "displayName": "Emotional Support",
+        "description": "Emotional support mode.",
+        "iconName": "heart.fill",
+        "isAvailable": True,
+        "order": 6
+    }
+]
+TONES_PAYLOAD = {"tones": TONE_CATALOG, "defaultTone": "plain_clinical"}
+TONES_BY_ID = {tone["id"]: tone for tone in TONE_CATALOG}
+TONES_VERSION = static_etag(TONES_PAYLOAD)
+
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@etag(lambda request: TONES_VERSION)
 def tones(request):
     """
     Get available AI tones.
     GET /api/tones/
     Returns list of available tones with descriptions.
     """
-    return Response({
-        "tones": [
-            {
-                "id": "plain_clinical",
-                "displayName": "Plain Clinical",
-                "description": "Clear & simple explanation.",
-                "iconName": "heart.text.square.fill",
-                "isAvailable": True,
-                "order": 1
-            },
-            {
-                "id": "caregiver",
-                "displayName": "Caregiver",
-                "description": "With care and understanding.",
-                "iconName": "person.2.fill",
-                "isAvailable": True,
-                "order": 2
-            },
-            {
-                "id": "faith",
-                "displayName": "Faith",
-                "description": "With comfort and hope.",
-                "iconName": "cross.fill",
-                "isAvailable": True,
-                "order": 3
-            },
-            {
-                "id": "clinical",
-                "displayName": "Clinical",
-                "description": "Structured SOAP notes for healthcare professionals.",
-                "iconName": "stethoscope",
-                "isAvailable": True,
-                "order": 4
-            },
-            {
-                "id": "geriatric",
-                "displayName": "Geriatric",
-                "description": "Elderly care focused.",
-                "iconName": "person.crop.circle.fill",
-                "isAvailable": True,
-                "order": 5
-            },
-            {
-                "id": "emotional_support",
-                "displayName": "Emotional Support",
-                "description": "Emotional support mode.",
-                "iconName": "heart.fill",
-                "isAvailable": True,
-                "order": 6
-            }
-        ],
-        "defaultTone": "plain_clinical"
-    }, status=200)
+    return Response(TONES_PAYLOAD, status=200)
 
 @csrf_exempt
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@etag(lambda request, tone_id: [TONES_VERSION, tone_id] if tone_id in TONES_BY_ID else None)
 def tone_detail(request, tone_id):
     """
     Get tone detail.
     GET /api/tones/{tone_id}/
     """
-    tones_data = {
-        "plain_clinical": {
-            "id": "plain_clinical",
-            "displayName": "Plain Clinical",
-            "description": "Clear & simple explanation.",
-            "iconName": "heart.text.square.fill",
-            "isAvailable": True,
-            "order": 1
-        },
-        "caregiver": {
-            "id": "caregiver",
-            "displayName": "Caregiver",
-            "description": "With care and understanding.",
-            "iconName": "person.2.fill",
-            "isAvailable": True,
-            "order": 2
-        },
-        "faith": {
-            "id": "faith",
-            "displayName": "Faith",
-            "description": "With comfort and hope.",
-            "iconName": "cross.fill",
-            "isAvailable": True,
-            "order": 3
-        },
-        "clinical": {
-            "id": "clinical",
-            "displayName": "Clinical",
-            "description": "Structured SOAP notes for healthcare professionals.",
-            "iconName": "stethoscope",
-            "isAvailable": True,
-            "order": 4
-        },
-        "geriatric": {
-            "id": "geriatric",
-            "displayName": "Geriatric",
-            "description": "Elderly care focused.",
-            "iconName": "person.crop.circle.fill",
-            "isAvailable": True,
-            "order": 5
-        },
-        "emotional_support": {
-            "id": "emotional_support",
-            "displayName": "Emotional Support",
-            "description": "Emotional support mode.",
-            "iconName": "heart.fill",
-            "isAvailable": True,
-            "order": 6
-        }
-    }
-    
-    tone_data = tones_data.get(tone_id)
+    tone_data = TONES_BY_ID.get(tone_id)
     if not tone_data:
         return Response({
             "error": "Tone not found",
@@ -834,68 +686,78 @@ def tone_detail(request, tone_id):
     return Response(tone_data, status=200)
 
 # ---- App Configuration ----
+APP_CONFIG = {
+    "features": {
+        "voiceMode": True,
+        "imageUpload": True,
+        "exportData": True,
+        "darkMode": True
+    },
+    "ui": {
+        "minimumAppVersion": "1.0.0",
+        "forceUpdate": False,
+        "maintenanceMode": False
+    },
+    "languages": [
+        {
+            "code": "en-US",
+            "displayName": "English",
+            "isAvailable": True
+        },
+        {
+            "code": "es-ES",
+            "displayName": "Spanish",
+            "isAvailable": True
+        },
+        {
+            "code": "fr-FR",
+            "displayName": "French",
+            "isAvailable": True
+        },
+        {
+            "code": "de-DE",
+            "displayName": "German",
+            "isAvailable": True
+        }
+    ]
+}
+APP_CONFIG_VERSION = static_etag(APP_CONFIG)
+
 @csrf_exempt
 @api_view(['GET'])
+@renderer_classes(MOBILE_RENDERERS)
 @permission_classes([AllowAny])
+@etag(lambda request: [APP_CONFIG_VERSION, request.build_absolute_uri('/')])
 def config(request):
     """
     Get API configuration (public endpoint).
     GET /api/config/
     Returns basic configuration info the app might need.
     """
-    from django.conf import settings
-    base_url = request.build_absolute_uri('/api/').rstrip('/')
+    site_url = request.build_absolute_uri('/')
     
     return Response({
         "api": {
-            "baseUrl": base_url,
+            "baseUrl": request.build_absolute_uri('/api/').rstrip('/'),
             "version": "v1",
             "timeout": 30
         },
-        "features": {
-            "voiceMode": True,
-            "imageUpload": True,
-            "exportData": True,
-            "darkMode": True
-        },
+        "features": APP_CONFIG["features"],
         "legal": {
-            "privacyPolicyUrl": f"{request.build_absolute_uri('/')}legal/#privacy",
-            "termsOfServiceUrl": f"{request.build_absolute_uri('/')}legal/#terms",
+            "privacyPolicyUrl": f"{site_url}legal/#privacy",
+            "termsOfServiceUrl": f"{site_url}legal/#terms",
             "supportEmail": "support@neuromedai.org"
         },
-        "ui": {
-            "minimumAppVersion": "1.0.0",
-            "forceUpdate": False,
-            "maintenanceMode": False
-        },
-        "languages": [
-            {
-                "code": "en-US",
-                "displayName": "English",
-                "isAvailable": True
-            },
-            {
-                "code": "es-ES",
-                "displayName": "Spanish",
-                "isAvailable": True
-            },
-            {
-                "code": "fr-FR",
-                "displayName": "French",
-                "isAvailable": True
-            },
-            {
-                "code": "de-DE",
-                "displayName": "German",
-                "isAvailable": True
-            }
-        ]
+        "ui": APP_CONFIG["ui"],
+        "languages": APP_CONFIG["languages"]
     }, status=200)
 
 # ---- Clear Chat Session ----
 @csrf_exempt
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def clear_session(request):
     """
@@ -920,3 +782,26 @@ def clear_session(request):
     request.session.modified = True
     
     return Response({"ok": True}, status=200)
+
+# ---- Batch ----
+@csrf_exempt
+@api_view(['POST'])
+@renderer_classes(MOBILE_RENDERERS)
+@parser_classes(MOBILE_PARSERS)
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    """
+    Several read requests in one round trip (see batch.py).
+    POST /api/mobile/batch/ {"requests": [{"id", "path", "headers"?}, ...]}
+    Returns {"responses": [{"id", "status", "headers", "body"}, ...]} in request order.
+    """
+    from .batch import BATCH_MAX_REQUESTS, run_batch
+    
+    items = request.data.get("requests") if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response({"error": "requests must be a non-empty list"}, status=400)
+    if len(items) > BATCH_MAX_REQUESTS:
+        return Response({"error": f"At most {BATCH_MAX_REQUESTS} requests per batch"}, status=400)
+    
+    return Response({"responses": run_batch(request, items)}, status=200)
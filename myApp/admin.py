@@ -5,7 +5,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.db.models import Exists, OuterRef
 from django.contrib import messages
 
-from .models import Profile, BetaFeedback, Subscription, Payment
+from .models import Profile, BetaFeedback, Subscription, Payment, AnalysisJob, AnalysisRun, AnalysisRunFile
 
 User = get_user_model()
 
@@ -121,3 +121,25 @@ class PaymentAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email', 'paypal_order_id', 'paypal_transaction_id')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'status', 'progress_done', 'progress_total', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('user__username', 'user__email', 'idempotency_key')
+    readonly_fields = ('created_at', 'started_at', 'heartbeat_at', 'finished_at')
+    ordering = ('-created_at',)
+
+class AnalysisRunFileInline(admin.TabularInline):
+    model = AnalysisRunFile
+    extra = 0
+    readonly_fields = ('position', 'filename', 'sha256', 'size')
+
+@admin.register(AnalysisRun)
+class AnalysisRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'file_count', 'tone', 'lang', 'created_at')
+    list_filter = ('tone', 'created_at')
+    search_fields = ('user__username', 'user__email', 'files__filename')
+    readonly_fields = ('created_at',)
+    inlines = [AnalysisRunFileInline]
+    ordering = ('-created_at',)
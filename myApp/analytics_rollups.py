@@ -0,0 +1,155 @@
+"""
+Daily analytics rollups (AnalyticsDailyRollup) for exports.
+
+`python manage.py rollup_analytics` aggregates each finished day once; the
+export reads one row per day instead of recomputing the whole dashboard
+(get_analytics_data) on every download. Only the last
+ANALYTICS_EXPORT_LIVE_DAYS (today, and yesterday before the nightly run) are
+aggregated on demand when their rollup is missing or partial; older days
+without a rollup are left to rollup_analytics and listed as missing_days, so a
+long custom range never aggregates raw rows inside the request.
+
+Figures that are not additive across days are approximations over a range:
+top pages are merged from each day's top list (ROLLUP_TOP_PAGES per day).
+Distinct active users for a range are counted live (one indexed query).
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .analytics_utils import categorize_referer
+from .models import AnalyticsDailyRollup, PageView, Session, UserSignin, UserSignup, Visitor
+
+ROLLUP_TOP_PAGES = 15
+ANALYTICS_EXPORT_LIVE_DAYS = getattr(settings, "ANALYTICS_EXPORT_LIVE_DAYS", 2)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def compute_day(day) -> dict:
+    """Aggregate one day of raw analytics rows into rollup field values."""
+    start, end = _day_bounds(day)
+    visitors = Visitor.objects.filter(created_at__gte=start, created_at__lt=end)
+    page_views = PageView.objects.filter(created_at__gte=start, created_at__lt=end)
+    signins = UserSignin.objects.filter(created_at__gte=start, created_at__lt=end)
+    sessions = Session.objects.filter(started_at__gte=start, started_at__lt=end)
+
+    sources = Counter()
+    for row in visitors.exclude(referer="").values("referer").annotate(n=Count("id")).iterator():
+        sources[categorize_referer(row["referer"])] += row["n"]
+
+    signin_counts = {row["success"]: row["n"] for row in signins.values("success").annotate(n=Count("id"))}
+    session_counts = {row["is_bounce"]: row["n"] for row in sessions.values("is_bounce").annotate(n=Count("id"))}
+    visitor_counts = {row["is_unique"]: row["n"] for row in visitors.values("is_unique").annotate(n=Count("id"))}
+
+    return {
+        "unique_visitors": visitor_counts.get(True, 0),
+        "visitors": sum(visitor_counts.values()),
+        "page_views": page_views.count(),
+        "signups": UserSignup.objects.filter(created_at__gte=start, created_at__lt=end).count(),
+        "signins": signin_counts.get(True, 0),
+        "failed_signins": signin_counts.get(False, 0),
+        "active_users": signins.filter(success=True).values("user").distinct().count(),
+        "sessions": sum(session_counts.values()),
+        "bounces": session_counts.get(True, 0),
+        "top_pages": list(
+            page_views.values("path").annotate(views=Count("id")).order_by("-views")[:ROLLUP_TOP_PAGES]
+        ),
+        "traffic_sources": dict(sources.most_common()),
+    }
+
+
+def rollup_day(day) -> AnalyticsDailyRollup:
+    rollup, _ = AnalyticsDailyRollup.objects.update_or_create(date=day, defaults=compute_day(day))
+    return rollup
+
+
+def is_final(rollup) -> bool:
+    """True once the rollup was computed after its day ended (later rows can't change it)."""
+    return rollup.computed_at >= _day_bounds(rollup.date)[1]
+
+
+def get_rollups(start_date, end_date):
+    """
+    (rollups, missing days) for [start_date, end_date], oldest first. Missing or
+    partial days within the last ANALYTICS_EXPORT_LIVE_DAYS are (re)computed;
+    older days are only read.
+    """
+    stored = {
+        r.date: r
+        for r in AnalyticsDailyRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+    }
+    live_from = timezone.localdate() - timedelta(days=max(ANALYTICS_EXPORT_LIVE_DAYS, 1) - 1)
+    rollups, missing = [], []
+    day = start_date
+    while day <= end_date:
+        rollup = stored.get(day)
+        if day >= live_from and (rollup is None or not is_final(rollup)):
+            rollup = rollup_day(day)
+        if rollup is None:
+            missing.append(day)
+        else:
+            rollups.append(rollup)
+        day += timedelta(days=1)
+    return rollups, missing
+
+
+def export_data(start_date, end_date) -> dict:
+    """The figures analytics_export renders (same keys as get_analytics_data), built from rollups."""
+    local_today = timezone.localdate()
+    end_date = min(end_date, local_today)
+    rollups, missing = get_rollups(start_date, end_date)
+    totals = Counter()
+    pages = Counter()
+    for r in rollups:
+        for field in ("unique_visitors", "page_views", "signups", "signins", "sessions", "bounces"):
+            totals[field] += getattr(r, field)
+        for page in r.top_pages:
+            pages[page["path"]] += page["views"]
+
+    start, _ = _day_bounds(start_date)
+    _, end = _day_bounds(end_date)
+    active_users = (
+        UserSignin.objects.filter(created_at__gte=start, created_at__lt=end, success=True)
+        .values("user").distinct().count()
+    )
+    unique_visitors = totals["unique_visitors"]
+    sessions = totals["sessions"]
+    today = rollups[-1] if rollups and rollups[-1].date == local_today else rollup_day(local_today)
+
+    return {
+        "unique_visitors": unique_visitors,
+        "page_views": totals["page_views"],
+        "signups": totals["signups"],
+        "signins": totals["signins"],
+        "active_users": active_users,
+        "conversion_rate": round(totals["signups"] / unique_visitors * 100, 2) if unique_visitors else 0,
+        "bounce_rate": round(totals["bounces"] / sessions * 100, 2) if sessions else 0,
+        "daily_stats": [
+            {
+                "date": r.date.strftime("%Y-%m-%d"),
+                "date_display": r.date.strftime("%b %d"),
+                "visitors": r.unique_visitors,
+                "page_views": r.page_views,
+                "signups": r.signups,
+                "signins": r.signins,
+            }
+            for r in rollups
+        ],
+        "missing_days": [day.strftime("%Y-%m-%d") for day in missing],
+        "popular_pages": [{"path": path, "views": views} for path, views in pages.most_common(ROLLUP_TOP_PAGES)],
+        "today_visitors": today.unique_visitors,
+        "today_pageviews": today.page_views,
+        "today_signups": today.signups,
+        "today_signins": today.signins,
+        "today_top_pages": today.top_pages[:5],
+        "today_traffic_sources": today.traffic_sources,
+        "failed_logins_today": today.failed_signins,
+    }
@@ -0,0 +1,298 @@
+"""
+Local semantic answer cache for general (QUICK / EXPLAIN) questions.
+
+Many short questions are near-duplicates across users ("what is a normal A1C",
+"whats a normal a1c?"). This module keeps recent answers in-process and
+matches new questions against them with hashed TF-IDF vectors, so no network
+embedding call is needed.
+
+Only file-less, history-free turns are ever cached (enforced by the caller,
+ChatService.send). Entries are bucketed by tone + lang + care and faith setting so an
+answer is only reused under the exact same system prompt.
+
+SAFETY:
+- Numbers in the question must match exactly ("is 38.5 a fever" never reuses
+  the answer for "is 37.5 a fever"), also with a unit attached ("38.5C", "500mg").
+- A negated question never reuses the answer to the plain one ("is X normal"
+  vs "is X not normal"), and the other way round.
+- The similarity threshold defaults high; tune with ANSWER_CACHE_SIMILARITY.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+_HASH_BUCKETS = 1 << 20
+_WORD_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+# Numbers may carry a unit ("38.5c", "500mg"), but not sit inside a word ("a1c")
+_NUMBER_RE = re.compile(r"(?<![\w.])\d+(?:[.,]\d+)?(?=[a-z%]*\b)")
+
+# Filler words that carry no meaning for matching ("what is a normal a1c")
+_STOPWORDS = frozenset(
+    "a an the is are was were be of to for in on at and or my me i you it "
+    "this that what whats how do does can could should would please tell about".split()
+)
+
+# Words that flip a question's meaning (apostrophes are already stripped: "dont")
+_NEGATIONS = frozenset(
+    "not no never without dont doesnt didnt isnt arent wasnt cant cannot wont shouldnt "
+    "shouldn couldnt wouldnt".split()
+)
+
+
+# =============================
+# Normalization & Features
+# =============================
+
+def normalize_question(text: str) -> str:
+    """Lowercase, strip accents/punctuation noise and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = text.replace("’", "'").replace("'", "")
+    text = re.sub(r"[^\w\s.,%]", " ", text)
+    text = re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _hash_feature(feature: str) -> int:
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % _HASH_BUCKETS
+
+
+def _features(normalized: str) -> Tuple[Dict[int, float], FrozenSet[int]]:
+    """
+    Hashed term frequencies (content words, word bigrams and char trigrams),
+    plus the word features alone, which are what the inverted index is keyed on.
+    """
+    words = [w for w in _WORD_RE.findall(normalized) if w not in _STOPWORDS]
+    tf: Dict[int, float] = defaultdict(float)
+    word_features = frozenset(_hash_feature("w:" + w) for w in words)
+    for w in words:
+        tf[_hash_feature("w:" + w)] += 1.0
+    for a, b in zip(words, words[1:]):
+        tf[_hash_feature(f"b:{a} {b}")] += 1.0
+    # Char trigrams make the match tolerant to typos and plurals
+    for w in words:
+        padded = f" {w} "
+        for i in range(len(padded) - 2):
+            tf[_hash_feature("c:" + padded[i:i + 3])] += 0.25
+    return dict(tf), word_features
+
+
+def _numbers(normalized: str) -> FrozenSet[str]:
+    return frozenset(n.replace(",", ".") for n in _NUMBER_RE.findall(normalized))
+
+
+def _negated(normalized: str) -> bool:
+    return any(w in _NEGATIONS for w in _WORD_RE.findall(normalized))
+
+
+# =============================
+# Cache
+# =============================
+
+class _Entry:
+    __slots__ = ("key", "bucket", "features", "words", "vector", "numbers", "negated",
+                 "answer", "expires_at", "hits")
+
+    def __init__(self, key, bucket, features, words, vector, numbers, negated, answer, expires_at):
+        self.key = key
+        self.bucket = bucket
+        self.features = features    # feature -> tf (for document frequencies)
+        self.words = words          # word features, the postings this entry is listed under
+        self.vector = vector        # feature -> unit-length TF-IDF weight, fixed when stored
+        self.numbers = numbers
+        self.negated = negated
+        self.answer = answer
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class AnswerCache:
+    """
+    In-process LRU of answers with a hashed TF-IDF similarity index.
+
+    IDF weights come from document frequencies over the cached questions, so the
+    index adapts to whatever people are actually asking. An entry's weight vector
+    is computed once when it is stored. Lookups only score entries that share a
+    content word with the query (inverted index), and do so outside the lock.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: int = 6 * 3600,
+                 similarity: float = 0.8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._postings: Dict[Tuple[str, int], set] = defaultdict(set)
+        self._df: Dict[int, int] = defaultdict(int)
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0,
+                       "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _bucket(tone: str, lang: str, setting: Optional[str]) -> str:
+        return f"{tone}|{lang}|{setting or ''}"
+
+    @staticmethod
+    def _key(bucket: str, normalized: str) -> str:
+        return hashlib.sha1(f"{bucket}|{normalized}".encode("utf-8")).hexdigest()
+
+    # --- internal (lock held) ---
+    def _remove(self, entry: _Entry):
+        if self._entries.get(entry.key) is not entry:
+            return  # already removed (or replaced) while a lookup scored without the lock
+        del self._entries[entry.key]
+        for f in entry.words:
+            posting = self._postings.get((entry.bucket, f))
+            if posting is not None:
+                posting.discard(entry.key)
+                if not posting:
+                    del self._postings[(entry.bucket, f)]
+        for f in entry.features:
+            self._df[f] -= 1
+            if self._df[f] <= 0:
+                del self._df[f]
+
+    def _idf(self, feature: int) -> float:
+        n = len(self._entries) + 1
+        return math.log((n + 1) / (self._df.get(feature, 0) + 1)) + 1.0
+
+    def _vector(self, features: Dict[int, float]) -> Dict[int, float]:
+        weights = {f: tf * self._idf(f) for f, tf in features.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {f: w / norm for f, w in weights.items()}
+
+    # --- public API ---
+    def get(self, question: str, tone: str, lang: str, setting: Optional[str] = None) -> Optional[str]:
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        bucket = self._bucket(tone, lang, setting)
+        key = self._key(bucket, normalized)
+        now = time.monotonic()
+
+        features, words = _features(normalized)
+        numbers, negated = _numbers(normalized), _negated(normalized)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    self._stats["exact_hits"] += 1
+                    return entry.answer
+                self._remove(entry)
+                self._stats["expired"] += 1
+
+            if not features:
+                self._stats["misses"] += 1
+                return None
+            candidates = set()
+            for f in words:
+                candidates |= self._postings.get((bucket, f), set())
+            candidates = [self._entries[k] for k in candidates if k in self._entries]
+            query = self._vector(features)
+
+        # Score without the lock: stored vectors are never mutated, only replaced
+        best, best_score, expired = None, 0.0, []
+        for cand in candidates:
+            if cand.expires_at <= now:
+                expired.append(cand)
+                continue
+            if cand.numbers != numbers or cand.negated != negated:
+                continue
+            score = sum(w * cand.vector.get(f, 0.0) for f, w in query.items())
+            if score > best_score:
+                best, best_score = cand, score
+
+        with self._lock:
+            for cand in expired:
+                if self._entries.get(cand.key) is cand:
+                    self._remove(cand)
+                    self._stats["expired"] += 1
+            if best is not None and best_score >= self.similarity and self._entries.get(best.key) is best:
+                self._entries.move_to_end(best.key)
+                best.hits += 1
+                self._stats["similar_hits"] += 1
+                return best.answer
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, question: str, tone: str, lang: str, answer: str, setting: Optional[str] = None):
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        bucket = self._bucket(tone, lang, setting)
+        key = self._key(bucket, normalized)
+        features, words = _features(normalized)
+        if not features:
+            return
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._remove(existing)
+            for f in features:
+                self._df[f] += 1
+            entry = _Entry(key, bucket, features, words, self._vector(features), _numbers(normalized),
+                           _negated(normalized), answer, time.monotonic() + self.ttl_seconds)
+            self._entries[key] = entry
+            for f in words:
+                self._postings[(bucket, f)].add(key)
+            self._stats["stores"] += 1
+
+            while len(self._entries) > self.max_entries:
+                _, oldest = next(iter(self._entries.items()))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._df.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._entries)
+        hits = data["exact_hits"] + data["similar_hits"]
+        lookups = hits + data["misses"]
+        data["lookups"] = lookups
+        data["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        data["similarity_threshold"] = self.similarity
+        data["ttl_seconds"] = self.ttl_seconds
+        data["max_entries"] = self.max_entries
+        return data
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _cache
+    if not getattr(settings, "ANSWER_CACHE_ENABLED", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    max_entries=getattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 2000),
+                    ttl_seconds=getattr(settings, "ANSWER_CACHE_TTL", 6 * 3600),
+                    similarity=getattr(settings, "ANSWER_CACHE_SIMILARITY", 0.8),
+                )
+    return _cache
@@ -8,6 +8,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
 import uuid
 
+from .conditional import chat_session_version, etag
 from .models import ChatSession
 
 def _pascal_to_snake_case(tone: str) -> str:
@@ -93,6 +94,7 @@ def list_chat_sessions(request):
 
 @login_required
 @require_GET
+@etag(chat_session_version)
 def get_chat_session(request, session_id: int):
     """Return a session with full message history."""
     try:
@@ -0,0 +1,97 @@
+"""
+Small caching helpers shared by views: memoize-with-TTL and single-flight.
+
+single_flight() coalesces concurrent identical computations:
+- threads in this process wait on the leader's result directly;
+- other worker processes see a short-lived lock in the shared cache and poll
+  for the leader's result instead of starting a second upstream call.
+"""
+
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def cached_single_flight(key, compute, ttl, lock_timeout=30, poll_interval=0.25):
+    """
+    Return cache[key], computing it at most once across concurrent callers.
+
+    `compute` is only called by the leader; its result is stored under `key`
+    for `ttl` seconds. Falsy results are returned but not cached.
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        if call.event.wait(lock_timeout):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        # The leader is still busy (it may itself be waiting on another process):
+        # use its result if it landed meanwhile, else compute rather than return nothing
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        log.info("single-flight follower wait expired for %s; computing locally", key)
+        value = compute()
+        if value:
+            cache.set(key, value, ttl)
+        return value
+
+    try:
+        call.result = _compute_across_processes(key, compute, ttl, lock_timeout, poll_interval)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        call.event.set()
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _compute_across_processes(key, compute, ttl, lock_timeout, poll_interval):
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, lock_timeout):
+        # Another process is computing: wait for its result, then fall back.
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if cache.get(lock_key) is None:
+                break
+        log.info("single-flight wait expired for %s; computing locally", key)
+
+    try:
+        value = compute()
+        if value:
+            cache.set(key, value, ttl)
+        return value
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,464 @@
+"""
+Chat turn pipeline shared by the web and mobile send_chat endpoints.
+
+ChatService.send() takes plain values (user, session id, message, uploaded
+files, tone, ...) and returns a ChatResult; views only parse their request
+format and render the result (views.send_chat as {"reply", "session_id"},
+mobile_api as an iOS ChatMessage). Conversation state that lives outside the
+database (sticky session id, inferred tone, guest history, mode memory) is
+read from and written to `state`: the Django session for web requests, any
+dict elsewhere.
+"""
+
+import logging
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+
+class ChatResult(NamedTuple):
+    reply: str
+    session_id: Optional[int] = None
+    status: int = 200
+    error: Optional[str] = None         # MAX_FILES_EXCEEDED, FREE_CHAT_LIMIT_EXCEEDED, TIMEOUT, PROCESSING_ERROR
+    details: Optional[dict] = None      # extra fields of an error response
+    message: Optional[dict] = None      # the stored assistant message (with its id), signed-in users only
+
+    def as_dict(self) -> dict:
+        data = {"reply": self.reply, "session_id": self.session_id}
+        if self.error:
+            data["error"] = self.error
+        data.update(self.details or {})
+        return data
+
+
+def uploaded_files(files) -> list:
+    """Attachments from request.FILES: files[] (iOS, dashboard), files, or a single file."""
+    found = files.getlist("files[]") or files.getlist("files")
+    if not found and "file" in files:
+        found = files.getlist("file") or [files["file"]]
+    return list(found)
+
+
+def _assistant_message(msgs, content, v):
+    msg = {"role": "assistant", "content": content, "ts": v._now_iso()}
+    msgs.append(msg)
+    return msg
+
+
+class ChatService:
+    def __init__(self, state=None):
+        self.state = {} if state is None else state
+
+    def send(self, user, session_id, message, files=(), tone=None, lang=None,
+             care_setting=None, faith_setting=None) -> ChatResult:
+        from . import views as v
+
+        files = list(files or [])
+        options = dict(tone=tone, lang=lang, care_setting=care_setting, faith_setting=faith_setting)
+        # A message without attachments may name an earlier upload ("what about scan.png?")
+        names = [] if files or not user.is_authenticated else v._parse_image_filenames(message or "")
+        if not names:
+            return self._send(user, session_id, message, files, **options)
+
+        from .uploads import open_user_media
+        with open_user_media(user, names) as referenced:
+            return self._send(user, session_id, message, referenced, **options)
+
+    def _send(self, user, session_id, message, files, tone=None, lang=None,
+              care_setting=None, faith_setting=None) -> ChatResult:
+        from . import views as v
+
+        state = self.state
+        user_message = (message or "").strip()
+        has_files = bool(files)
+        requested_care, requested_faith = care_setting, faith_setting
+
+        # --- Tone: explicit when provided; otherwise inferred per message (dynamic update)
+        if tone:
+            tone = v.normalize_tone(tone)
+            state.pop("nm_inferred_tone", None)
+        else:
+            tone = v.normalize_tone(v._infer_use_case(user_message, has_files, state))
+            state["nm_inferred_tone"] = tone
+        state["tone"] = tone
+
+        care_setting = faith_setting = None
+        if tone in ("Clinical", "Caregiver"):
+            care_setting = v.norm_setting(requested_care or state.get("care_setting"))
+            state["care_setting"] = care_setting
+            state.pop("faith_setting", None)
+        elif tone == "Faith":
+            faith_setting = v.norm_faith_setting(requested_faith or state.get("faith_setting"))
+            state["faith_setting"] = faith_setting
+            state.pop("care_setting", None)
+        else:
+            state.pop("care_setting", None)
+            state.pop("faith_setting", None)
+
+        # --- Language
+        use_db = user.is_authenticated
+        if use_db:
+            from .models import Profile
+            profile = Profile.for_user(user)
+            if lang and lang != profile.language:
+                # Only on a change: a Profile save also invalidates the user's cached auth tokens
+                profile.language = lang
+                profile.save(update_fields=["language"])
+            elif not lang:
+                lang = profile.language or "en-US"
+        else:
+            lang = lang or "en-US"
+
+        # --- Adaptive Response System (if enabled)
+        interaction_profile = None
+        adaptive_strategies = None
+        if settings.ENABLE_ADAPTIVE_RESPONSE:
+            try:
+                from .preference_inference import PreferenceInference
+                interaction_profile = PreferenceInference.get_default_profile(
+                    user=user if use_db else None,
+                    session_id=None if use_db else (session_id or state.get("active_chat_session_id")),
+                )
+            except Exception as e:
+                # Graceful degradation - if adaptive system fails, continue without it
+                log.warning(f"Adaptive response system error: {e}")
+                interaction_profile = None
+
+        # --- System prompt
+        base_prompt = v.get_system_prompt(tone)
+        if tone == "Faith" and faith_setting:
+            system_prompt = v.get_faith_prompt(base_prompt, faith_setting)
+        elif tone == "Clinical":
+            system_prompt = v.get_setting_prompt(base_prompt, care_setting)
+        else:
+            system_prompt = base_prompt
+        system_prompt = v._add_language_instruction(system_prompt, lang)
+
+        # --- Validate file count
+        if len(files) > v.MAX_FILES_PER_UPLOAD:
+            return ChatResult(
+                f"Too many files. Maximum {v.MAX_FILES_PER_UPLOAD} files allowed per upload.",
+                status=400, error="MAX_FILES_EXCEEDED",
+            )
+
+        # --- Mode header
+        mode, topic_hint = v._classify_mode(user_message, has_files, state)
+        header = f"ResponseMode: {mode}" + (f"\nTopicHint: {topic_hint}" if topic_hint else "")
+
+        # Sticky: prefer the caller's id, else the last session used in this state
+        chosen_session_id = session_id or state.get("active_chat_session_id")
+        session_obj = None
+
+        # --- Free account chat limit
+        if use_db:
+            from .billing_utils import can_free_user_create_chat, get_free_chat_limit, is_subscription_active
+            if not is_subscription_active(user):
+                free_chat_limit = get_free_chat_limit(user) or 10
+                allowed, _, limit_msg = can_free_user_create_chat(user, existing_session_id=chosen_session_id)
+                if not allowed:
+                    return ChatResult(limit_msg, status=403, error="FREE_CHAT_LIMIT_EXCEEDED", details={
+                        "requires_subscription": True,
+                        "free_chats_used": free_chat_limit,
+                        "free_chat_limit": free_chat_limit,
+                    })
+
+        # --- Build initial chat_history (DB vs guest)
+        if use_db:
+            session_obj, _ = v._ensure_session_for_user(
+                user, tone, lang,
+                first_user_msg=user_message or ("[attachments]" if has_files else "New chat"),
+                session_id=chosen_session_id,
+            )
+            state["active_chat_session_id"] = session_obj.id
+
+            chat_history = []
+            for m in (session_obj.messages or []):
+                r, c = m.get("role"), m.get("content")
+                if r and c is not None:
+                    chat_history.append({"role": r, "content": c})
+            if not any(m.get("role") == "system" and str(m.get("content", "")).startswith("ResponseMode:") for m in chat_history):
+                chat_history.insert(0, {"role": "system", "content": header})
+            if not any(m.get("role") == "system" and base_prompt in m.get("content", "") for m in chat_history):
+                chat_history.insert(0, {"role": "system", "content": system_prompt})
+        else:
+            summary_context = state.get("latest_summary", "")
+            chat_history = state.get(
+                "chat_history",
+                [{"role": "system", "content": system_prompt}, {"role": "system", "content": header}],
+            )
+            if not any(m.get("role") == "system" and str(m.get("content", "")).startswith("ResponseMode:") for m in chat_history):
+                chat_history.insert(1, {"role": "system", "content": header})
+        # Always refresh the main system prompt so language changes take effect immediately
+        for m in chat_history:
+            if m.get("role") == "system" and base_prompt in m.get("content", ""):
+                m["content"] = system_prompt
+                break
+
+        # --- Extract signals and update profile (Adaptive System) - after chat_history is built
+        if settings.ENABLE_ADAPTIVE_RESPONSE and interaction_profile:
+            try:
+                from .preference_inference import PreferenceInference, ResponseStrategyResolver, SignalExtractor
+
+                signals = SignalExtractor.extract_all_signals(
+                    user_message=user_message,
+                    has_files=has_files,
+                    conversation_history=chat_history,
+                )
+                # Simple topic change heuristic: less than 30% word overlap with the last user message
+                topic_changed = False
+                last_user_msg = next((m.get("content", "") for m in reversed(chat_history) if m.get("role") == "user"), "")
+                if last_user_msg and user_message:
+                    last_words = set(last_user_msg.lower().split())
+                    current_words = set(user_message.lower().split())
+                    if last_words and current_words:
+                        overlap = len(last_words & current_words) / max(len(last_words), len(current_words), 1)
+                        topic_changed = overlap < 0.3
+
+                interaction_profile = PreferenceInference.update_profile(
+                    interaction_profile, signals, topic_changed=topic_changed,
+                )
+                adaptive_strategies = ResponseStrategyResolver.resolve_strategies(interaction_profile, tone)
+                adaptive_system_prompt = v.build_adaptive_system_prompt(
+                    tone=tone,
+                    care_setting=care_setting,
+                    faith_setting=faith_setting,
+                    lang=lang,
+                    profile=interaction_profile,
+                    strategies=adaptive_strategies,
+                )
+                for m in chat_history:
+                    if m.get("role") == "system" and base_prompt in m.get("content", ""):
+                        m["content"] = adaptive_system_prompt
+                        break
+                system_prompt = adaptive_system_prompt
+            except Exception as e:
+                # Graceful degradation - keep the standard prompt
+                log.warning(f"Adaptive response system error during processing: {e}")
+
+        combined_context = self._analyze_files(user, files, tone, lang, care_setting, system_prompt, session_obj)
+
+        # --- Case: only files
+        if files and not user_message:
+            reply_text = combined_context or "I couldn’t read any useful content from the attachments."
+            status = 200 if combined_context else 400
+            if not use_db:
+                state["latest_summary"] = combined_context or summary_context
+                state["chat_history"] = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": header},
+                    {"role": "user", "content": f"(Here’s the latest medical context):\n{combined_context or summary_context}"},
+                ]
+                state["nm_last_mode"] = "FULL"
+                state["nm_last_short_msg"] = ""
+                state["nm_last_ts"] = v._now_ts()
+                return ChatResult(reply_text, status=status)
+
+            msgs = session_obj.messages or []
+            if not msgs:
+                msgs.extend([
+                    {"role": "system", "content": system_prompt, "ts": v._now_iso()},
+                    {"role": "system", "content": header, "ts": v._now_iso()},
+                ])
+            msgs.append({"role": "user", "content": "(New attachments uploaded)", "ts": v._now_iso(), "meta": {"has_files": True}})
+            stored = _assistant_message(msgs, reply_text, v)
+            self._auto_title(session_obj, "", files, reply_text, lang)
+            session_obj.messages = v._trim_history(msgs, keep=200)
+            session_obj.updated_at = timezone.now()
+            session_obj.save(update_fields=["messages", "updated_at", "title"])
+            return ChatResult(reply_text, session_obj.id, status=status, message=stored)
+
+        # --- No input at all
+        if not files and not user_message:
+            return ChatResult("Hmm… I didn’t catch that. Can you try again?")
+
+        # --- Prepare context for model call
+        if combined_context:
+            chat_history = [
+                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": header},
+                {"role": "user", "content": f"(Here’s the latest medical context):\n{combined_context}"},
+            ]
+            if not use_db:
+                state["latest_summary"] = combined_context
+        elif not use_db:
+            summary_context = state.get("latest_summary", "")
+            if summary_context and all("(Here’s the" not in m.get("content", "") for m in chat_history if m.get("role") == "user"):
+                chat_history.append({"role": "user", "content": f"(Here’s the medical context):\n{summary_context}"})
+
+        # --- Answer cache: only general, file-less, history-free turns
+        answer_cache = None
+        if (
+            mode in ("QUICK", "EXPLAIN")
+            and not files
+            and not adaptive_strategies
+            and not any(m.get("role") in ("user", "assistant") for m in chat_history)
+        ):
+            from .answer_cache import get_answer_cache
+            answer_cache = get_answer_cache()
+        cache_setting = f"{care_setting or ''}|{faith_setting or ''}"  # both shape the system prompt
+
+        chat_history.append({"role": "user", "content": user_message})
+
+        # --- Persist user turn pre-model (DB)
+        if use_db:
+            msgs = session_obj.messages or []
+            if not msgs:
+                msgs.extend([
+                    {"role": "system", "content": system_prompt, "ts": v._now_iso()},
+                    {"role": "system", "content": header, "ts": v._now_iso()},
+                ])
+            if combined_context:
+                msgs.append({
+                    "role": "user",
+                    "content": f"(Here’s the latest medical context):\n{combined_context}",
+                    "ts": v._now_iso(),
+                    "meta": {"context": "files"},
+                })
+            msgs.append({"role": "user", "content": user_message, "ts": v._now_iso()})
+            if not session_obj.title:
+                session_obj.title = (user_message or "New chat")[:120]
+            session_obj.tone = tone
+            session_obj.lang = lang
+            session_obj.messages = v._trim_history(msgs, keep=200)
+            session_obj.updated_at = timezone.now()
+            session_obj.save(update_fields=["messages", "updated_at", "title", "tone", "lang"])
+
+        # --- Call the model (single pass; the system prompt carries the tone)
+        session_pk = getattr(session_obj, "id", None)
+        try:
+            reply = answer_cache.get(user_message, tone, lang, cache_setting) if answer_cache else None
+            if reply is None:
+                reply = v.client.chat.completions.create(
+                    model="gpt-4o",
+                    temperature=0.5,  # Balanced between accuracy (0.3) and creativity (0.6)
+                    messages=chat_history,
+                ).choices[0].message.content.strip()
+                if answer_cache:
+                    answer_cache.set(user_message, tone, lang, reply, cache_setting)
+
+            if not use_db:
+                chat_history.append({"role": "assistant", "content": reply})
+                state["chat_history"] = chat_history[-10:]
+                state["nm_last_mode"] = mode
+                state["nm_last_short_msg"] = user_message if mode == "QUICK" else ""
+                state["nm_last_ts"] = v._now_ts()
+                return ChatResult(reply)
+
+            msgs = session_obj.messages or []
+            stored = _assistant_message(msgs, reply, v)
+            self._auto_title(session_obj, user_message, files, reply, lang)
+            session_obj.messages = v._trim_history(msgs, keep=200)
+            session_obj.updated_at = timezone.now()
+            session_obj.save(update_fields=["messages", "updated_at", "title"])
+            return ChatResult(reply, session_pk, message=stored)
+
+        except Exception as e:
+            log.exception("send_chat failed")
+            error_msg = str(e).lower()
+            if "timeout" in error_msg or "502" in error_msg or "gateway" in error_msg:
+                return ChatResult(
+                    "The image analysis is taking longer than expected. Please try with fewer images (5 or less) or try again in a moment.",
+                    session_pk, status=504, error="TIMEOUT",
+                    details={"job_submit_url": "/api/jobs/"},  # clients can resubmit as a background job
+                )
+            return ChatResult(
+                "Sorry, something went wrong while processing your request. Please try again with fewer images or contact support if this persists.",
+                session_pk, status=500, error="PROCESSING_ERROR",
+            )
+
+    @staticmethod
+    def _auto_title(session_obj, user_message, files, reply, lang):
+        """Replace a placeholder title with a generated one."""
+        from . import views as v
+        try:
+            current = (getattr(session_obj, "title", "") or "").strip().lower()
+            if current in ("", "new chat", "untitled"):
+                ai_name = v._ai_title(user_message=user_message, files=files, reply=reply, lang=lang)
+                if ai_name:
+                    session_obj.title = ai_name
+        except Exception:
+            if not getattr(session_obj, "title", None):
+                session_obj.title = v._derive_title(user_message=user_message, files=files, reply=reply)
+
+    @staticmethod
+    def _analyze_files(user, files, tone, lang, care_setting, system_prompt, session_obj) -> str:
+        """
+        Summarize the attachments into one context block. Images go to the
+        vision model together (in pairs from 5 up, to stay under the request
+        timeout); each upload is streamed to disk once (content-addressed for
+        signed-in users) and vision results are memoized by content digest.
+        """
+        from . import views as v
+
+        image_files = [f for f in files if f.name.lower().endswith(v.ALLOWED_IMAGE_EXTS)]
+        other_files = [f for f in files if not f.name.lower().endswith(v.ALLOWED_IMAGE_EXTS)]
+        sections = []
+
+        if len(image_files) >= 5:
+            log.info(f"Processing {len(image_files)} images in batches of 2 to avoid timeout")
+            batch_size = 2
+            for batch_start in range(0, len(image_files), batch_size):
+                batch_files = image_files[batch_start:batch_start + batch_size]
+                uploads = []
+                try:
+                    for img_file in batch_files:
+                        uploads.append(v._store_upload(user, img_file))
+                    batch_paths = [str(u.path) for u in uploads]
+                    if len(batch_paths) == 1:
+                        compute = lambda: v.extract_contextual_medical_insights_from_image(batch_paths[0], tone=tone, lang=lang)
+                    else:
+                        compute = lambda: v.extract_contextual_medical_insights_from_multiple_images(batch_paths, tone=tone, lang=lang)
+                    batch_summary = v._cached_by_digest("vision", [u.sha256 for u in uploads], f"{tone}|{lang}", compute)
+                    sections.append(f"{', '.join(f.name for f in batch_files)}\n{batch_summary}")
+                except Exception as e:
+                    log.error(f"Batch {batch_start // batch_size + 1} failed: {e}")
+                    # Fallback: process individually for this batch
+                    for img_file in batch_files:
+                        try:
+                            fname, summary = v.summarize_single_file(img_file, tone=tone, system_prompt=system_prompt, user=user)
+                            sections.append(f"{fname}\n{summary}")
+                        except Exception:
+                            sections.append(f"{img_file.name}\n(Unable to process this image)")
+                finally:
+                    v._discard_temporary(uploads)
+
+        elif len(image_files) >= 2:
+            uploads = []
+            try:
+                for img_file in image_files:
+                    uploads.append(v._store_upload(user, img_file))
+                image_paths = [str(u.path) for u in uploads]
+                multi_image_summary = v._cached_by_digest(
+                    "vision", [u.sha256 for u in uploads], f"{tone}|{lang}",
+                    lambda: v.extract_contextual_medical_insights_from_multiple_images(image_paths, tone=tone, lang=lang),
+                )
+                image_names = [f.name for f in image_files[:3]]
+                if len(image_files) > 3:
+                    image_names.append(f"... and {len(image_files) - 3} more")
+                sections.append(f"{', '.join(image_names)}\n{multi_image_summary}")
+
+                # One row for the combined summary, one small row per image
+                if user.is_authenticated:
+                    try:
+                        v._record_analysis_run(
+                            user, uploads, multi_image_summary, tone, lang,
+                            care_setting=care_setting, session=session_obj,
+                        )
+                    except Exception:
+                        log.exception("Failed to record multi-image analysis run")
+            finally:
+                v._discard_temporary(uploads)
+
+        elif len(image_files) == 1:
+            fname, summary = v.summarize_single_file(image_files[0], tone=tone, system_prompt=system_prompt, user=user)
+            sections.append(f"{fname}\n{summary}")
+
+        for f in other_files:
+            fname, summary = v.summarize_single_file(f, tone=tone, system_prompt=system_prompt, user=user)
+            sections.append(f"{fname}\n{summary}")
+
+        return "\n\n".join(sections).strip()
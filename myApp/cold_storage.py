@@ -0,0 +1,99 @@
+"""
+Compressed cold storage for large, rarely read columns.
+
+`python manage.py compact_cold_data` moves MedicalSummary.raw_text and the
+messages of idle ChatSessions into compressed bytes on the same row
+(raw_text_archive / messages_archive) and blanks the original column. The
+models decompress in from_db(), so reads stay transparent and still take one
+query; writing the column again (e.g. a resumed chat) stores it inline and
+drops the cold copy.
+
+Blobs carry a one-byte codec tag: zlib always works; zstd is used only when
+COLD_STORAGE_CODEC = "zstd" and the optional `zstandard` package is installed.
+"""
+
+import json
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+_ZLIB, _ZSTD = b"z", b"s"
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+
+
+def compress_bytes(raw: bytes) -> bytes:
+    codec = getattr(settings, "COLD_STORAGE_CODEC", "zlib")
+    if codec == "zstd" and zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return _ZLIB + zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress_bytes(blob) -> bytes:
+    blob = bytes(blob)  # BinaryField may come back as memoryview
+    tag, payload = blob[:1], blob[1:]
+    if tag == _ZLIB:
+        return zlib.decompress(payload)
+    if tag == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This archive was written with zstd; install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown cold storage codec {tag!r}")
+
+
+def dump_text(text: str) -> bytes:
+    return compress_bytes((text or "").encode("utf-8"))
+
+
+def load_text(blob) -> str:
+    return decompress_bytes(blob).decode("utf-8")
+
+
+def encode_json(value) -> bytes:
+    """Compact UTF-8 JSON, also used to measure the inline size."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dump_json(value) -> bytes:
+    return compress_bytes(encode_json(value))
+
+
+def load_json(blob):
+    return json.loads(decompress_bytes(blob))
+
+
+def compact_rows(model, rows, field, archive_field, age_field, empty, is_json, now,
+                 min_bytes=0, dry_run=False):
+    """
+    Compress `field` for rows [(pk, value, age)] read with values_list(). Returns
+    (rows compacted, bytes before, bytes after). Each UPDATE is conditional on
+    the row being unchanged since it was read (age_field, still not compacted),
+    so a chat resumed in the meantime is left alone. age_field is left as is:
+    the content reads back unchanged, so synced clients have nothing to refetch.
+    """
+    from django.db import transaction
+
+    updates, before, after = [], 0, 0
+    for pk, value, age in rows:
+        raw = encode_json(value) if is_json else (value or "").encode("utf-8")
+        if len(raw) < min_bytes:
+            continue
+        blob = compress_bytes(raw)
+        if len(blob) >= len(raw):
+            continue
+        updates.append((pk, age, blob))
+        before += len(raw)
+        after += len(blob)
+
+    if updates and not dry_run:
+        with transaction.atomic():
+            for pk, age, blob in updates:
+                model.objects.filter(pk=pk, compacted_at__isnull=True, **{age_field: age}).update(
+                    **{field: empty, archive_field: blob, "compacted_at": now}
+                )
+    return len(updates), before, after
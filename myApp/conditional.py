@@ -0,0 +1,86 @@
+"""
+Conditional GET (ETag / If-None-Match) for read-heavy JSON endpoints.
+
+Clients poll config, tones, settings and chat history far more often than any
+of it changes. Each endpoint gets a validator: a cheap function of the request
+(a couple of indexed columns, never the message bodies) whose value changes
+whenever the response would. `etag(...)` hashes it into an ETag and answers a
+matching If-None-Match with 304 before the view runs; otherwise the view runs
+and its response carries the ETag.
+
+Usage (below @api_view, so authentication has already set request.user):
+
+    @api_view(['GET'])
+    @etag(chat_sessions_version)
+    def chat_sessions(request): ...
+"""
+
+import hashlib
+import json
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import ChatSession, Profile
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:32]
+
+
+def static_etag(payload) -> str:
+    """ETag for a response built once at import time (tone catalog, ...)."""
+    return make_etag(json.dumps(payload, sort_keys=True))
+
+
+def etag(version_func):
+    """
+    version_func(request, *args, **kwargs) returns a JSON-able version of the
+    response (or None: no ETag, e.g. for a 404). The representation also
+    depends on Accept, so that is hashed in too. Responses are private and
+    must be revalidated, never served stale from a cache.
+    """
+    def etag_func(request, *args, **kwargs):
+        version = version_func(request, *args, **kwargs)
+        if version is None:
+            return None
+        return make_etag(version, request.META.get("HTTP_ACCEPT", ""))
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped
+    return decorator
+
+
+# ---- Validators ----
+def user_version(request, *args, **kwargs):
+    user = request.user
+    return [user.pk, user.username, user.email, user.first_name, user.last_name, user.last_login]
+
+
+def preferences_version(request, *args, **kwargs):
+    # No profile yet: the view creates one with the default language
+    language = Profile.objects.filter(user=request.user).values_list("language", flat=True).first()
+    return [request.user.pk, language or "en-US"]
+
+
+def chat_sessions_version(request, *args, **kwargs):
+    # Every write to a session bumps updated_at (auto_now); deletes change the count
+    state = ChatSession.objects.filter(user=request.user).aggregate(n=Count("id"), latest=Max("updated_at"))
+    return [request.user.pk, state["n"], state["latest"]]
+
+
+def chat_session_version(request, session_id, *args, **kwargs):
+    row = (
+        ChatSession.objects.filter(id=session_id, user=request.user)
+        .values_list("updated_at", "archived").first()
+    )
+    return None if row is None else [request.user.pk, session_id, *row]
@@ -1,93 +1,71 @@
-import os
-import json
+"""
+Voice chat websocket (ws/voice/): speech or text in, sentence-by-sentence replies with audio out.
+
+Every socket in the process shares one event loop, so the upstream calls
+(Whisper, the chat model, ElevenLabs TTS) go through async clients and never
+block it. Each turn runs as its own task, so the consumer keeps receiving: a
+disconnect cancels the turn together with its in-flight requests, and a
+socket's turns still run one after another. A process-wide semaphore caps
+in-flight upstream calls at VOICE_MAX_UPSTREAM_CALLS, so a burst of callers
+queues here instead of piling onto the APIs. A reply's sentences are
+synthesized concurrently and sent in order as each is ready; the page queues
+the audio, so no pause between sentences is needed.
+"""
+
+import asyncio
 import base64
-import tempfile
-import requests
+import json
+import logging
+import os
 import re
+
+import httpx
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from dotenv import load_dotenv
-from openai import OpenAI
-import asyncio
+from openai import AsyncOpenAI
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+log = logging.getLogger(__name__)
+
+VOICE_MAX_UPSTREAM_CALLS = getattr(settings, "VOICE_MAX_UPSTREAM_CALLS", 16)
+VOICE_UPSTREAM_TIMEOUT = getattr(settings, "VOICE_UPSTREAM_TIMEOUT", 30.0)
+
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=VOICE_UPSTREAM_TIMEOUT)
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = os.getenv("VOICE_ID_ENGLISH")
+ELEVENLABS_TTS_URL = "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
 
 FILTERED_PHRASES = {"you", "uh", "um", "okay", "hi", "yes", "no", ""}
+GREETING = "Hi! This is NeuraMed AI. You can start speaking anytime, and I’ll respond with care."
+FALLBACK_REPLY = "Hmm. I’m having trouble answering that right now."
 
-class VoiceAIConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        await self.accept()
+_upstream_slots = asyncio.Semaphore(VOICE_MAX_UPSTREAM_CALLS)
+_http = None
 
-        warmup = "Hi! This is NeuraMed AI. You can start speaking anytime, and I’ll respond with care."
-        greeting_audio = self.generate_tts(warmup)
-        await self.send(text_data=json.dumps({
-            "reply": warmup,
-            "audio": greeting_audio
-        }))
 
-    async def disconnect(self, close_code):
-        pass
+def _http_client() -> httpx.AsyncClient:
+    """One pooled client for TTS calls (keep-alive to ElevenLabs across sockets)."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=VOICE_UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(max_connections=VOICE_MAX_UPSTREAM_CALLS),
+        )
+    return _http
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
 
-        if 'audio_input' in data:
-            audio_b64 = data['audio_input']
-            audio_bytes = base64.b64decode(audio_b64.split(',')[-1])
+def split_sentences(text):
+    return [s for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_audio:
-                temp_audio.write(audio_bytes)
-                temp_audio_path = temp_audio.name
 
-            try:
-                with open(temp_audio_path, "rb") as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                    user_text = transcript.text.strip()
-                    print(f"🎤 User said: {user_text}")
-                    if len(user_text) < 3 or user_text.lower() in FILTERED_PHRASES:
-                        print("⚠️ Skipped filler phrase.")
-                        return
-            finally:
-                os.remove(temp_audio_path)
-        else:
-            user_text = data.get("message", "").strip()
-
-        # Step 1: GPT Reply
-        try:
-            gpt_response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": user_text}]
-            )
-            reply_text = gpt_response.choices[0].message.content.strip()
-            print(f"🧠 GPT replied: {reply_text}")
-        except Exception as e:
-            print(f"❌ GPT error: {e}")
-            reply_text = "Hmm. I’m having trouble answering that right now."
-
-        # Step 2: Split into chunks
-        segments = re.split(r'(?<=[.!?])\s+', reply_text)
-        segments = [s for s in segments if s.strip()]
-
-        # Step 3: Send sentence-by-sentence
-        for segment in segments:
-            audio_b64 = self.generate_tts(segment)
-            if audio_b64:
-                await self.send(text_data=json.dumps({
-                    "reply": segment,
-                    "audio": audio_b64
-                }))
-            await asyncio.sleep(0.3)
-
-    def generate_tts(self, text):
-        try:
-            tts_response = requests.post(
-                f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}",
+async def generate_tts(text):
+    """ElevenLabs speech for text as base64 MP3, or None if it failed."""
+    try:
+        async with _upstream_slots:
+            response = await _http_client().post(
+                ELEVENLABS_TTS_URL.format(voice_id=VOICE_ID),
                 headers={
                     "xi-api-key": ELEVENLABS_API_KEY,
                     "Content-Type": "application/json"
@@ -98,15 +76,97 @@ class VoiceAIConsumer(AsyncWebsocketConsumer):
                         "stability": 0.4,
                         "similarity_boost": 0.7
                     }
-                }
+                },
             )
-            if tts_response.status_code != 200:
-                print(f"❌ TTS failed: {tts_response.status_code}")
-                return None
+        if response.status_code != 200:
+            log.warning("TTS failed: %s", response.status_code)
+            return None
+        return base64.b64encode(response.content).decode("utf-8")
+    except Exception:
+        log.exception("TTS error")
+        return None
 
-            print(f"🔊 TTS chunk size: {len(tts_response.content)} bytes")
-            return base64.b64encode(tts_response.content).decode("utf-8")
 
-        except Exception as e:
-            print(f"❌ TTS error: {e}")
-            return None
+async def transcribe(audio_bytes):
+    async with _upstream_slots:
+        transcript = await client.audio.transcriptions.create(
+            model="whisper-1",
+            file=("audio.webm", audio_bytes),
+        )
+    return transcript.text.strip()
+
+
+async def chat_reply(user_text):
+    try:
+        async with _upstream_slots:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": user_text}]
+            )
+        return response.choices[0].message.content.strip()
+    except Exception:
+        log.exception("Voice chat completion failed")
+        return FALLBACK_REPLY
+
+
+class VoiceAIConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        self._tasks = set()
+        self._turn_lock = asyncio.Lock()  # one turn at a time per socket, in arrival order
+        await self.accept()
+        self._spawn(self._greet())
+
+    async def disconnect(self, close_code):
+        # Stops the turn wherever it is, including its pending OpenAI/ElevenLabs requests
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        self._spawn(self._turn(json.loads(text_data)))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _greet(self):
+        async with self._turn_lock:
+            await self.send(text_data=json.dumps({
+                "reply": GREETING,
+                "audio": await generate_tts(GREETING)
+            }))
+
+    async def _turn(self, data):
+        async with self._turn_lock:
+            try:
+                user_text = await self._user_text(data)
+                if user_text:
+                    await self._speak(split_sentences(await chat_reply(user_text)))
+            except Exception:  # CancelledError is not an Exception, so cancellation still propagates
+                log.exception("Voice turn failed")
+
+    async def _user_text(self, data):
+        if 'audio_input' not in data:
+            return data.get("message", "").strip()
+
+        audio_bytes = base64.b64decode(data['audio_input'].split(',')[-1])
+        user_text = await transcribe(audio_bytes)
+        if len(user_text) < 3 or user_text.lower() in FILTERED_PHRASES:
+            log.debug("Skipped filler phrase")
+            return ""
+        return user_text
+
+    async def _speak(self, segments):
+        """Synthesize every sentence at once; send them in order as each is ready."""
+        tasks = [asyncio.create_task(generate_tts(segment)) for segment in segments]
+        try:
+            for segment, task in zip(segments, tasks):
+                audio_b64 = await task
+                if audio_b64:
+                    await self.send(text_data=json.dumps({
+                        "reply": segment,
+                        "audio": audio_b64
+                    }))
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,374 @@
+"""
+Streaming exports: a user's own account data (export_account_data, GDPR) and
+the staff user directory (export_users_list, CSV or PDF).
+
+Each section is a generator over one model read with .iterator(chunk_size=...),
+and every record is serialized on its own, so memory stays flat however much
+history the user has and the download starts with the first bytes. Two wire
+formats share the same records:
+
+- json:   one object, {"account": {...}, "summaries": [...], ...}
+- ndjson: one {"type": <section>, "data": {...}} line per record
+
+The user directory walks users in pk keyset batches and counts summaries,
+chats and sign-ins with one grouped query per table per batch, instead of one
+annotated query joining all three tables for every user at once.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+
+from .models import (
+    AnalysisRun, ChatSession, MedicalSummary, Payment, Profile, Subscription, UserMediaFile, UserSignin,
+)
+
+EXPORT_CHUNK_ROWS = getattr(settings, "EXPORT_CHUNK_ROWS", 200)
+EXPORT_USERS_PDF_MAX = getattr(settings, "EXPORT_USERS_PDF_MAX", 10000)
+EXPORT_BUFFER_BYTES = 64 * 1024
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+# =============================
+# Sections
+# =============================
+
+def _account(user):
+    yield {
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "date_joined": user.date_joined,
+        "last_login": user.last_login,
+    }
+
+
+def _profile(user):
+    profile, _ = Profile.objects.get_or_create(user=user)
+    yield {
+        "display_name": profile.display_name,
+        "profession": profile.profession,
+        "language": profile.language,
+        "plan": profile.plan,
+        "subscription_status": profile.subscription_status,
+        "subscription_ends_at": profile.subscription_ends_at,
+    }
+
+
+def _settings(user):
+    yield Profile.objects.filter(user=user).values_list("user_settings", flat=True).first() or {}
+
+
+def _subscriptions(user):
+    rows = Subscription.objects.filter(user=user).order_by("pk").values(
+        "plan", "status", "current_period_end", "created_at",
+    )
+    yield from rows.iterator(chunk_size=EXPORT_CHUNK_ROWS)
+
+
+def _payments(user):
+    rows = Payment.objects.filter(user=user).order_by("pk").values(
+        "plan_id", "amount", "currency", "status", "created_at", "paid_at",
+    )
+    yield from rows.iterator(chunk_size=EXPORT_CHUNK_ROWS)
+
+
+def _summaries(user):
+    # Model instances (not .values()) so compacted raw_text is decompressed in from_db;
+    # raw_text_archive must be loaded for that (deferring it exports compacted rows as "")
+    rows = MedicalSummary.objects.filter(user=user).order_by("pk")
+    for s in rows.iterator(chunk_size=EXPORT_CHUNK_ROWS):
+        yield {
+            "id": s.pk,
+            "uploaded_filename": s.uploaded_filename,
+            "tone": s.tone,
+            "care_setting": s.care_setting,
+            "created_at": s.created_at,
+            "summary": s.summary,
+            "raw_text": s.raw_text,
+            "analysis_run_id": s.analysis_run_id,
+        }
+
+
+def _chat_sessions(user):
+    for s in ChatSession.objects.filter(user=user).order_by("pk").iterator(chunk_size=EXPORT_CHUNK_ROWS):
+        yield {
+            "id": s.pk,
+            "title": s.title,
+            "tone": s.tone,
+            "lang": s.lang,
+            "archived": s.archived,
+            "created_at": s.created_at,
+            "updated_at": s.updated_at,
+            "messages": s.messages or [],
+        }
+
+
+def _analysis_runs(user):
+    rows = AnalysisRun.objects.filter(user=user).order_by("pk").prefetch_related("files")
+    for run in rows.iterator(chunk_size=EXPORT_CHUNK_ROWS):
+        yield {
+            "id": run.pk,
+            "session_id": run.session_id,
+            "tone": run.tone,
+            "lang": run.lang,
+            "care_setting": run.care_setting,
+            "created_at": run.created_at,
+            "summary": run.summary,
+            "files": [{"filename": f.filename, "sha256": f.sha256, "size": f.size} for f in run.files.all()],
+        }
+
+
+def _media_files(user):
+    rows = UserMediaFile.objects.filter(user=user).order_by("pk").values(
+        "display_name", "sha256", "size", "created_at",
+    )
+    yield from rows.iterator(chunk_size=EXPORT_CHUNK_ROWS)
+
+
+# (name, generator, single object rather than a list)
+SECTIONS = (
+    ("account", _account, True),
+    ("profile", _profile, True),
+    ("settings", _settings, True),
+    ("subscriptions", _subscriptions, False),
+    ("payments", _payments, False),
+    ("summaries", _summaries, False),
+    ("chat_sessions", _chat_sessions, False),
+    ("analysis_runs", _analysis_runs, False),
+    ("media_files", _media_files, False),
+)
+
+
+# =============================
+# Wire formats
+# =============================
+
+def _iter_json(user):
+    yield "{"
+    for i, (name, section, single) in enumerate(SECTIONS):
+        yield f'{"," if i else ""}\n{_dumps(name)}: '
+        if single:
+            yield _dumps(next(section(user), None))
+            continue
+        yield "["
+        for j, record in enumerate(section(user)):
+            yield f'{"," if j else ""}\n  {_dumps(record)}'
+        yield "\n]"
+    yield "\n}\n"
+
+
+def _iter_ndjson(user):
+    for name, section, _ in SECTIONS:
+        for record in section(user):
+            yield _dumps({"type": name, "data": record}) + "\n"
+
+
+def _buffered(pieces, size=EXPORT_BUFFER_BYTES):
+    """Join small string pieces into ~size-byte UTF-8 chunks (fewer, larger socket writes)."""
+    buf, length = [], 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buf.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buf)
+            buf, length = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def stream_account_export(user, fmt="json"):
+    """Byte chunks of the user's export in fmt ("json" or "ndjson")."""
+    pieces = _iter_ndjson(user) if fmt == "ndjson" else _iter_json(user)
+    return _buffered(pieces)
+
+
+# =============================
+# Staff user directory
+# =============================
+
+USER_CSV_HEADER = [
+    'Username', 'Email', 'Display Name', 'First Name', 'Last Name',
+    'Profession', 'Language', 'Signup Date', 'Last Login', 'Total Signins',
+    'Total Summaries', 'Total Chat Sessions', 'Status', 'Is Staff',
+    'Signup IP', 'Signup Country', 'Last Login IP', 'Last Login Country',
+]
+
+
+def _counts(queryset, ids, **extra):
+    rows = queryset.filter(user_id__in=ids).values("user_id").annotate(n=Count("id"), **extra)
+    return {row["user_id"]: row for row in rows}
+
+
+def iter_user_stats(batch_size=EXPORT_CHUNK_ROWS, limit=None):
+    """Yield (user, profile or None, stats) newest account first; stats has summaries, chats, signins, last_signin."""
+    User = get_user_model()
+    last_pk, sent = None, 0
+    while limit is None or sent < limit:
+        users = User.objects.select_related("profile").order_by("-pk")
+        if last_pk is not None:
+            users = users.filter(pk__lt=last_pk)
+        size = batch_size if limit is None else min(batch_size, limit - sent)
+        batch = list(users[:size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        ids = [u.pk for u in batch]
+        summaries = _counts(MedicalSummary.objects, ids)
+        chats = _counts(ChatSession.objects, ids)
+        signins = _counts(UserSignin.objects.filter(success=True), ids, last=Max("created_at"))
+        for user in batch:
+            signin = signins.get(user.pk, {})
+            yield user, getattr(user, "profile", None), {
+                "summaries": summaries.get(user.pk, {}).get("n", 0),
+                "chats": chats.get(user.pk, {}).get("n", 0),
+                "signins": signin.get("n", 0),
+                "last_signin": signin.get("last"),
+            }
+        sent += len(batch)
+
+
+class _Echo:
+    """csv.writer target whose write() hands the formatted row back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_users_csv():
+    """CSV lines of the user directory, one row per user, for a StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(USER_CSV_HEADER)
+    for user, profile, stats in iter_user_stats():
+        yield writer.writerow([
+            user.username,
+            user.email,
+            profile.display_name if profile else '',
+            user.first_name or '',
+            user.last_name or '',
+            profile.profession if profile else '',
+            profile.language if profile else 'en-US',
+            user.date_joined.strftime('%Y-%m-%d %H:%M:%S'),
+            user.last_login.strftime('%Y-%m-%d %H:%M:%S') if user.last_login else '',
+            stats["signins"],
+            stats["summaries"],
+            stats["chats"],
+            'Active' if user.is_active else 'Inactive',
+            'Yes' if user.is_staff else 'No',
+            profile.signup_ip if profile else '',
+            profile.signup_country if profile else '',
+            profile.last_login_ip if profile else '',
+            profile.last_login_country if profile else '',
+        ])
+
+
+def _clip(text, width):
+    text = text or ''
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def _pdf_user_row(user, profile, stats):
+    display_name = (profile.display_name if profile else '') or ''
+    name = f"{display_name or user.first_name or user.username} {user.last_name or ''}".strip()
+    status = 'Active' if user.is_active else 'Inactive'
+    if user.is_staff:
+        status += ' (Staff)'
+    return [
+        _clip(user.username, 18),
+        _clip(user.email, 30),
+        _clip(name, 20),
+        (profile.profession[:15] if profile and profile.profession else '—'),
+        user.date_joined.strftime('%Y-%m-%d'),
+        status[:15],
+        f"S:{stats['summaries']} C:{stats['chats']} L:{stats['signins']}",
+    ]
+
+
+def write_users_pdf(out, generated_at, limit=EXPORT_USERS_PDF_MAX):
+    """
+    Draw the user directory straight onto a ReportLab canvas, one page of rows
+    at a time, so only the current page is held as Python objects (a platypus
+    Table needs every row up front). Writes the PDF to the binary file `out`.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+
+    User = get_user_model()
+    total_users = User.objects.count()
+    in_report = min(total_users, limit)
+
+    page_w, page_h = landscape(letter)
+    margin = 0.5 * inch
+    row_h = 16
+    header = ['Username', 'Email', 'Name', 'Profession', 'Signup', 'Status', 'Activity']
+    widths = [1.2 * inch, 2.4 * inch, 1.6 * inch, 1.1 * inch, 0.9 * inch, 1.1 * inch, 1.7 * inch]
+    xs = [margin]
+    for w in widths[:-1]:
+        xs.append(xs[-1] + w)
+    table_w = sum(widths)
+    footer = f"Generated on {generated_at.strftime('%B %d, %Y at %H:%M')} | NeuroMed Aira Analytics Dashboard"
+
+    c = canvas.Canvas(out, pagesize=(page_w, page_h), pageCompression=1)
+    c.setTitle("User Directory Export")
+    state = {"page": 0, "y": 0}
+
+    def new_page():
+        if state["page"]:
+            c.setFont("Helvetica", 8)
+            c.setFillColor(colors.grey)
+            c.drawString(margin, margin / 2, f"{footer} | Page {state['page']}")
+            c.showPage()
+        state["page"] += 1
+        y = page_h - margin
+        if state["page"] == 1:
+            c.setFont("Helvetica-Bold", 20)
+            c.setFillColor(colors.HexColor('#059669'))
+            c.drawCentredString(page_w / 2, y - 20, "User Directory Export")
+            c.setFont("Helvetica", 10)
+            c.setFillColor(colors.black)
+            c.drawString(margin, y - 44, f"Export Date: {generated_at.strftime('%B %d, %Y at %H:%M')}")
+            c.drawString(margin, y - 58, f"Total Users: {total_users}    Users in Report: {in_report}")
+            y -= 76
+        c.setFillColor(colors.HexColor('#374151'))
+        c.rect(margin, y - row_h, table_w, row_h, stroke=0, fill=1)
+        c.setFont("Helvetica-Bold", 9)
+        c.setFillColor(colors.whitesmoke)
+        for x, label in zip(xs, header):
+            c.drawString(x + 4, y - row_h + 5, label)
+        state["y"] = y - row_h
+
+    new_page()
+    for i, (user, profile, stats) in enumerate(iter_user_stats(limit=limit)):
+        if state["y"] - row_h < margin:
+            new_page()
+        y = state["y"] - row_h
+        if i % 2:
+            c.setFillColor(colors.HexColor('#F9FAFB'))
+            c.rect(margin, y, table_w, row_h, stroke=0, fill=1)
+        c.setFont("Helvetica", 8)
+        c.setFillColor(colors.black)
+        for x, value in zip(xs, _pdf_user_row(user, profile, stats)):
+            c.drawString(x + 4, y + 5, value)
+        c.setStrokeColor(colors.lightgrey)
+        c.line(margin, y, margin + table_w, y)
+        state["y"] = y
+
+    c.setFont("Helvetica", 8)
+    c.setFillColor(colors.grey)
+    c.drawString(margin, margin / 2, f"{footer} | Page {state['page']}")
+    c.save()
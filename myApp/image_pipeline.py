@@ -0,0 +1,233 @@
+"""
+Image decode and encode stages for the vision pipeline.
+
+Phone photos are 12–48 MP; decoding them at native resolution only to shrink
+them to ~1024 px wastes memory and CPU. decode_for_vision() lands near the
+target size as early as possible:
+- JPEG: PIL draft() → libjpeg DCT scaling (1/2, 1/4, 1/8) during decode.
+- Other formats (PNG/WebP/HEIC): full decode, then a cheap integer reduce()
+  before the final LANCZOS pass (reducing_gap).
+EXIF orientation is applied (after the reduction, so it is cheap) so rotated
+phone photos reach the model upright.
+
+encode_for_vision() then writes the payload using a named EncodingProfile
+(format, color mode, size cap, quality). Grayscale optimized PNG is slow to
+encode and large for photos; JPEG/WebP are a fraction of the size for camera
+shots, while X-rays stay lossless grayscale PNG. The default "auto" profile
+picks between the two from the image's saturation. Compare profiles with
+`python manage.py bench_vision_encoding`.
+
+HEIC/HEIF needs the optional `pillow-heif` package; without it those files
+raise UnsupportedImageError with a clear message instead of a PIL error.
+"""
+
+import base64
+import io
+import logging
+import math
+from typing import NamedTuple, Optional
+
+from PIL import Image, ImageStat
+
+log = logging.getLogger(__name__)
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:  # optional dependency
+    HEIF_SUPPORTED = False
+
+HEIF_EXTS = (".heic", ".heif")
+
+# EXIF orientation → transpose that makes the image upright (as ImageOps.exif_transpose)
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  # these swap width and height
+
+# How far above the target the reduce() step may stop before LANCZOS finishes
+REDUCING_GAP = 3.0
+
+
+class UnsupportedImageError(ValueError):
+    pass
+
+
+def _orientation(img) -> int:
+    try:
+        return int(img.getexif().get(0x0112, 1))
+    except Exception:
+        return 1
+
+
+def _upright_extent(width, height, orientation, long_edge):
+    """Size that decode_for_vision() measures against: upright width, or the longer side."""
+    if long_edge:
+        return max(width, height)
+    return height if orientation in _TRANSPOSED_ORIENTATIONS else width
+
+
+def decode_for_vision(image_path, target_width=1024, mode="L", long_edge=None):
+    """
+    Open an image for the vision API: upright, in `mode`, at most `target_width` wide
+    (or, when `long_edge` is given, with neither side longer than `long_edge`).
+
+    Returns a loaded PIL image (the file handle is closed). Rotation is applied
+    last, on the already-reduced image.
+    """
+    target = long_edge or target_width
+    path_str = str(image_path)
+    if path_str.lower().endswith(HEIF_EXTS) and not HEIF_SUPPORTED:
+        raise UnsupportedImageError("HEIC images need the pillow-heif package installed.")
+
+    with Image.open(image_path) as img:
+        orientation = _orientation(img)
+        extent = _upright_extent(img.width, img.height, orientation, long_edge)
+        scale = min(1.0, target / float(extent)) if extent else 1.0
+
+        if img.format == "JPEG" and scale < 1.0:
+            # DCT scaling: decode directly at the smallest 1/2^n size >= requested
+            draft_mode = mode if mode in ("L", "RGB") else "RGB"
+            img.draft(draft_mode, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+
+        if img.mode != mode:
+            if img.mode in ("RGBA", "LA", "P") and mode == "RGB":
+                # Flatten transparency onto white rather than black
+                rgba = img.convert("RGBA")
+                out = Image.new("RGB", rgba.size, (255, 255, 255))
+                out.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                out = img.convert(mode)
+        else:
+            out = img
+
+        # draft() may already have shrunk the decode; finish from the current size
+        w, h = out.size
+        extent = _upright_extent(w, h, orientation, long_edge)
+        if extent > target:
+            factor = target / float(extent)
+            out = out.resize(
+                (max(1, round(w * factor)), max(1, round(h * factor))),
+                Image.LANCZOS,
+                reducing_gap=REDUCING_GAP,
+            )
+
+        if orientation in _ORIENTATION_TRANSPOSE:
+            out = out.transpose(_ORIENTATION_TRANSPOSE[orientation])
+        return out
+
+
+# =============================
+#  ENCODE STAGE
+# =============================
+
+class EncodingProfile(NamedTuple):
+    format: str              # PNG / JPEG / WEBP
+    mode: str                # L (grayscale) or RGB
+    long_edge: Optional[int] = None   # cap on the longer side; None → cap on width
+    width: int = 1024
+    quality: Optional[int] = None     # JPEG / WebP only
+    optimize: bool = False
+
+
+class EncodedImage(NamedTuple):
+    mime: str
+    data: bytes
+    profile: str
+    size: tuple
+
+
+# The model downsamples anything past ~768 px on the short side, so larger
+# payloads mostly cost upload time. "legacy" is the old grayscale optimized PNG.
+ENCODING_PROFILES = {
+    "legacy": EncodingProfile("PNG", "L", width=1024, optimize=True),
+    "xray": EncodingProfile("PNG", "L", long_edge=1024),
+    "document": EncodingProfile("JPEG", "L", long_edge=1600, quality=85),
+    "photo": EncodingProfile("JPEG", "RGB", long_edge=1024, quality=85),
+    "compact": EncodingProfile("WEBP", "RGB", long_edge=1024, quality=80),
+}
+# "auto" decodes once in color, then picks xray (grayscale content) or photo
+AUTO_PROFILES = ("xray", "photo")
+DEFAULT_PROFILE = "auto"
+
+_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Mean HSV saturation (0–255) below which a color file is treated as grayscale
+GRAYSCALE_SATURATION = 12
+
+
+def get_profile(name) -> EncodingProfile:
+    """Look up a named profile; settings.VISION_ENCODING_PROFILES can add or override entries."""
+    from django.conf import settings
+
+    profiles = {**ENCODING_PROFILES, **getattr(settings, "VISION_ENCODING_PROFILES", {})}
+    try:
+        profile = profiles[name]
+    except KeyError:
+        raise ValueError(f"Unknown vision encoding profile '{name}'") from None
+    return profile if isinstance(profile, EncodingProfile) else EncodingProfile(**profile)
+
+
+def looks_grayscale(img) -> bool:
+    """True for single-channel images and color files with (almost) no saturation, e.g. exported X-rays."""
+    if img.mode in ("1", "L", "LA", "I", "I;16", "F"):
+        return True
+    sample = img.convert("RGB")
+    sample.thumbnail((64, 64))
+    return ImageStat.Stat(sample.convert("HSV").getchannel("S")).mean[0] < GRAYSCALE_SATURATION
+
+
+def _encode(img, profile: EncodingProfile) -> bytes:
+    buffer = io.BytesIO()
+    options = {}
+    if profile.format == "PNG":
+        options["optimize"] = profile.optimize
+    else:
+        options["quality"] = profile.quality or 85
+        if profile.format == "JPEG":
+            options["optimize"] = profile.optimize
+    img.save(buffer, format=profile.format, **options)
+    return buffer.getvalue()
+
+
+def encode_for_vision(image_path, profile=None) -> EncodedImage:
+    """
+    Decode (see decode_for_vision) and encode an image for the vision API.
+
+    `profile` is a name from ENCODING_PROFILES, "auto", or None for
+    settings.VISION_ENCODING_PROFILE.
+    """
+    if profile is None:
+        from django.conf import settings
+        profile = getattr(settings, "VISION_ENCODING_PROFILE", DEFAULT_PROFILE)
+
+    if profile == "auto":
+        color = get_profile(AUTO_PROFILES[1])
+        img = decode_for_vision(image_path, target_width=color.width, mode="RGB", long_edge=color.long_edge)
+        if looks_grayscale(img):
+            profile = AUTO_PROFILES[0]
+            spec = get_profile(profile)
+            if (spec.long_edge, spec.width) != (color.long_edge, color.width):
+                img = decode_for_vision(image_path, target_width=spec.width, mode=spec.mode, long_edge=spec.long_edge)
+            else:
+                img = img.convert(spec.mode)
+        else:
+            profile, spec = AUTO_PROFILES[1], color
+    else:
+        spec = get_profile(profile)
+        img = decode_for_vision(image_path, target_width=spec.width, mode=spec.mode, long_edge=spec.long_edge)
+
+    return EncodedImage(_MIME_TYPES[spec.format], _encode(img, spec), profile, img.size)
+
+
+def vision_data_uri(image_path, profile=None) -> str:
+    encoded = encode_for_vision(image_path, profile)
+    return f"data:{encoded.mime};base64,{base64.b64encode(encoded.data).decode()}"
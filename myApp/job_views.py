@@ -0,0 +1,140 @@
+"""
+Background analysis job endpoints: submit, poll status, fetch result.
+
+    POST api/jobs/                  → 202 {id, status, status_url, result_url, ...}
+    GET  api/jobs/<id>/             → status + progress
+    GET  api/jobs/<id>/result/      → 200 result | 202 still running | 422 failed
+
+Jobs are executed by `python manage.py run_jobs` (see jobs.py). Purge jobs
+are queued by the account settings views, not through api/jobs/, but are
+polled here the same way.
+"""
+
+import logging
+
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import AnalysisJob
+from .jobs import FREE_CHAT_LIMIT_ERROR, free_chat_limit_message, submit_job
+
+log = logging.getLogger(__name__)
+
+SUBMITTABLE_KINDS = ("summarize", "chat_files")
+
+FAILURE_MESSAGES = {
+    "purge_chat_history": "We couldn’t finish clearing your chat history. Please try again.",
+    "purge_account": "We couldn’t finish deleting your account. Please contact support.",
+}
+
+
+def _job_payload(request, job):
+    total = job.progress_total or 0
+    data = {
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": {
+            "done": job.progress_done,
+            "total": total,
+            "percent": int(100 * job.progress_done / total) if total else (100 if job.status == "succeeded" else 0),
+            "message": job.progress_message,
+        },
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": request.build_absolute_uri(f"/api/jobs/{job.pk}/"),
+        "result_url": request.build_absolute_uri(f"/api/jobs/{job.pk}/result/"),
+    }
+    if job.status == "failed" and job.error.startswith(FREE_CHAT_LIMIT_ERROR):
+        data["error"] = job.error.split(": ", 1)[-1]
+        data["error_code"] = FREE_CHAT_LIMIT_ERROR
+        data["requires_subscription"] = True
+    elif job.status == "failed":
+        data["error"] = FAILURE_MESSAGES.get(job.kind, "We couldn’t finish analyzing these files. Please try again.")
+    return data
+
+
+def _get_user_job(request, job_id):
+    return AnalysisJob.objects.filter(pk=job_id, user=request.user).first()
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def submit_analysis_job(request):
+    from .views import MAX_FILES_PER_UPLOAD, normalize_tone, _profile_language
+    from .billing_utils import get_free_chat_limit, has_feature_access
+
+    kind = (request.data.get("kind") or "summarize").strip()
+    if kind not in SUBMITTABLE_KINDS:
+        return Response({"message": f"Unknown job kind '{kind}'."}, status=400)
+
+    files = request.FILES.getlist("files[]") or request.FILES.getlist("files")
+    if not files and "file" in request.FILES:
+        files = [request.FILES["file"]]
+    if not files:
+        return Response({"message": "Please attach a file to continue."}, status=400)
+    if len(files) > MAX_FILES_PER_UPLOAD:
+        return Response({
+            "message": f"Too many files. Maximum {MAX_FILES_PER_UPLOAD} files allowed per upload.",
+            "error": "MAX_FILES_EXCEEDED",
+        }, status=400)
+
+    if kind == "summarize" and not has_feature_access(request.user, 'medical_summaries'):
+        return Response({
+            "message": "This feature requires an active subscription. Please upgrade to access medical summaries.",
+            "requires_subscription": True,
+            "upgrade_url": "/settings/billing/"
+        }, status=403)
+
+    if kind == "chat_files":
+        # A chat_files job adds chat turns, so it counts against the free limit like send_chat
+        limit_message = free_chat_limit_message(request.user, request.data.get("session_id") or None)
+        if limit_message:
+            free_chat_limit = get_free_chat_limit(request.user) or 10
+            return Response({
+                "message": limit_message,
+                "error": FREE_CHAT_LIMIT_ERROR,
+                "requires_subscription": True,
+                "free_chats_used": free_chat_limit,
+                "free_chat_limit": free_chat_limit,
+            }, status=403)
+
+    params = {
+        "tone": normalize_tone(request.data.get("tone") or request.session.get("tone") or "PlainClinical"),
+        "lang": request.data.get("lang") or _profile_language(request.user),
+        "care_setting": request.data.get("care_setting") or "",
+        "session_id": request.data.get("session_id") or None,
+        "message": (request.data.get("message") or "").strip(),
+    }
+    idempotency_key = request.headers.get("Idempotency-Key") or request.data.get("idempotency_key") or ""
+
+    job, created = submit_job(request.user, kind, files, params, idempotency_key)
+    if created:
+        log.info("Queued %s job %s for user %s (%s files)", kind, job.pk, request.user.pk, len(files))
+    return Response(_job_payload(request, job), status=202 if created else 200)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def analysis_job_status(request, job_id: int):
+    job = _get_user_job(request, job_id)
+    if job is None:
+        return Response({"message": "Job not found."}, status=404)
+    return Response(_job_payload(request, job))
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def analysis_job_result(request, job_id: int):
+    job = _get_user_job(request, job_id)
+    if job is None:
+        return Response({"message": "Job not found."}, status=404)
+    if job.status == "succeeded":
+        return Response({"id": job.pk, "kind": job.kind, "status": job.status, "result": job.result})
+    if job.status == "failed":
+        return Response(_job_payload(request, job), status=422)
+    return Response(_job_payload(request, job), status=202)
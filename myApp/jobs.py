@@ -0,0 +1,419 @@
+"""
+DB-backed background job queue (no external broker).
+
+Web requests call submit_job() and return immediately; `python manage.py run_jobs`
+claims queued rows with a conditional UPDATE (safe with several workers), runs
+the handler registered for the job kind, and records progress, result or error
+on the row. Clients poll api/jobs/<id>/ and fetch api/jobs/<id>/result/.
+
+Handlers run outside the HTTP request, so they use bigger vision batches and a
+longer per-call timeout than the in-request code paths in views.py. Account
+deletion and chat history clearing also run here (see purge.py).
+"""
+
+import logging
+import math
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnalysisJob, MedicalSummary
+
+log = logging.getLogger(__name__)
+
+JOB_IMAGE_BATCH_SIZE = getattr(settings, "ANALYSIS_JOB_IMAGE_BATCH_SIZE", 4)
+JOB_VISION_TIMEOUT = getattr(settings, "ANALYSIS_JOB_VISION_TIMEOUT", 120.0)
+JOB_STALE_SECONDS = getattr(settings, "ANALYSIS_JOB_STALE_SECONDS", 15 * 60)
+JOB_MAX_ATTEMPTS = getattr(settings, "ANALYSIS_JOB_MAX_ATTEMPTS", 3)
+JOB_HEARTBEAT_SECONDS = getattr(settings, "ANALYSIS_JOB_HEARTBEAT_SECONDS", 60)
+
+FREE_CHAT_LIMIT_ERROR = "FREE_CHAT_LIMIT_EXCEEDED"
+
+
+class JobLost(Exception):
+    """The job was requeued (or failed) under this worker; another worker owns it now."""
+
+
+class FreeChatLimitExceeded(Exception):
+    def __init__(self, message):
+        super().__init__(f"{FREE_CHAT_LIMIT_ERROR}: {message}")
+
+
+def free_chat_limit_message(user, session_id=None) -> str:
+    """The free-plan limit message if user may not add another chat turn, else "" (same check as ChatService)."""
+    from .billing_utils import can_free_user_create_chat, is_subscription_active
+
+    if user is None or is_subscription_active(user):
+        return ""
+    allowed, _, message = can_free_user_create_chat(user, existing_session_id=session_id)
+    return "" if allowed else message
+
+
+# =============================
+# Submit / claim / progress
+# =============================
+
+def _store_job_file(user, file_obj) -> dict:
+    """Stream one upload into the user's media dir; returns {name, path (relative to MEDIA_ROOT), sha256, size}."""
+    from .views import _store_upload
+
+    stored = _store_upload(user, file_obj)
+    return {
+        "name": file_obj.name,
+        "path": stored.path.relative_to(settings.MEDIA_ROOT).as_posix(),
+        "sha256": stored.sha256,
+        "size": stored.size,
+    }
+
+
+def submit_job(user, kind, uploaded_files=(), params=None, idempotency_key=""):
+    """
+    Queue a job. Returns (job, created).
+
+    With an idempotency key, a retried submit returns the original job instead
+    of queueing (and paying for) the same analysis twice.
+    """
+    idempotency_key = (idempotency_key or "").strip()[:128]
+    if idempotency_key:
+        existing = AnalysisJob.objects.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+
+    files = [_store_job_file(user, f) for f in uploaded_files]
+    try:
+        with transaction.atomic():
+            job = AnalysisJob.objects.create(
+                user=user,
+                kind=kind,
+                idempotency_key=idempotency_key,
+                params=params or {},
+                files=files,
+            )
+    except IntegrityError:
+        # Lost a race with an identical submit
+        return AnalysisJob.objects.get(user=user, idempotency_key=idempotency_key), False
+    return job, True
+
+
+def claim_next_job(worker_id: str):
+    """Atomically move the oldest queued job to running; None when the queue is empty."""
+    candidates = (
+        AnalysisJob.objects.filter(status="queued")
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:10]
+    )
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = AnalysisJob.objects.filter(pk=job_id, status="queued").update(
+            status="running",
+            worker_id=worker_id,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return AnalysisJob.objects.get(pk=job_id)
+    return None
+
+
+def _owned(job):
+    """The job row while this worker's claim on it still holds."""
+    return AnalysisJob.objects.filter(pk=job.pk, status="running", worker_id=job.worker_id)
+
+
+def ensure_owned(job):
+    """Raise JobLost if requeue_stale_jobs gave the job away; call before side effects."""
+    if not _owned(job).exists():
+        raise JobLost(f"Job {job.pk} is no longer owned by {job.worker_id}")
+
+
+def update_progress(job, done: int, total: int, message: str = ""):
+    """Cheap single-row UPDATE; also serves as the worker heartbeat."""
+    job.progress_done, job.progress_total, job.progress_message = done, total, message[:255]
+    _owned(job).update(
+        progress_done=done,
+        progress_total=total,
+        progress_message=message[:255],
+        heartbeat_at=timezone.now(),
+    )
+
+
+def requeue_stale_jobs() -> int:
+    """Jobs whose worker stopped heart-beating go back to the queue (or fail after max attempts)."""
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_SECONDS)
+    stale = AnalysisJob.objects.filter(status="running", heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=JOB_MAX_ATTEMPTS).update(
+        status="failed", error="Worker stopped responding.", finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=JOB_MAX_ATTEMPTS).update(status="queued", worker_id="")
+    if failed or requeued:
+        log.warning("Stale jobs: %s requeued, %s failed", requeued, failed)
+    return requeued
+
+
+@contextmanager
+def heartbeat(job, interval=JOB_HEARTBEAT_SECONDS):
+    """
+    Keep heartbeat_at fresh from a side thread while the handler runs, so one
+    long vision or GPT call does not look like a dead worker to requeue_stale_jobs.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                _owned(job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()  # the thread's own connection
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Run the handler for job.kind and record the outcome on the row.
+
+    The outcome is only written while the row is still running under this
+    worker: if it was requeued meanwhile, the new owner's run wins.
+    """
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        with heartbeat(job):
+            result = handler(job)
+    except JobLost:
+        log.warning("Job %s was requeued while %s ran it; stopped", job.pk, job.worker_id)
+        return False
+    except Exception as e:
+        if isinstance(e, FreeChatLimitExceeded):
+            log.info("Job %s (%s) stopped: free chat limit reached", job.pk, job.kind)
+        else:
+            log.exception("Job %s (%s) failed", job.pk, job.kind)
+        _owned(job).update(status="failed", error=str(e)[:2000], finished_at=timezone.now())
+        return False
+
+    finished = _owned(job).update(
+        status="succeeded",
+        result=result,
+        error="",
+        progress_done=F("progress_total"),
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        log.warning("Job %s was requeued while %s ran it; result dropped", job.pk, job.worker_id)
+    return bool(finished)
+
+
+# =============================
+# Handlers
+# =============================
+
+def _extract_text_from_path(path: Path, tone: str, lang: str, sha256: str = None) -> str:
+    from .extraction import PDF_SCAN_MAX_PAGES, extract_document
+
+    # Same EXTRACT_* budgets as the request path; scanned PDF pages go through
+    # vision with the job's batch size and timeout, and more of them than a request may
+    extraction = extract_document(
+        path, path.name, tone=tone, lang=lang, digest=sha256, max_scan_pages=PDF_SCAN_MAX_PAGES,
+        max_per_batch=JOB_IMAGE_BATCH_SIZE, timeout=JOB_VISION_TIMEOUT,
+    )
+    return extraction.text
+
+
+def _run_file_analysis(job):
+    """
+    Analyze the job's files: images together in vision batches, documents one by one.
+    Progress is one step per image batch plus one per document.
+    """
+    from . import views as v
+    from .suggestions import attach_suggestions, get_suggestions
+
+    params = job.params or {}
+    user = job.user
+    tone = v.normalize_tone(params.get("tone") or "PlainClinical")
+    lang = params.get("lang") or "en-US"
+    care_setting = v.norm_setting(params.get("care_setting"))
+    base_prompt = v.get_system_prompt(tone)
+    system_prompt = v.get_setting_prompt(base_prompt, care_setting) if tone == "Clinical" else base_prompt
+    system_prompt = v._add_language_instruction(system_prompt, lang)
+
+    if job.kind == "chat_files":
+        # Checked again here: the free turns may have been used up while the job was queued
+        limit_message = free_chat_limit_message(user, params.get("session_id"))
+        if limit_message:
+            raise FreeChatLimitExceeded(limit_message)
+
+    media_root = Path(settings.MEDIA_ROOT)
+    images, docs = [], []
+    for f in job.files:
+        entry = (f["name"], media_root / f["path"], f.get("sha256"))
+        (images if f["name"].lower().endswith(v.ALLOWED_IMAGE_EXTS) else docs).append(entry)
+
+    image_steps = math.ceil(len(images) / JOB_IMAGE_BATCH_SIZE) if images else 0
+    total = image_steps + len(docs)
+    update_progress(job, 0, total, "Starting analysis")
+
+    sections, records = [], []
+
+    if images:
+        def on_batch(done, batches):
+            update_progress(job, done, total, f"Analyzed image batch {done} of {batches}")
+
+        def analyze():
+            return v.extract_contextual_medical_insights_from_multiple_images(
+                [str(p) for _, p, _ in images], tone=tone, lang=lang,
+                max_per_batch=JOB_IMAGE_BATCH_SIZE, on_batch=on_batch, timeout=JOB_VISION_TIMEOUT,
+            )
+
+        digests = [sha256 for _, _, sha256 in images]
+        if all(digests):
+            summary = v._cached_by_digest("vision", digests, f"{tone}|{lang}|batch{JOB_IMAGE_BATCH_SIZE}", analyze)
+        else:
+            summary = analyze()  # queued before files carried a sha256: no cache key
+        names = ", ".join(name for name, _, _ in images)
+        sections.append(f"{names}\n{summary}")
+        if user:
+            ensure_owned(job)
+            records.append(MedicalSummary.objects.create(
+                user=user,
+                uploaded_filename=names[:255],
+                tone=tone,
+                raw_text="(Image files via background analysis)",
+                summary=summary,
+                care_setting=care_setting,
+            ))
+
+    for i, (name, path, sha256) in enumerate(docs, 1):
+        raw_text = _extract_text_from_path(path, tone, lang, sha256)
+        summary = v.summarize_text_block(raw_text, system_prompt)
+        sections.append(f"{name}\n{summary}")
+        if user:
+            ensure_owned(job)
+            records.append(MedicalSummary.objects.create(
+                user=user,
+                uploaded_filename=name,
+                tone=tone,
+                raw_text=raw_text,
+                summary=summary,
+                care_setting=care_setting,
+            ))
+        update_progress(job, image_steps + i, total, f"Summarized {name}"[:255])
+
+    combined = "\n\n".join(sections).strip()
+    if not combined:
+        raise ValueError("No readable content in the attached files.")
+
+    if job.kind == "chat_files":
+        return _finish_chat_files(job, combined, tone, lang, system_prompt)
+
+    ensure_owned(job)
+    if len(records) == 1:
+        suggestions = attach_suggestions(records[0], lang)
+    else:
+        suggestions = get_suggestions(combined, tone, lang)
+    return {
+        "summary": combined,
+        "suggestions": suggestions,
+        "summary_ids": [r.pk for r in records],
+    }
+
+
+def _finish_chat_files(job, combined, tone, lang, system_prompt):
+    """Append the attachment analysis (and optional question) to the chat session, like send_chat."""
+    from . import views as v
+
+    params = job.params or {}
+    message = (params.get("message") or "").strip()
+    reply = combined
+    if message:
+        reply = v.client.chat.completions.create(
+            model="gpt-4o",
+            temperature=0.5,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"(Here’s the latest medical context):\n{combined}"},
+                {"role": "user", "content": message},
+            ],
+            timeout=JOB_VISION_TIMEOUT,
+        ).choices[0].message.content.strip()
+
+    session_id = None
+    if job.user:
+        ensure_owned(job)
+        session_obj, _ = v._ensure_session_for_user(
+            job.user, tone, lang,
+            first_user_msg=message or "[attachments]",
+            session_id=params.get("session_id"),
+        )
+        msgs = session_obj.messages or []
+        if not msgs:
+            msgs.append({"role": "system", "content": system_prompt, "ts": v._now_iso()})
+        msgs.append({
+            "role": "user",
+            "content": f"(Here’s the latest medical context):\n{combined}",
+            "ts": v._now_iso(),
+            "meta": {"context": "files", "job_id": job.pk},
+        })
+        msgs.append({"role": "user", "content": message or "(New attachments uploaded)", "ts": v._now_iso(),
+                     "meta": {"has_files": True}})
+        msgs.append({"role": "assistant", "content": reply, "ts": v._now_iso()})
+        session_obj.messages = v._trim_history(msgs, keep=200)
+        session_obj.updated_at = timezone.now()
+        session_obj.save(update_fields=["messages", "updated_at"])
+        session_id = session_obj.id
+
+    return {"reply": reply, "session_id": session_id}
+
+
+def _run_purge_chat_history(job):
+    from .purge import purge_chat_history
+
+    if job.user is None:
+        return {"chat_sessions_deleted": 0}
+    update_progress(job, 0, 0, "Deleting chat history")
+    return purge_chat_history(
+        job.user,
+        max_id=(job.params or {}).get("max_id"),
+        on_progress=lambda done, total: update_progress(job, done, total, f"Deleted {done} of {total} chats"),
+    )
+
+
+def _run_purge_account(job):
+    from .purge import purge_account
+
+    # job.user is set to NULL when the account row goes; params keep the id for a retry
+    user_id = (job.params or {}).get("user_id") or job.user_id
+    update_progress(job, 0, 0, "Deleting account data")
+    return purge_account(
+        user_id,
+        on_progress=lambda done, total: update_progress(job, done, total, f"Deleted {done} of {total} records"),
+    )
+
+
+def submit_purge_job(user, kind, params=None):
+    """Queue a purge unless one of the same kind is already pending for this user. Returns (job, created)."""
+    pending = AnalysisJob.objects.filter(user=user, kind=kind, status__in=("queued", "running")).first()
+    if pending:
+        return pending, False
+    return submit_job(user, kind, params=params)
+
+
+JOB_HANDLERS = {
+    "summarize": _run_file_analysis,
+    "chat_files": _run_file_analysis,
+    "purge_chat_history": _run_purge_chat_history,
+    "purge_account": _run_purge_account,
+}
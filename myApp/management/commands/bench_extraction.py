@@ -0,0 +1,108 @@
+"""
+Management command to benchmark document extraction.
+
+Compares the streaming extractor (myApp/extraction.py) with a python-docx
+baseline on DOCX files, and reports extraction stats for PDF/TXT. Reports
+wall time, peak Python memory (tracemalloc) and characters extracted.
+Without paths it generates a large DOCX (paragraphs plus lab-style tables).
+"""
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myApp.extraction import DEFAULT_BUDGET, ExtractionBudget, extract_document
+
+DOC_EXTS = (".pdf", ".docx", ".txt")
+
+
+def _python_docx_text(path):
+    """Old approach: full object model, paragraphs plus tables read back through it."""
+    import docx
+
+    doc = docx.Document(str(path))
+    parts = [p.text for p in doc.paragraphs if p.text.strip()]
+    for table in doc.tables:
+        for row in table.rows:
+            parts.append("\t".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+
+def _measure(fn, repeat):
+    timings, peak, result = [], 0, None
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(timings), peak, result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark streaming document extraction against python-docx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='PDF/DOCX/TXT files (default: a generated DOCX)')
+        parser.add_argument('--sections', type=int, default=300,
+                            help='Sections in the generated DOCX, each a paragraph and a 12-row table (default: 300)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per file (default: 3)')
+        parser.add_argument('--max-chars', type=int, default=None,
+                            help=f'Character budget (default: EXTRACT_MAX_CHARS = {DEFAULT_BUDGET.max_chars})')
+        parser.add_argument('--skip-baseline', action='store_true', help='Do not run python-docx')
+
+    def _generate_docx(self, sections):
+        import docx
+
+        doc = docx.Document()
+        for i in range(sections):
+            doc.add_paragraph(f"Visit {i + 1}: follow-up for hypertension and type 2 diabetes. " * 3)
+            table = doc.add_table(rows=12, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = ("Test", "Result", "Units", "Range")[c] if r == 0 else f"{c}.{r}-{i}"
+        fh = tempfile.NamedTemporaryFile(suffix=".docx", delete=False)
+        fh.close()
+        doc.save(fh.name)
+        return Path(fh.name)
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        budget = DEFAULT_BUDGET
+        if options['max_chars']:
+            budget = ExtractionBudget(budget.max_bytes, budget.max_pages, options['max_chars'])
+
+        generated = None
+        paths = [Path(p) for p in options['paths']]
+        if not paths:
+            self.stdout.write(f'Generating a DOCX with {options["sections"]} sections...')
+            generated = paths = [self._generate_docx(options['sections'])]
+        missing = [p for p in paths if not p.is_file() or p.suffix.lower() not in DOC_EXTS]
+        if missing:
+            raise CommandError(f'Not a PDF/DOCX/TXT file: {", ".join(map(str, missing))}')
+
+        self.stdout.write(f'{"file":<32} {"method":<12} {"ms":>9} {"peak KB":>10} {"chars":>10}  stats')
+        try:
+            for path in paths:
+                name = path.name[-32:]
+                size_kb = path.stat().st_size / 1024
+                ms, peak, extraction = _measure(lambda: extract_document(path, path.name, budget=budget), repeat)
+                stats = extraction.stats.as_dict()
+                self.stdout.write(
+                    f'{name:<32} {"streaming":<12} {ms:>9.1f} {peak / 1024:>10.0f} {stats["chars"]:>10}  '
+                    f'{size_kb:.0f} KB, pages {stats["pages_read"]}/{stats["pages_total"]}, '
+                    f'truncated={stats["truncated_by"] or "no"}'
+                )
+                if path.suffix.lower() == ".docx" and not options['skip_baseline']:
+                    ms, peak, text = _measure(lambda: _python_docx_text(path), repeat)
+                    self.stdout.write(f'{name:<32} {"python-docx":<12} {ms:>9.1f} {peak / 1024:>10.0f} {len(text):>10}')
+        finally:
+            if generated:
+                for p in generated:
+                    p.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS('Done (ms is the median of --repeat runs).'))
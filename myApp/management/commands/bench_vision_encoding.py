@@ -0,0 +1,108 @@
+"""
+Management command to compare vision encoding profiles on sample images.
+
+For each profile reports encode time, payload size (base64, as sent) and, with
+--live, the round-trip latency of a short vision request using that payload.
+Without paths it samples images already stored under MEDIA_ROOT/user_media.
+"""
+import base64
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myApp.image_pipeline import ENCODING_PROFILES, encode_for_vision
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif")
+
+
+class Command(BaseCommand):
+    help = 'Benchmark vision encoding profiles: encode time, payload bytes, optional API latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Image files or directories (default: user media)')
+        parser.add_argument(
+            '--profiles',
+            default=','.join(['auto', *ENCODING_PROFILES]),
+            help='Comma-separated profile names (default: all, plus auto)',
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Maximum number of images (default: 20)')
+        parser.add_argument('--repeat', type=int, default=3, help='Encodes per image and profile (default: 3)')
+        parser.add_argument(
+            '--live',
+            action='store_true',
+            help='Also send each payload to the vision model and time the response (costs API calls)',
+        )
+        parser.add_argument('--model', default='gpt-4o', help='Model for --live (default: gpt-4o)')
+
+    def _collect(self, paths, limit):
+        if not paths:
+            paths = [Path(settings.MEDIA_ROOT) / getattr(settings, "USER_MEDIA_SUBDIR", "user_media")]
+        found = []
+        for raw in paths:
+            path = Path(raw)
+            candidates = path.rglob("*") if path.is_dir() else [path]
+            for p in sorted(candidates):
+                if p.is_file() and p.suffix.lower() in IMAGE_EXTS and not p.name.startswith(".incoming-"):
+                    found.append(p)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    def _live_latency(self, client, model, encoded):
+        data_uri = f"data:{encoded.mime};base64,{base64.b64encode(encoded.data).decode()}"
+        started = time.perf_counter()
+        client.chat.completions.create(
+            model=model,
+            max_tokens=20,
+            messages=[{"role": "user", "content": [
+                {"type": "text", "text": "In five words, what kind of medical image is this?"},
+                {"type": "image_url", "image_url": {"url": data_uri}},
+            ]}],
+        )
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        images = self._collect(options['paths'], options['limit'])
+        if not images:
+            raise CommandError('No images found. Pass image files or directories.')
+        profiles = [p.strip() for p in options['profiles'].split(',') if p.strip()]
+        repeat = max(1, options['repeat'])
+
+        client = None
+        if options['live']:
+            from myApp.views import client
+
+        self.stdout.write(f'{len(images)} images, {repeat} encodes each\n')
+        header = f'{"profile":<10} {"encode ms":>10} {"payload KB":>11} {"vs legacy":>10}'
+        if client:
+            header += f' {"api s":>8}'
+        self.stdout.write(header)
+
+        results = {}
+        for name in profiles:
+            timings, sizes, latencies, picked = [], [], [], set()
+            for path in images:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    encoded = encode_for_vision(path, name)
+                    timings.append((time.perf_counter() - started) * 1000)
+                sizes.append(4 * ((len(encoded.data) + 2) // 3))  # base64 length
+                picked.add(encoded.profile)
+                if client:
+                    latencies.append(self._live_latency(client, options['model'], encoded))
+            results[name] = (statistics.median(timings), statistics.mean(sizes), latencies, picked)
+
+        legacy_size = results.get("legacy", (None, None))[1]
+        for name, (encode_ms, size, latencies, picked) in results.items():
+            ratio = f'{size / legacy_size:>9.0%}' if legacy_size else f'{"-":>9}'
+            line = f'{name:<10} {encode_ms:>10.1f} {size / 1024:>11.1f} {ratio:>10}'
+            if latencies:
+                line += f' {statistics.median(latencies):>8.2f}'
+            if name == "auto":
+                line += f'  ({", ".join(sorted(picked))})'
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS('Done (encode ms and api s are medians, payload KB is the mean).'))
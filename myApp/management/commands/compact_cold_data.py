@@ -0,0 +1,117 @@
+"""
+Management command to move cold data into compressed storage.
+
+MedicalSummary.raw_text of old summaries and ChatSession.messages of idle
+sessions are compressed into their *_archive column and the inline column is
+blanked; reads decompress transparently (see myApp/cold_storage.py).
+
+A row is cold when it is older than --days AND older than the user's plan
+history window (billing_utils.get_history_days), so anything a user can still
+browse in their history stays inline. Rows are processed per user in small
+keyset batches, one short transaction per batch.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myApp.billing_utils import get_history_days
+from myApp.cold_storage import compact_rows
+from myApp.models import ChatSession, MedicalSummary
+
+User = get_user_model()
+
+# (model, label, age field, inline field, archive field, empty value, is_json)
+TARGETS = {
+    "summaries": (MedicalSummary, "summaries", "created_at", "raw_text", "raw_text_archive", "", False),
+    "sessions": (ChatSession, "chat sessions", "updated_at", "messages", "messages_archive", [], True),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compress raw_text of old summaries and messages of idle chat sessions into cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, "COLD_STORAGE_IDLE_DAYS", 90),
+            help='Minimum age/idle time in days (default: COLD_STORAGE_IDLE_DAYS = 90)',
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows per transaction (default: 200)')
+        parser.add_argument(
+            '--min-bytes',
+            type=int,
+            default=2048,
+            help='Skip values smaller than this; they are cheap to keep inline (default: 2048)',
+        )
+        parser.add_argument('--only', choices=sorted(TARGETS), help='Compact only summaries or only sessions')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Measure what would be compacted without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = max(1, options['batch_size'])
+        self.min_bytes = options['min_bytes']
+        base_days = options['days']
+        now = timezone.now()
+        base_cutoff = now - timedelta(days=base_days)
+        targets = [TARGETS[options['only']]] if options['only'] else list(TARGETS.values())
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN - No rows will be changed'))
+
+        for model, label, age_field, field, archive_field, empty, is_json in targets:
+            user_ids = (
+                model.objects.filter(**{f"{age_field}__lt": base_cutoff}, compacted_at__isnull=True)
+                .values_list("user_id", flat=True)
+                .distinct()
+            )
+            totals = {"rows": 0, "before": 0, "after": 0}
+            for user in User.objects.filter(pk__in=list(user_ids)).select_related("profile").iterator():
+                history_days = get_history_days(user)
+                cutoff = now - timedelta(days=max(base_days, history_days or 0))
+                rows, before, after = self._compact_user(
+                    model, user.pk, cutoff, now, age_field, field, archive_field, empty, is_json,
+                )
+                totals["rows"] += rows
+                totals["before"] += before
+                totals["after"] += after
+
+            reclaimed = totals["before"] - totals["after"]
+            verb = 'Would compact' if self.dry_run else 'Compacted'
+            self.stdout.write(self.style.SUCCESS(
+                f'{verb} {totals["rows"]} {label}: {totals["before"] / 1024:.0f} KB → '
+                f'{totals["after"] / 1024:.0f} KB ({reclaimed / 1024:.0f} KB reclaimed)'
+            ))
+
+    def _compact_user(self, model, user_id, cutoff, now, age_field, field, archive_field, empty, is_json):
+        rows = before = after = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(
+                    user_id=user_id,
+                    pk__gt=last_pk,
+                    compacted_at__isnull=True,
+                    **{f"{age_field}__lt": cutoff},
+                )
+                .order_by("pk")
+                .values_list("pk", field, age_field)[:self.batch_size]
+            )
+            if not batch:
+                return rows, before, after
+            last_pk = batch[-1][0]
+
+            compacted, batch_before, batch_after = compact_rows(
+                model, batch, field, archive_field, age_field, empty, is_json, now,
+                min_bytes=self.min_bytes, dry_run=self.dry_run,
+            )
+            rows += compacted
+            before += batch_before
+            after += batch_after
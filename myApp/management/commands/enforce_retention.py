@@ -0,0 +1,239 @@
+"""
+Management command that enforces data retention (policy in myApp/retention.py).
+
+Walks users in keyset order and, per user, deletes data past their own
+retention preference and archives or deletes data past their plan's history
+window. Old analytics rows are deleted afterwards. Every change runs in
+batches of --batch-size primary keys (pk > last seen pk), each in its own
+short transaction, so no long locks are held and the command can be stopped
+and restarted at any time. Use --loop to keep it running.
+
+Archive mode marks expired chats archived and compresses their messages and
+the raw_text of expired summaries (see cold_storage.py). Uploaded media is
+only removed in delete mode. Resumable uploads abandoned for
+UPLOAD_EXPIRY_HOURS are dropped for all users, in either mode.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from myApp.cold_storage import compact_rows
+from myApp.models import (
+    AnalysisJob, AnalysisRun, ChatSession, ChatSessionTombstone, Event, MedicalSummary, PageView, Session,
+    UserMediaFile, UserSignin, Visitor,
+)
+from myApp.retention import ANALYTICS_RETENTION_DAYS, CHAT_TOMBSTONE_DAYS, RETENTION_MODES, user_cutoffs
+from myApp.uploads import expire_uploads, stale_uploads
+
+log = logging.getLogger(__name__)
+User = get_user_model()
+
+PROGRESS_EVERY = 10.0  # seconds between progress lines
+
+
+class Command(BaseCommand):
+    help = 'Delete or archive data past each user\'s retention window, in small keyset batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=RETENTION_MODES,
+            default=getattr(settings, "RETENTION_MODE", "archive"),
+            help='What to do with data past the plan history window (default: RETENTION_MODE = archive). '
+                 'Data past a user\'s own retention preference is always deleted.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per transaction (default: 500)')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches (default: 0)')
+        parser.add_argument('--skip-analytics', action='store_true', help='Leave analytics tables alone')
+        parser.add_argument('--loop', action='store_true', help='Run forever, one pass every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0, help='Seconds between passes with --loop')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count what would be deleted or archived without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        self.mode = options['mode']
+        self.batch_size = max(1, options['batch_size'])
+        self.pause = max(0.0, options['sleep'])
+        self.dry_run = options['dry_run']
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN - Nothing will be deleted or archived'))
+
+        try:
+            while True:
+                close_old_connections()
+                self._run_pass(skip_analytics=options['skip_analytics'])
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted.')
+
+    # ---------- pass
+
+    def _run_pass(self, skip_analytics):
+        self.metrics = Counter()
+        self.started = self.last_report = time.monotonic()
+        now = timezone.now()
+
+        last_user = 0
+        while True:
+            users = list(
+                User.objects.filter(pk__gt=last_user).select_related("profile").order_by("pk")[:200]
+            )
+            if not users:
+                break
+            last_user = users[-1].pk
+            for user in users:
+                self.metrics["users_checked"] += 1
+                delete_before, expire_before = user_cutoffs(user, now)
+                if delete_before:
+                    self._delete_user_data(user, delete_before)
+                if expire_before and (delete_before is None or expire_before > delete_before):
+                    if self.mode == "delete":
+                        self._delete_user_data(user, expire_before)
+                    else:
+                        self._archive_user_data(user, expire_before, now)
+
+        # Users who never start another upload would otherwise keep their part files forever
+        for pks in self._keyset(stale_uploads()):
+            expired = len(pks) if self.dry_run else expire_uploads(pks=pks)
+            self._count("chunked_uploads_deleted", expired)
+
+        if not skip_analytics:
+            cutoff = now - timedelta(days=ANALYTICS_RETENTION_DAYS)
+            # Children before Visitor so each batch deletes few cascaded rows
+            self._delete_batches("events", Event.objects.filter(created_at__lt=cutoff))
+            self._delete_batches("page_views", PageView.objects.filter(created_at__lt=cutoff))
+            self._delete_batches("analytics_sessions", Session.objects.filter(started_at__lt=cutoff))
+            self._delete_batches("visitors", Visitor.objects.filter(created_at__lt=cutoff))
+            self._delete_batches("signins", UserSignin.objects.filter(created_at__lt=cutoff))
+            self._delete_batches(
+                "chat_tombstones",
+                ChatSessionTombstone.objects.filter(deleted_at__lt=now - timedelta(days=CHAT_TOMBSTONE_DAYS)),
+            )
+
+        self._report(final=True)
+
+    # ---------- per-user work
+
+    def _delete_user_data(self, user, before):
+        self._delete_batches(
+            # created_at, like the rows below: archiving and syncing move updated_at
+            "chat_sessions", ChatSession.objects.filter(user=user, created_at__lt=before),
+            on_batch=lambda pks: ChatSessionTombstone.record(user.pk, pks),
+        )
+        self._delete_batches("summaries", MedicalSummary.objects.filter(user=user, created_at__lt=before))
+        self._delete_batches("analysis_runs", AnalysisRun.objects.filter(user=user, created_at__lt=before))
+        self._delete_batches(
+            "jobs", AnalysisJob.objects.filter(user=user, created_at__lt=before, status__in=("succeeded", "failed")),
+        )
+        self._delete_media(user, before)
+
+    def _archive_user_data(self, user, before, now):
+        sessions = ChatSession.objects.filter(user=user, updated_at__lt=before, archived=False)
+        for pks in self._keyset(sessions):
+            # Compress first: the conditional UPDATE matches on the unchanged row
+            rows = ChatSession.objects.filter(pk__in=pks, compacted_at__isnull=True).values_list(
+                "pk", "messages", "updated_at"
+            )
+            compacted, before_bytes, after_bytes = compact_rows(
+                ChatSession, list(rows), "messages", "messages_archive", "updated_at", [], True, now,
+                dry_run=self.dry_run,
+            )
+            if not self.dry_run:
+                # updated_at stays put (it is the idle clock); delta sync learns of the archive from a change row
+                archived = list(
+                    ChatSession.objects.filter(pk__in=pks, archived=False).values_list("pk", flat=True)
+                )
+                ChatSession.objects.filter(pk__in=archived).update(archived=True)
+                ChatSessionTombstone.record(user.pk, archived, kind="archived")
+            self._count("chat_sessions_archived", len(pks), reclaimed=before_bytes - after_bytes)
+
+        summaries = MedicalSummary.objects.filter(user=user, created_at__lt=before, compacted_at__isnull=True)
+        for pks in self._keyset(summaries):
+            rows = MedicalSummary.objects.filter(pk__in=pks).values_list("pk", "raw_text", "created_at")
+            compacted, before_bytes, after_bytes = compact_rows(
+                MedicalSummary, list(rows), "raw_text", "raw_text_archive", "created_at", "", False, now,
+                dry_run=self.dry_run,
+            )
+            self._count("summaries_archived", compacted, reclaimed=before_bytes - after_bytes)
+
+    def _delete_media(self, user, before):
+        media_root = Path(settings.MEDIA_ROOT)
+        for pks in self._keyset(UserMediaFile.objects.filter(user=user, created_at__lt=before)):
+            paths = set(UserMediaFile.objects.filter(pk__in=pks).values_list("stored_path", flat=True))
+            if self.dry_run:
+                self._count("media_deleted", len(pks))
+                continue
+            with transaction.atomic():
+                UserMediaFile.objects.filter(pk__in=pks).delete()
+            # Content-addressed files can back several index rows; keep those still referenced
+            still_used = set(
+                UserMediaFile.objects.filter(user=user, stored_path__in=paths).values_list("stored_path", flat=True)
+            )
+            freed = 0
+            for rel in paths - still_used:
+                path = media_root / rel
+                try:
+                    freed += path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    log.warning("Retention: could not delete %s", path, exc_info=True)
+            self._count("media_deleted", len(pks), reclaimed=freed)
+
+    # ---------- batching
+
+    def _keyset(self, queryset):
+        """Yield lists of at most batch_size pks, ascending, resuming after the last pk seen."""
+        last_pk = 0
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:self.batch_size])
+            if not pks:
+                return
+            last_pk = pks[-1]
+            yield pks
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _delete_batches(self, label, queryset, on_batch=None):
+        model = queryset.model
+        for pks in self._keyset(queryset):
+            if not self.dry_run:
+                with transaction.atomic():
+                    model.objects.filter(pk__in=pks).delete()
+                    if on_batch:
+                        on_batch(pks)
+            self._count(f"{label}_deleted", len(pks))
+
+    # ---------- metrics
+
+    def _count(self, key, n, reclaimed=0):
+        self.metrics[key] += n
+        self.metrics["batches"] += 1
+        if reclaimed:
+            self.metrics["bytes_reclaimed"] += reclaimed
+        if time.monotonic() - self.last_report >= PROGRESS_EVERY:
+            self._report()
+
+    def _report(self, final=False):
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.started
+        rows = sum(v for k, v in self.metrics.items() if k.endswith(("_deleted", "_archived")))
+        parts = ", ".join(f"{k}={v}" for k, v in sorted(self.metrics.items()))
+        line = f'{"Done" if final else "Progress"} in {elapsed:.0f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): {parts or "nothing to do"}'
+        log.info("Retention %s: %s", "pass complete" if final else "progress", dict(self.metrics))
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
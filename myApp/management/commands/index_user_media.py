@@ -0,0 +1,105 @@
+"""
+Management command to backfill UserMediaFile rows for files already on disk.
+
+New uploads are indexed when they are stored; this walks MEDIA_ROOT/user_media/
+once for files saved before the index existed. Legacy copies were named
+"<stem>-<6 hex>.<ext>", so the display name is recovered by dropping that suffix.
+"""
+import hashlib
+import re
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from myApp.models import UserMediaFile
+
+User = get_user_model()
+
+LEGACY_NAME_RE = re.compile(r"^(?P<stem>.+)-[0-9a-f]{6}(?P<ext>\.[A-Za-z0-9]+)$")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Backfill UserMediaFile rows for existing files under MEDIA_ROOT/user_media'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be indexed without creating records',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        subdir = getattr(settings, "USER_MEDIA_SUBDIR", "user_media")
+        root = Path(settings.MEDIA_ROOT) / subdir
+        if not root.exists():
+            self.stdout.write(self.style.SUCCESS(f'Nothing to index: {root} does not exist.'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN - No records will be created'))
+
+        user_ids = set(User.objects.values_list("id", flat=True))
+        created = skipped = 0
+
+        for user_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+            if not user_dir.name.isdigit() or int(user_dir.name) not in user_ids:
+                continue
+            user_id = int(user_dir.name)
+            known = set(
+                UserMediaFile.objects.filter(user_id=user_id).values_list("stored_path", flat=True)
+            )
+
+            for path in user_dir.rglob("*"):
+                if not path.is_file() or path.name.startswith(".incoming-"):
+                    continue
+                rel = path.relative_to(settings.MEDIA_ROOT).as_posix()
+                if rel in known or "cas" in path.relative_to(user_dir).parts:
+                    # Content-addressed files are indexed at upload time
+                    skipped += 1
+                    continue
+
+                match = LEGACY_NAME_RE.match(path.name)
+                display_name = f"{match['stem']}{match['ext']}" if match else path.name
+
+                if dry_run:
+                    self.stdout.write(f'  Would index {rel} as "{display_name}"')
+                    created += 1
+                    continue
+
+                stat = path.stat()
+                # Keyed like _index_user_media: identical legacy copies ("scan-aaaaaa.png",
+                # "scan-bbbbbb.png") share one row, pointing at the newest copy.
+                mtime = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+                row, was_created = UserMediaFile.objects.get_or_create(
+                    user_id=user_id,
+                    display_name_lower=display_name.lower()[:255],
+                    sha256=_sha256(path),
+                    defaults={
+                        "display_name": display_name[:255],
+                        "stored_path": rel,
+                        "size": stat.st_size,
+                    },
+                )
+                if was_created or row.created_at < mtime:
+                    # created_at is auto_now_add; use the file's age so names resolve to the newest copy
+                    UserMediaFile.objects.filter(pk=row.pk).update(stored_path=rel, created_at=mtime)
+                if was_created:
+                    created += 1
+                else:
+                    skipped += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {created} files ({skipped} already indexed or skipped).')
+        )
@@ -0,0 +1,42 @@
+"""
+Management command to build AnalyticsDailyRollup rows (see myApp/analytics_rollups.py).
+
+Run it daily (e.g. shortly after midnight) so analytics exports read finished
+days from the rollup table. By default it builds every day of the last --days
+that has no rollup or only a partial one (taken before the day ended); --force
+recomputes every day in the window, e.g. after backfill_analytics.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myApp.analytics_rollups import is_final, rollup_day
+from myApp.models import AnalyticsDailyRollup
+
+
+class Command(BaseCommand):
+    help = 'Aggregate daily analytics into AnalyticsDailyRollup rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='How many days back to check (default: 30)')
+        parser.add_argument('--force', action='store_true', help='Recompute days that already have a rollup')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = today - timedelta(days=max(0, options['days']))
+        final = {r.date for r in AnalyticsDailyRollup.objects.filter(date__gte=start) if is_final(r)}
+
+        built = 0
+        day = start
+        while day <= today:
+            if options['force'] or day not in final:
+                rollup = rollup_day(day)
+                built += 1
+                self.stdout.write(
+                    f'{day}: {rollup.unique_visitors} visitors, {rollup.page_views} page views, '
+                    f'{rollup.signups} signups, {rollup.signins} signins'
+                )
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {built} day(s).'))
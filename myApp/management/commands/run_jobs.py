@@ -0,0 +1,70 @@
+"""
+Management command that runs the background job worker.
+
+Polls the AnalysisJob table, claims one queued job at a time and runs it.
+Needs only the database — no broker. Run several copies for more throughput.
+"""
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myApp.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run the background analysis job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process queued jobs until the queue is empty, then exit',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the queue is empty (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"[:64]
+        once = options['once']
+        poll_interval = options['poll_interval']
+        processed = failed = 0
+
+        self.stdout.write(f'Job worker {worker_id} started.')
+        last_stale_check = 0.0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - last_stale_check > 60:
+                    requeue_stale_jobs()
+                    last_stale_check = time.monotonic()
+
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f'Running {job.kind} job #{job.pk}...')
+                started = time.monotonic()
+                ok = run_job(job)
+                processed += 1
+                elapsed = time.monotonic() - started
+                if ok:
+                    self.stdout.write(self.style.SUCCESS(f'  Job #{job.pk} done in {elapsed:.1f}s'))
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'  Job #{job.pk} failed after {elapsed:.1f}s'))
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted.')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Worker stopped: {processed} jobs processed, {failed} failed.')
+        )
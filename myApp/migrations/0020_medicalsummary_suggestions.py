@@ -0,0 +1,32 @@
+# Generated manually for stored smart suggestions
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0019_create_interaction_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='summary_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='suggestions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='suggestions_lang',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='medicalsummary',
+            index=models.Index(fields=['user', 'summary_hash'], name='summary_user_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated manually for the per-user media index
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('myApp', '0021_analysisjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('display_name', models.CharField(max_length=255)),
+                ('display_name_lower', models.CharField(max_length=255)),
+                ('stored_path', models.CharField(help_text='Relative to MEDIA_ROOT', max_length=512)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_files', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [
+                    models.Index(fields=['user', 'display_name_lower'], name='media_user_name_idx'),
+                    models.Index(fields=['user', 'sha256'], name='media_user_sha_idx'),
+                ],
+            },
+        ),
+    ]
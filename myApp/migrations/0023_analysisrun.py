@@ -0,0 +1,50 @@
+# Generated manually for deduplicated multi-image analysis storage
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('myApp', '0022_usermediafile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tone', models.CharField(max_length=50)),
+                ('lang', models.CharField(blank=True, default='en-US', max_length=10)),
+                ('care_setting', models.CharField(blank=True, default='', max_length=16)),
+                ('summary', models.TextField()),
+                ('file_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='analysis_runs', to='myApp.chatsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [
+                    models.Index(fields=['user', '-created_at'], name='run_user_created_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalysisRunFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('filename', models.CharField(max_length=255)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('size', models.BigIntegerField(default=0)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='myApp.analysisrun')),
+            ],
+            options={
+                'ordering': ['run', 'position'],
+            },
+        ),
+    ]
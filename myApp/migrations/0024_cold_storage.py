@@ -0,0 +1,33 @@
+# Generated manually for compressed cold storage of raw_text and idle chat messages
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0023_analysisrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='compacted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='messages_archive',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='compacted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='raw_text_archive',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
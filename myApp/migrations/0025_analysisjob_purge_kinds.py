@@ -0,0 +1,26 @@
+# Generated manually for background account deletion and chat history purge jobs
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0024_cold_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysisjob',
+            name='kind',
+            field=models.CharField(
+                choices=[
+                    ('summarize', 'Summarize files'),
+                    ('chat_files', 'Chat attachments'),
+                    ('purge_chat_history', 'Clear chat history'),
+                    ('purge_account', 'Delete account'),
+                ],
+                max_length=32,
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated manually for pre-aggregated daily analytics used by exports
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0025_analysisjob_purge_kinds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('unique_visitors', models.PositiveIntegerField(default=0)),
+                ('visitors', models.PositiveIntegerField(default=0)),
+                ('page_views', models.PositiveIntegerField(default=0)),
+                ('signups', models.PositiveIntegerField(default=0)),
+                ('signins', models.PositiveIntegerField(default=0)),
+                ('failed_signins', models.PositiveIntegerField(default=0)),
+                ('active_users', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('bounces', models.PositiveIntegerField(default=0)),
+                ('top_pages', models.JSONField(blank=True, default=list, help_text='[{path, views}] most viewed first')),
+                ('traffic_sources', models.JSONField(blank=True, default=dict, help_text='{source: visitors}')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Analytics Daily Rollup',
+                'verbose_name_plural': 'Analytics Daily Rollups',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
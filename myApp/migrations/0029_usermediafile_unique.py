@@ -0,0 +1,36 @@
+# Generated manually: one UserMediaFile row per user + display name + content
+
+from django.db import migrations, models
+
+
+def drop_duplicate_rows(apps, schema_editor):
+    UserMediaFile = apps.get_model('myApp', 'UserMediaFile')
+    keep = {}
+    duplicates = []
+    rows = UserMediaFile.objects.order_by('-created_at', '-pk').values_list(
+        'pk', 'user_id', 'display_name_lower', 'sha256'
+    )
+    for pk, *key in rows.iterator():
+        if tuple(key) in keep:
+            duplicates.append(pk)
+        else:
+            keep[tuple(key)] = pk
+    for i in range(0, len(duplicates), 1000):
+        UserMediaFile.objects.filter(pk__in=duplicates[i:i + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0028_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usermediafile',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'display_name_lower', 'sha256'), name='media_user_name_sha_uniq',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated manually: archive change rows for delta sync, and created_at-based retention
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0029_usermediafile_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsessiontombstone',
+            name='kind',
+            field=models.CharField(
+                choices=[('deleted', 'Deleted'), ('archived', 'Archived')], default='deleted', max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'created_at'], name='chat_user_created_idx'),
+        ),
+    ]
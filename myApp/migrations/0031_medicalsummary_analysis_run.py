@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:34
+# (plus a data step giving existing analysis runs their summary row)
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def summarize_existing_runs(apps, schema_editor):
+    # Runs stored before this migration had no MedicalSummary, so the dashboards missed them
+    AnalysisRun = apps.get_model('myApp', 'AnalysisRun')
+    MedicalSummary = apps.get_model('myApp', 'MedicalSummary')
+    runs = AnalysisRun.objects.filter(medical_summary__isnull=True).order_by('pk').prefetch_related('files')
+    for run in runs.iterator(chunk_size=500):
+        summary = MedicalSummary.objects.create(
+            user_id=run.user_id,
+            uploaded_filename=", ".join(f.filename for f in run.files.all())[:255],
+            tone=run.tone,
+            raw_text="(Image files via chat)",
+            summary=run.summary,
+            care_setting=run.care_setting or "hospital",
+            analysis_run=run,
+        )
+        # created_at is auto_now_add; list it when the run happened, not when this migration did
+        MedicalSummary.objects.filter(pk=summary.pk).update(created_at=run.created_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myApp', '0030_chat_archive_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalsummary',
+            name='analysis_run',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='medical_summary', to='myApp.analysisrun'),
+        ),
+        migrations.RunPython(summarize_existing_runs, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -66,7 +69,42 @@ LANGUAGE_CHOICES = [
         ('si-LK', 'Sinhala'),
     ]
 
-class MedicalSummary(models.Model):
+class ColdStorageMixin:
+    """
+    Transparent access to a column that compact_cold_data moved into compressed
+    bytes (see cold_storage.py): from_db() restores it, and saving the column
+    again stores it inline and drops the cold copy.
+    """
+    COLD_FIELD = ""          # e.g. "raw_text"
+    COLD_ARCHIVE_FIELD = ""  # e.g. "raw_text_archive"
+    COLD_IS_JSON = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        data = instance.__dict__
+        blob = data.get(cls.COLD_ARCHIVE_FIELD)
+        # An inline value wins: it was written after the row was compacted
+        if blob is not None and cls.COLD_FIELD in data and not data[cls.COLD_FIELD]:
+            from .cold_storage import load_json, load_text
+            data[cls.COLD_FIELD] = load_json(blob) if cls.COLD_IS_JSON else load_text(blob)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if self.__dict__.get("compacted_at") is not None and (
+            update_fields is None or self.COLD_FIELD in update_fields
+        ):
+            self.__dict__[self.COLD_ARCHIVE_FIELD] = None
+            self.compacted_at = None
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, self.COLD_ARCHIVE_FIELD, "compacted_at"}
+        super().save(*args, **kwargs)
+
+
+class MedicalSummary(ColdStorageMixin, models.Model):
+    COLD_FIELD, COLD_ARCHIVE_FIELD = "raw_text", "raw_text_archive"
+
     CARE_CHOICES = [
         ("hospital", "Hospital/Discharge"),
         ("ambulatory", "Ambulatory/Clinic"),
@@ -82,8 +120,25 @@ class MedicalSummary(models.Model):
     summary = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Follow-up questions generated once with the summary (see suggestions.py)
+    summary_hash = models.CharField(max_length=64, blank=True, default="")
+    suggestions = models.JSONField(default=list, blank=True)
+    suggestions_lang = models.CharField(max_length=10, blank=True, default="")
+
+    # raw_text moved to compressed cold storage by compact_cold_data (read transparently)
+    raw_text_archive = models.BinaryField(null=True, blank=True, editable=False)
+    compacted_at = models.DateTimeField(null=True, blank=True)
+
+    # Set on the one summary row of a multi-image analysis (files are listed on the run)
+    analysis_run = models.OneToOneField(
+        "AnalysisRun", on_delete=models.CASCADE, null=True, blank=True, related_name="medical_summary",
+    )
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["user", "summary_hash"], name="summary_user_hash_idx"),
+        ]
 
 
 from django.db import models
@@ -171,9 +226,22 @@ class Profile(models.Model):
 
     def __str__(self):
         return f"{self.display_name or self.user.username} Profile"
+
+    @classmethod
+    def for_user(cls, user):
+        """The user's profile, from user.profile when already loaded (no query); created if missing."""
+        try:
+            profile = user.profile
+        except cls.DoesNotExist:
+            profile = None
+        if profile is None:
+            profile, _ = cls.objects.get_or_create(user=user)
+        return profile
 from django.utils import timezone
 
-class ChatSession(models.Model):
+class ChatSession(ColdStorageMixin, models.Model):
+    COLD_FIELD, COLD_ARCHIVE_FIELD, COLD_IS_JSON = "messages", "messages_archive", True
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     messages = models.JSONField(default=list)  # [{role, content, ts, meta?}]
     updated_at = models.DateTimeField(auto_now=True)
@@ -185,8 +253,78 @@ class ChatSession(models.Model):
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     archived = models.BooleanField(default=False)
 
+    # messages of idle sessions, compressed by compact_cold_data (read transparently)
+    messages_archive = models.BinaryField(null=True, blank=True, editable=False)
+    compacted_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='chat_user_updated_idx'),
+            models.Index(fields=['user', 'created_at'], name='chat_user_created_idx'),
+        ]
+
+    def assign_message_ids(self) -> bool:
+        """
+        Give every message a stable "id" (kept once saved), so clients can cache
+        and diff. Ids hash session|ts|role|content, so a message that was never
+        saved with an id still gets the same one on every read. Returns True if
+        any message was changed.
+        """
+        changed = False
+        taken = {m["id"] for m in self.messages or [] if isinstance(m, dict) and m.get("id")}
+        for msg in self.messages or []:
+            if not isinstance(msg, dict) or msg.get("id"):
+                continue
+            content = msg.get("content")
+            if not isinstance(content, str):
+                content = json.dumps(content, sort_keys=True, default=str)
+            key = f"{self.pk or ''}|{msg.get('ts') or ''}|{msg.get('role') or ''}|{content}"
+            msg_id, n = _message_hash(key), 1
+            while msg_id in taken:  # same text at the same ts (or no ts) twice
+                msg_id, n = _message_hash(f"{key}|{n}"), n + 1
+            msg["id"] = msg_id
+            taken.add(msg_id)
+            changed = True
+        return changed
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "messages" in update_fields:
+            self.assign_message_ids()
+        super().save(*args, **kwargs)
+
+
+def _message_hash(key: str) -> str:
+    return "msg_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class ChatSessionTombstone(models.Model):
+    """
+    A deleted (or archived) ChatSession id, so delta sync (api/mobile/chat/sync/)
+    can tell clients to drop (or archive) it without the row's updated_at moving.
+    """
+    KIND_CHOICES = [
+        ('deleted', 'Deleted'),
+        ('archived', 'Archived'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_tombstones")
+    session_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='deleted')
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+    @classmethod
+    def record(cls, user_id, session_ids, kind='deleted'):
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, session_id=sid, kind=kind, deleted_at=now) for sid in session_ids]
+        )
 
 
 class InteractionProfile(models.Model):
@@ -596,6 +734,31 @@ class Event(models.Model):
         return f"{self.event_name} ({self.event_type}) - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class AnalyticsDailyRollup(models.Model):
+    """One row of pre-aggregated site analytics per day (built by `manage.py rollup_analytics`)."""
+    date = models.DateField(unique=True)
+    unique_visitors = models.PositiveIntegerField(default=0)
+    visitors = models.PositiveIntegerField(default=0)
+    page_views = models.PositiveIntegerField(default=0)
+    signups = models.PositiveIntegerField(default=0)
+    signins = models.PositiveIntegerField(default=0)
+    failed_signins = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+    bounces = models.PositiveIntegerField(default=0)
+    top_pages = models.JSONField(default=list, blank=True, help_text="[{path, views}] most viewed first")
+    traffic_sources = models.JSONField(default=dict, blank=True, help_text="{source: visitors}")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = "Analytics Daily Rollup"
+        verbose_name_plural = "Analytics Daily Rollups"
+
+    def __str__(self):
+        return f"Analytics {self.date}"
+
+
 class Campaign(models.Model):
     """Track marketing campaigns"""
     name = models.CharField(max_length=100)
@@ -723,3 +886,162 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - ${self.amount} - {self.status}"
+
+
+class UserMediaFile(models.Model):
+    """Index of files stored under MEDIA_ROOT/user_media/<uid>/ so filename lookups are one query."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="media_files")
+    display_name = models.CharField(max_length=255)
+    display_name_lower = models.CharField(max_length=255)
+    stored_path = models.CharField(max_length=512, help_text="Relative to MEDIA_ROOT")
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'display_name_lower'], name='media_user_name_idx'),
+            models.Index(fields=['user', 'sha256'], name='media_user_sha_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'display_name_lower', 'sha256'], name='media_user_name_sha_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.display_name}"
+
+
+class ChunkedUpload(models.Model):
+    """A resumable upload (api/mobile/uploads/, see uploads.py): chunks go to a part file until finalized."""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chunked_uploads")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(help_text="Declared total size in bytes")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received so far")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='uploading')
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    stored_path = models.CharField(max_length=512, blank=True, default="", help_text="Relative to MEDIA_ROOT once complete")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'updated_at'], name='upload_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.filename} ({self.offset}/{self.size})"
+
+
+class AnalysisJob(models.Model):
+    """Long-running file analysis and data purges, run by `manage.py run_jobs`."""
+    KIND_CHOICES = [
+        ('summarize', 'Summarize files'),
+        ('chat_files', 'Chat attachments'),
+        ('purge_chat_history', 'Clear chat history'),
+        ('purge_account', 'Delete account'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="analysis_jobs"
+    )
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    idempotency_key = models.CharField(max_length=128, blank=True, default="")
+    params = models.JSONField(default=dict, blank=True)
+    files = models.JSONField(default=list, blank=True, help_text="[{name, path}] relative to MEDIA_ROOT")
+
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True, default="")
+
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker_id = models.CharField(max_length=64, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=~models.Q(idempotency_key=""),
+                name='job_user_idempotency_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+
+class AnalysisRun(models.Model):
+    """One multi-file analysis: the combined summary is stored once and each file row points here."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="analysis_runs")
+    session = models.ForeignKey(
+        ChatSession,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="analysis_runs"
+    )
+    tone = models.CharField(max_length=50)
+    lang = models.CharField(max_length=10, blank=True, default="en-US")
+    care_setting = models.CharField(max_length=16, blank=True, default="")
+    summary = models.TextField()
+    file_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='run_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Run #{self.pk} ({self.file_count} files)"
+
+
+class AnalysisRunFile(models.Model):
+    """A file that took part in an AnalysisRun (no summary copy; see run.summary)."""
+    run = models.ForeignKey(AnalysisRun, on_delete=models.CASCADE, related_name="files")
+    position = models.PositiveSmallIntegerField(default=0)
+    filename = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    size = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['run', 'position']
+
+    def __str__(self):
+        return self.filename
@@ -0,0 +1,183 @@
+"""
+Bulk deletion of a user's data, run as background jobs (see jobs.py).
+
+Deleting through the ORM loads every related row into memory and runs the
+whole cascade in one transaction, which for heavy accounts blocks a web worker
+for seconds. Here each table is emptied in batches of PURGE_BATCH_SIZE primary
+keys with one raw DELETE (or UPDATE ... SET NULL) per batch, children first,
+each batch in its own short transaction. None of these models have delete
+signals, so skipping the collector loses nothing. Tables whose rows point at
+files (UserMediaFile, ChunkedUpload) remove those files batch by batch once the
+rows are gone; the user's media folder is removed at the end. Whatever is left
+afterwards (profile, tokens, memberships, ...) is small and goes through a
+normal user.delete().
+"""
+
+import logging
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from .models import (
+    AnalysisRun, AnalysisRunFile, ChatSession, ChatSessionTombstone, ChunkedUpload, Encounter, Event,
+    MedicalSummary, PageView, Payment, Session, Subscription, UserMediaFile, UserSignin,
+)
+
+log = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = getattr(settings, "PURGE_BATCH_SIZE", 1000)
+USER_MEDIA_SUBDIR = getattr(settings, "USER_MEDIA_SUBDIR", "user_media")
+
+
+def _table(model):
+    qn = connection.ops.quote_name
+    return qn(model._meta.db_table), qn(model._meta.pk.column)
+
+
+def _batches(queryset, batch_size):
+    """Yield lists of pks from queryset, re-querying each time (rows are gone once handled)."""
+    while True:
+        pks = list(queryset.order_by().values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE, on_batch=None, files=None) -> int:
+    """
+    Raw DELETE of every row in queryset, batch_size pks per statement. Returns
+    rows deleted. on_batch(pks) runs inside each batch's transaction; the paths
+    files(pks) lists (read before the DELETE) are unlinked after it commits.
+    """
+    table, pk = _table(queryset.model)
+    pk_field = queryset.model._meta.pk
+    deleted = 0
+    for pks in _batches(queryset, batch_size):
+        paths = files(pks) if files else ()
+        params = [pk_field.get_db_prep_value(value, connection) for value in pks]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(pks))})", params)
+            deleted += cursor.rowcount
+            if on_batch:
+                on_batch(pks)
+        for path in paths:
+            path.unlink(missing_ok=True)
+    return deleted
+
+
+def null_in_batches(queryset, field_name, batch_size=PURGE_BATCH_SIZE) -> int:
+    """Raw UPDATE ... SET <fk> = NULL for rows in queryset (the SET_NULL half of a cascade)."""
+    table, pk = _table(queryset.model)
+    column = connection.ops.quote_name(queryset.model._meta.get_field(field_name).column)
+    updated = 0
+    for pks in _batches(queryset.filter(**{f"{field_name}__isnull": False}), batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {column} = NULL WHERE {pk} IN ({', '.join(['%s'] * len(pks))})", pks,
+            )
+            updated += cursor.rowcount
+    return updated
+
+
+def user_media_dir(user_id) -> Path:
+    return Path(settings.MEDIA_ROOT) / USER_MEDIA_SUBDIR / str(user_id)
+
+
+def _media_files(pks):
+    root = Path(settings.MEDIA_ROOT)
+    return [root / rel for rel in UserMediaFile.objects.filter(pk__in=pks).values_list("stored_path", flat=True)]
+
+
+def _upload_parts(pks):
+    from .uploads import part_path
+
+    # Finalized uploads live on in the content-addressed store (UserMediaFile), so only part files go here
+    return [part_path(upload) for upload in ChunkedUpload.objects.filter(pk__in=pks, status="uploading")]
+
+
+def remove_user_media(user_id) -> int:
+    """Delete the user's media folder (content-addressed uploads, job files). Returns bytes freed."""
+    root = user_media_dir(user_id)
+    if not root.is_dir():
+        return 0
+    freed = sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+    shutil.rmtree(root, ignore_errors=True)
+    return freed
+
+
+def purge_chat_history(user, max_id=None, on_progress=None) -> dict:
+    """Delete the user's chat sessions (up to max_id, so chats started after the request survive)."""
+    sessions = ChatSession.objects.filter(user=user)
+    if max_id is not None:
+        sessions = sessions.filter(pk__lte=max_id)
+    total = sessions.count()
+    done = 0
+
+    def step(pks):
+        nonlocal done
+        ChatSessionTombstone.record(user.pk, pks)  # so synced devices drop them too
+        done += len(pks)
+        if on_progress:
+            on_progress(done, total)
+
+    null_in_batches(AnalysisRun.objects.filter(session__in=sessions), "session")
+    deleted = delete_in_batches(sessions, on_batch=step)
+    return {"chat_sessions_deleted": deleted}
+
+
+# Children before parents; (label, queryset factory, files of a batch of pks or None)
+_ACCOUNT_TABLES = (
+    ("summaries", lambda u: MedicalSummary.objects.filter(user=u), None),
+    ("analysis_run_files", lambda u: AnalysisRunFile.objects.filter(run__user=u), None),
+    ("analysis_runs", lambda u: AnalysisRun.objects.filter(user=u), None),
+    ("chat_sessions", lambda u: ChatSession.objects.filter(user=u), None),
+    ("chunked_uploads", lambda u: ChunkedUpload.objects.filter(user=u), _upload_parts),
+    ("media_files", lambda u: UserMediaFile.objects.filter(user=u), _media_files),
+    ("encounters", lambda u: Encounter.all_objects.filter(user=u), None),
+    ("signins", lambda u: UserSignin.objects.filter(user=u), None),
+    ("payments", lambda u: Payment.objects.filter(user=u), None),
+    ("subscriptions", lambda u: Subscription.objects.filter(user=u), None),
+)
+
+# Anonymous analytics keep their rows but lose the link to the account
+_ACCOUNT_NULLED = (
+    (Event, "user"),
+    (PageView, "user"),
+    (Session, "user"),
+)
+
+
+def purge_account(user_id, on_progress=None) -> dict:
+    """
+    Delete an account and everything it owns. Safe to re-run after a partial
+    failure: finished tables are simply empty the second time.
+    """
+    User = get_user_model()
+    result = {}
+    user = User.objects.filter(pk=user_id).first()
+
+    if user is not None:
+        querysets = [(label, factory(user), files) for label, factory, files in _ACCOUNT_TABLES]
+        total = sum(qs.count() for _, qs, _ in querysets)
+        done = 0
+
+        def step(pks):
+            nonlocal done
+            done += len(pks)
+            if on_progress:
+                on_progress(done, total)
+
+        for label, qs, files in querysets:
+            result[f"{label}_deleted"] = delete_in_batches(qs, on_batch=step, files=files)
+        for model, field in _ACCOUNT_NULLED:
+            null_in_batches(model.objects.filter(**{field: user}), field)
+
+        # What remains is a handful of rows per account (profile, signup, tokens, ...)
+        user.delete()
+
+    result["media_bytes_freed"] = remove_user_media(user_id)
+    log.info("Purged account %s: %s", user_id, result)
+    return result
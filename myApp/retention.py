@@ -0,0 +1,57 @@
+"""
+Data retention policy (enforced by `python manage.py enforce_retention`).
+
+Two horizons per user:
+- The user's own preference (Profile.user_settings["data_retention"], set via
+  update_data_retention): data older than it is always deleted.
+- The plan's history window (PLAN_CAPABILITIES history_days, via
+  get_history_days) plus RETENTION_GRACE_DAYS: data older than that has expired
+  for the plan and is archived (chats archived, text compressed) or deleted,
+  depending on RETENTION_MODE / --mode.
+
+Anonymous analytics rows are deleted after ANALYTICS_RETENTION_DAYS, and chat
+sync tombstones after CHAT_TOMBSTONE_DAYS (older sync cursors get a full sync).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+
+from .billing_utils import get_history_days
+
+PREFERENCE_DAYS = {
+    "indefinite": None,
+    "1year": 365,
+    "6months": 182,
+}
+
+RETENTION_GRACE_DAYS = getattr(settings, "RETENTION_GRACE_DAYS", 30)
+ANALYTICS_RETENTION_DAYS = getattr(settings, "ANALYTICS_RETENTION_DAYS", 395)
+CHAT_TOMBSTONE_DAYS = getattr(settings, "CHAT_TOMBSTONE_DAYS", 90)
+RETENTION_MODES = ("archive", "delete")
+
+
+def preference_days(user):
+    """Days the user asked us to keep their data, or None to keep it."""
+    try:
+        choice = (user.profile.user_settings or {}).get("data_retention") or "indefinite"
+    except Exception:
+        return None
+    return PREFERENCE_DAYS.get(choice)
+
+
+def plan_expiry_days(user):
+    """Age after which data is outside the plan's history window (plus grace), or None if unlimited."""
+    days = get_history_days(user)
+    if days is None:
+        return None
+    return days + RETENTION_GRACE_DAYS
+
+
+def user_cutoffs(user, now):
+    """(delete_before, expire_before) datetimes for a user; either may be None."""
+    pref = preference_days(user)
+    expiry = plan_expiry_days(user)
+    delete_before = now - timedelta(days=pref) if pref is not None else None
+    expire_before = now - timedelta(days=expiry) if expiry is not None else None
+    return delete_before, expire_before
@@ -0,0 +1,97 @@
+"""
+Smart follow-up suggestions for a medical summary.
+
+Suggestions are generated once per (summary, tone, lang), and never on the
+summarize request itself (that would add a model call to an already slow
+endpoint):
+- summaries record their summary_hash; background analysis jobs store the
+  suggestions on the row right away;
+- smart_suggestions reads the stored row or the shared cache, and only calls
+  the model on a miss (coalesced via cached_single_flight), storing the result
+  on the user's matching summaries so the next read is a single query.
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+
+from .cache_utils import cached_single_flight
+
+log = logging.getLogger(__name__)
+
+SUGGESTIONS_TTL = getattr(settings, "SMART_SUGGESTIONS_TTL", 24 * 3600)
+MAX_SUGGESTIONS = 3
+
+
+def summary_hash(summary: str) -> str:
+    return hashlib.sha256((summary or "").strip().encode("utf-8")).hexdigest()
+
+
+def _cache_key(digest: str, tone: str, lang: str) -> str:
+    return f"smart_suggestions:{digest}:{tone}:{lang}"
+
+
+def generate_suggestions(summary: str, tone: str, lang: str = "en-US") -> list:
+    """One model call → up to MAX_SUGGESTIONS follow-up questions."""
+    from .views import client, get_system_prompt, _add_language_instruction
+
+    prompt = (
+        "Based on the medical context below, suggest 3 thoughtful follow-up questions the user might ask next. "
+        "Focus on proactive, useful questions a patient or caregiver might not think to ask.\n\n"
+        f"{summary}"
+    )
+    resp = client.chat.completions.create(
+        model="gpt-4o",
+        temperature=0.6,
+        messages=[
+            {"role": "system", "content": _add_language_instruction(get_system_prompt(tone), lang)},
+            {"role": "user", "content": prompt},
+        ],
+    )
+    lines = [l.strip("- ").strip() for l in resp.choices[0].message.content.split("\n") if l.strip()]
+    return lines[:MAX_SUGGESTIONS]
+
+
+def get_suggestions(summary: str, tone: str, lang: str = "en-US", user=None) -> list:
+    """Stored suggestions for this summary if any, else cached/coalesced generation."""
+    digest = summary_hash(summary)
+
+    if user is not None and user.is_authenticated:
+        from .models import MedicalSummary
+        stored = (
+            MedicalSummary.objects
+            .filter(user=user, summary_hash=digest, tone=tone, suggestions_lang=lang)
+            .exclude(suggestions=[])
+            .values_list("suggestions", flat=True)
+            .first()
+        )
+        if stored:
+            return stored
+
+    suggestions = cached_single_flight(
+        _cache_key(digest, tone, lang),
+        lambda: generate_suggestions(summary, tone, lang),
+        SUGGESTIONS_TTL,
+    ) or []
+
+    if suggestions and user is not None and user.is_authenticated:
+        from .models import MedicalSummary
+        MedicalSummary.objects.filter(user=user, summary_hash=digest, tone=tone, suggestions=[]).update(
+            suggestions=suggestions, suggestions_lang=lang,
+        )
+    return suggestions
+
+
+def attach_suggestions(medical_summary, lang: str = "en-US"):
+    """Generate suggestions for a freshly saved MedicalSummary and store them on it (job worker only)."""
+    try:
+        suggestions = get_suggestions(medical_summary.summary, medical_summary.tone, lang)
+    except Exception:
+        log.warning("smart suggestions generation failed for summary %s", medical_summary.pk, exc_info=True)
+        return []
+    medical_summary.summary_hash = summary_hash(medical_summary.summary)
+    medical_summary.suggestions = suggestions
+    medical_summary.suggestions_lang = lang
+    medical_summary.save(update_fields=["summary_hash", "suggestions", "suggestions_lang"])
+    return suggestions
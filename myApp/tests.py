@@ -1,3 +1,456 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import analytics_rollups
+from .answer_cache import AnswerCache, _numbers, normalize_question
+from .cache_utils import cached_single_flight
+from .cold_storage import compact_rows
+from .exporters import stream_account_export
+from .jobs import JOB_STALE_SECONDS, claim_next_job, ensure_owned, requeue_stale_jobs, run_job
+from .models import (
+    AnalysisJob, AnalyticsDailyRollup, ChatSession, ChatSessionTombstone, ChunkedUpload, MedicalSummary,
+    UserMediaFile,
+)
+from .purge import purge_account
+from .suggestions import get_suggestions, summary_hash
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-default"},
+    "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-local"},
+}
+
+
+class AnswerCacheTests(TestCase):
+    answer = "A normal A1C is below 5.7%."
+
+    def setUp(self):
+        self.cache = AnswerCache()
+        self.cache.set("What is a normal A1C?", "PlainClinical", "en-US", self.answer, "|")
+
+    def test_numbers_keep_units(self):
+        self.assertEqual(_numbers(normalize_question("Is 38.5C a fever?")), {"38.5"})
+        self.assertEqual(_numbers(normalize_question("Can I take 500mg twice?")), {"500"})
+        self.assertEqual(_numbers(normalize_question("A1C of 6,1%")), {"6.1"})
+
+    def test_exact_and_similar_questions_hit(self):
+        self.assertEqual(self.cache.get("what is a normal a1c", "PlainClinical", "en-US", "|"), self.answer)
+        self.assertEqual(self.cache.get("Whats a normal A1C", "PlainClinical", "en-US", "|"), self.answer)
+        self.assertEqual(self.cache.stats()["exact_hits"] + self.cache.stats()["similar_hits"], 2)
+
+    def test_other_prompt_bucket_misses(self):
+        self.assertIsNone(self.cache.get("What is a normal A1C?", "Clinical", "en-US", "|"))
+        self.assertIsNone(self.cache.get("What is a normal A1C?", "PlainClinical", "es-ES", "|"))
+        self.assertIsNone(self.cache.get("What is a normal A1C?", "PlainClinical", "en-US", "|christian"))
+
+    def test_different_numbers_miss(self):
+        self.cache.set("Is 38.5C a fever?", "PlainClinical", "en-US", "Yes.", "|")
+        self.cache.set("Is 500mg of ibuprofen safe?", "PlainClinical", "en-US", "Usually.", "|")
+        self.assertEqual(self.cache.get("is 38.5 c a fever", "PlainClinical", "en-US", "|"), "Yes.")
+        self.assertIsNone(self.cache.get("Is 37.5C a fever?", "PlainClinical", "en-US", "|"))
+        self.assertIsNone(self.cache.get("Is 800mg of ibuprofen safe?", "PlainClinical", "en-US", "|"))
+
+
+    def test_negated_question_misses(self):
+        self.cache.set("Is a heart rate of 55 normal?", "PlainClinical", "en-US", "Usually, yes.", "|")
+        self.assertIsNone(self.cache.get("Is a heart rate of 55 not normal?", "PlainClinical", "en-US", "|"))
+        self.assertIsNone(self.cache.get("What is not a normal A1C?", "PlainClinical", "en-US", "|"))
+        self.assertEqual(self.cache.get("is heart rate 55 normal", "PlainClinical", "en-US", "|"), "Usually, yes.")
+
+    def test_only_entries_sharing_a_word_are_scored(self):
+        self.cache.set("Can I exercise after surgery?", "PlainClinical", "en-US", "Ask first.", "|")
+        with mock.patch.object(AnswerCache, "_vector", wraps=self.cache._vector) as vector:
+            self.assertIsNone(self.cache.get("Is aspirin safe daily?", "PlainClinical", "en-US", "|"))
+        vector.assert_called_once()  # the query only; stored vectors are reused
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+
+def export_json(user):
+    return json.loads(b"".join(stream_account_export(user, "json")))
+
+
+class AccountExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("export", "export@example.com", "pw")
+
+    def test_compacted_summary_exports_raw_text(self):
+        raw_text = "Blood pressure 120/80, follow up in two weeks. " * 200
+        summary = MedicalSummary.objects.create(
+            user=self.user, uploaded_filename="labs.pdf", tone="PlainClinical", raw_text=raw_text, summary="ok",
+        )
+        compacted, _, _ = compact_rows(
+            MedicalSummary, [(summary.pk, raw_text, summary.created_at)],
+            "raw_text", "raw_text_archive", "created_at", "", False, timezone.now(),
+        )
+        self.assertEqual(compacted, 1)
+        self.assertEqual(MedicalSummary.objects.filter(pk=summary.pk).values_list("raw_text", flat=True).get(), "")
+
+        exported = export_json(self.user)["summaries"]
+        self.assertEqual([s["raw_text"] for s in exported], [raw_text])
+
+
+class ExtractionTests(TestCase):
+    def _scanned_pdf(self, pages):
+        import fitz
+
+        pixmap = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 8, 8), False)
+        pdf = fitz.open()
+        for _ in range(pages):
+            pdf.new_page().insert_image(fitz.Rect(0, 0, 100, 100), pixmap=pixmap)
+        path = Path(tempfile.mkdtemp()) / "scan.pdf"
+        pdf.save(str(path))
+        self.addCleanup(path.unlink)
+        return path
+
+    def test_request_reads_only_a_few_scanned_pages(self):
+        from .extraction import PDF_SCAN_MAX_PAGES_IN_REQUEST, extract_document
+
+        path = self._scanned_pdf(PDF_SCAN_MAX_PAGES_IN_REQUEST + 2)
+        with mock.patch("myApp.views.extract_contextual_medical_insights_from_multiple_images",
+                        return_value="Scanned labs.") as vision:
+            extraction = extract_document(path, path.name)
+
+        self.assertEqual(len(vision.call_args.args[0]), PDF_SCAN_MAX_PAGES_IN_REQUEST)
+        self.assertEqual(extraction.stats.scans_skipped, 2)
+        self.assertTrue(extraction.stats.as_dict()["truncated"])
+        self.assertIn("2 more scanned pages were not analyzed", extraction.text)
+
+
+class AnalysisRunTests(TestCase):
+    def test_multi_image_run_is_listed_as_one_summary(self):
+        from .views import StoredUpload, _record_analysis_run
+
+        user = User.objects.create_user("runs", "runs@example.com", "pw")
+        uploads = [StoredUpload(Path(name), "0" * 64, 10, name, True) for name in ("front.png", "back.png")]
+        run = _record_analysis_run(user, uploads, "Two views of one label.", "PlainClinical", "en-US")
+
+        summary = MedicalSummary.objects.get(user=user)
+        self.assertEqual((summary.analysis_run, summary.summary), (run, "Two views of one label."))
+        self.assertEqual(summary.uploaded_filename, "front.png, back.png")
+
+        run.delete()
+        self.assertFalse(MedicalSummary.objects.filter(user=user).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _start_leader(self, key, release, result="leader"):
+        started = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return result
+
+        thread = threading.Thread(target=cached_single_flight, args=(key, compute, 60))
+        thread.start()
+        started.wait(5)
+        return thread
+
+    def test_result_is_cached(self):
+        compute = mock.Mock(return_value=["a"])
+        self.assertEqual(cached_single_flight("sf:cached", compute, 60), ["a"])
+        self.assertEqual(cached_single_flight("sf:cached", compute, 60), ["a"])
+        self.assertEqual(compute.call_count, 1)
+
+    def test_falsy_result_is_not_cached(self):
+        compute = mock.Mock(return_value=[])
+        cached_single_flight("sf:empty", compute, 60)
+        cached_single_flight("sf:empty", compute, 60)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_follower_waits_for_leader(self):
+        release = threading.Event()
+        leader = self._start_leader("sf:wait", release)
+        follower_compute = mock.Mock(return_value="follower")
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(cached_single_flight("sf:wait", follower_compute, 60, lock_timeout=5), "leader")
+        leader.join(5)
+        follower_compute.assert_not_called()
+
+    def test_follower_computes_when_leader_outlasts_wait(self):
+        release = threading.Event()
+        leader = self._start_leader("sf:slow", release)
+        try:
+            value = cached_single_flight("sf:slow", lambda: "follower", 60, lock_timeout=0.1)
+        finally:
+            release.set()
+            leader.join(5)
+        self.assertEqual(value, "follower")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SuggestionTests(TestCase):
+    summary = "Mild anemia; recheck iron levels in six weeks."
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("suggest", "suggest@example.com", "pw")
+
+    def test_generation_failure_returns_empty_list(self):
+        with mock.patch("myApp.suggestions.generate_suggestions", return_value=None):
+            self.assertEqual(get_suggestions(self.summary, "PlainClinical"), [])
+
+    def test_generated_once_then_read_from_summary(self):
+        record = MedicalSummary.objects.create(
+            user=self.user, uploaded_filename="cbc.pdf", tone="PlainClinical", raw_text="cbc",
+            summary=self.summary, summary_hash=summary_hash(self.summary),
+        )
+        with mock.patch("myApp.suggestions.generate_suggestions", return_value=["Why iron?"]) as generate:
+            self.assertEqual(get_suggestions(self.summary, "PlainClinical", "en-US", user=self.user), ["Why iron?"])
+            cache.clear()
+            self.assertEqual(get_suggestions(self.summary, "PlainClinical", "en-US", user=self.user), ["Why iron?"])
+        self.assertEqual(generate.call_count, 1)
+        record.refresh_from_db()
+        self.assertEqual((record.suggestions, record.suggestions_lang), (["Why iron?"], "en-US"))
+
+
+def use_temp_media(test):
+    """Point MEDIA_ROOT at a temp dir for one test; returns its path."""
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    media_root = override_settings(MEDIA_ROOT=media.name)
+    media_root.enable()
+    test.addCleanup(media_root.disable)
+    return Path(media.name)
+
+
+def use_free_chats(user, count):
+    now = timezone.now().isoformat()
+    ChatSession.objects.create(user=user, messages=[{"role": "user", "content": "hi", "ts": now}] * count)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("jobs", "jobs@example.com", "pw")
+
+    def _queue(self, kind="summarize", **params):
+        return AnalysisJob.objects.create(user=self.user, kind=kind, params=params)
+
+    def _go_stale(self, job):
+        AnalysisJob.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=JOB_STALE_SECONDS + 1),
+        )
+
+    def test_job_is_claimed_once(self):
+        job = self._queue()
+        claimed = claim_next_job("worker-a")
+        self.assertEqual((claimed.pk, claimed.status, claimed.worker_id, claimed.attempts),
+                         (job.pk, "running", "worker-a", 1))
+        self.assertIsNone(claim_next_job("worker-b"))
+
+    def test_stale_job_is_requeued(self):
+        self._queue()
+        job = claim_next_job("worker-a")
+        self._go_stale(job)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), ("queued", ""))
+        self.assertEqual(claim_next_job("worker-b").attempts, 2)
+
+    def test_requeued_worker_does_not_overwrite_new_owner(self):
+        self._queue()
+        first = claim_next_job("worker-a")
+        self._go_stale(first)
+        requeue_stale_jobs()
+        second = claim_next_job("worker-b")
+
+        with mock.patch.dict("myApp.jobs.JOB_HANDLERS", {"summarize": lambda job: {"by": job.worker_id}}):
+            self.assertFalse(run_job(first))
+            self.assertEqual(AnalysisJob.objects.get(pk=first.pk).status, "running")
+            self.assertTrue(run_job(second))
+        job = AnalysisJob.objects.get(pk=first.pk)
+        self.assertEqual((job.status, job.result), ("succeeded", {"by": "worker-b"}))
+
+    def test_requeued_worker_stops_before_side_effects(self):
+        self._queue()
+        job = claim_next_job("worker-a")
+        side_effects = []
+
+        def handler(job):
+            self._go_stale(job)
+            requeue_stale_jobs()
+            ensure_owned(job)
+            side_effects.append(job.pk)
+
+        with mock.patch.dict("myApp.jobs.JOB_HANDLERS", {"summarize": handler}):
+            self.assertFalse(run_job(job))
+        self.assertEqual(side_effects, [])
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, "queued")
+
+    def test_failure_is_recorded_by_owner(self):
+        self._queue()
+        job = claim_next_job("worker-a")
+        with mock.patch.dict("myApp.jobs.JOB_HANDLERS", {"summarize": mock.Mock(side_effect=ValueError("boom"))}):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ("failed", "boom"))
+
+    def test_chat_files_submit_respects_free_chat_limit(self):
+        use_free_chats(self.user, 10)
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post("/api/jobs/", {
+            "kind": "chat_files", "files": SimpleUploadedFile("notes.txt", b"notes"),
+        }, format="multipart")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["error"], "FREE_CHAT_LIMIT_EXCEEDED")
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_chat_files_job_rechecks_free_chat_limit(self):
+        self._queue(kind="chat_files")
+        job = claim_next_job("worker-a")
+        use_free_chats(self.user, 10)
+        with mock.patch("myApp.views.client") as openai:
+            self.assertFalse(run_job(job))
+        openai.chat.completions.create.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertTrue(job.error.startswith("FREE_CHAT_LIMIT_EXCEEDED"))
+        self.assertEqual(ChatSession.objects.filter(user=self.user).count(), 1)
+
+
+class ChatLanguageTests(TestCase):
+    def test_profile_is_saved_only_when_the_language_changes(self):
+        from .chat_service import ChatService
+        from .models import Profile
+
+        user = User.objects.create_user("lang", "lang@example.com", "pw")
+        Profile.objects.create(user=user, language="en-US")
+        use_free_chats(user, 10)  # the turn stops at the free limit, after the language step
+
+        with mock.patch.object(Profile, "save") as save:
+            self.assertEqual(ChatService({}).send(user, None, "hi", lang="en-US").error, "FREE_CHAT_LIMIT_EXCEEDED")
+            save.assert_not_called()
+            ChatService({}).send(user, None, "hola", lang="es-ES")
+            save.assert_called_once_with(update_fields=["language"])
+
+
+class RetentionTests(TestCase):
+    def test_archiving_records_a_change_row_and_keeps_updated_at(self):
+        user = User.objects.create_user("retention", "retention@example.com", "pw")
+        session = ChatSession.objects.create(user=user, messages=[{"role": "user", "content": "old chat"}])
+        long_ago = timezone.now() - timedelta(days=400)
+        ChatSession.objects.filter(pk=session.pk).update(updated_at=long_ago)
+
+        call_command("enforce_retention", "--mode", "archive", "--skip-analytics", stdout=StringIO())
+
+        session.refresh_from_db()
+        self.assertTrue(session.archived)
+        self.assertEqual(session.updated_at, long_ago)
+        self.assertEqual(
+            list(ChatSessionTombstone.objects.filter(user=user).values_list("session_id", "kind")),
+            [(session.pk, "archived")],
+        )
+
+
+class UserMediaIndexTests(TestCase):
+    def setUp(self):
+        self.media_root = use_temp_media(self)
+        self.user = User.objects.create_user("media", "media@example.com", "pw")
+
+    def _upload(self, content):
+        from .views import _store_upload
+
+        return _store_upload(self.user, SimpleUploadedFile("Scan.png", content))
+
+    def test_reupload_resolves_to_newest_file(self):
+        from .views import _resolve_user_media
+
+        first = self._upload(b"first scan")
+        second = self._upload(b"second scan")
+        self.assertEqual(_resolve_user_media(self.user, "scan.png").sha256, second.sha256)
+
+        self._upload(b"first scan")
+        self.assertEqual(_resolve_user_media(self.user, "my scan.png").sha256, first.sha256)
+        self.assertEqual(UserMediaFile.objects.filter(user=self.user).count(), 2)
+
+    def test_backfill_merges_identical_legacy_copies(self):
+        user_dir = self.media_root / "user_media" / str(self.user.pk)
+        user_dir.mkdir(parents=True)
+        (user_dir / "scan-aaaaaa.png").write_bytes(b"same scan")
+        (user_dir / "scan-bbbbbb.png").write_bytes(b"same scan")
+        (user_dir / "scan-cccccc.png").write_bytes(b"other scan")
+
+        call_command("index_user_media", stdout=StringIO())
+        call_command("index_user_media", stdout=StringIO())
+
+        rows = UserMediaFile.objects.filter(user=self.user, display_name_lower="scan.png")
+        self.assertEqual(rows.count(), 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_record_summary_keeps_no_copy_of_the_image(self):
+        from django.contrib.sessions.backends.cache import SessionStore
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from .views import summarize_medical_record
+
+        # /api/summarize/ resolves to the mobile endpoint first, so call the view directly
+        request = APIRequestFactory().post("/api/summarize/", {"file": SimpleUploadedFile("scan.png", b"scan")})
+        request.session = SessionStore()
+        force_authenticate(request, self.user)
+        with mock.patch("myApp.billing_utils.has_feature_access", return_value=True), \
+                mock.patch("myApp.views.extract_contextual_medical_insights_from_image", return_value="Looks fine."):
+            response = summarize_medical_record(request)
+
+        self.assertEqual(response.data["summary"], "Looks fine.")
+        self.assertFalse(UserMediaFile.objects.exists())
+        self.assertEqual(list(self.media_root.rglob("*.png")), [])
+
+    def test_chat_attaches_uploads_named_in_the_message(self):
+        from .chat_service import ChatResult, ChatService
+
+        stored = self._upload(b"first scan")
+        with mock.patch.object(ChatService, "_send", return_value=ChatResult("ok")) as send:
+            ChatService({}).send(self.user, None, "What does my scan.png show?")
+        files = send.call_args.args[3]
+        self.assertEqual([(f.name, f.stored.sha256) for f in files], [("Scan.png", stored.sha256)])
+
+
+class AnalyticsExportTests(TestCase):
+    def test_only_recent_days_are_computed_in_request(self):
+        today = timezone.localdate()
+        old_day = today - timedelta(days=20)
+        AnalyticsDailyRollup.objects.create(date=old_day, unique_visitors=7, page_views=9)
+
+        with mock.patch.object(analytics_rollups, "compute_day", wraps=analytics_rollups.compute_day) as compute:
+            data = analytics_rollups.export_data(today - timedelta(days=30), today)
+
+        self.assertEqual(sorted(c.args[0] for c in compute.call_args_list), [today - timedelta(days=1), today])
+        self.assertEqual(len(data["missing_days"]), 28)
+        self.assertEqual(data["unique_visitors"], 7)
+        self.assertEqual([d["date"] for d in data["daily_stats"]][0], old_day.strftime("%Y-%m-%d"))
+
+
+class PurgeAccountTests(TestCase):
+    def test_uploads_and_media_files_are_purged(self):
+        from .uploads import part_path, start_upload
+        from .views import _store_upload
+
+        use_temp_media(self)
+        user = User.objects.create_user("purge", "purge@example.com", "pw")
+        stored = _store_upload(user, SimpleUploadedFile("scan.png", b"scan"))
+        part = part_path(start_upload(user, "notes.pdf", 100))
+        self.assertTrue(stored.path.exists() and part.exists())
+
+        result = purge_account(user.pk)
+
+        self.assertEqual((result["media_files_deleted"], result["chunked_uploads_deleted"]), (1, 1))
+        self.assertFalse(stored.path.exists() or part.exists())
+        self.assertFalse(UserMediaFile.objects.exists() or ChunkedUpload.objects.exists())
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
@@ -0,0 +1,303 @@
+"""
+Resumable chunked uploads (api/mobile/uploads/).
+
+A multipart send-chat body is all or nothing: a dropped connection halfway
+through a 20 MB image set means sending everything again, and Django spools
+the whole body before the view runs. Here the client instead
+
+1. starts an upload (filename, total size) and gets an upload id,
+2. PUTs the bytes in chunks at an explicit offset; each chunk is streamed
+   from the request straight into a part file in the user's media dir. After
+   a dropped connection it asks for the current offset and continues there,
+3. finalizes with the SHA-256 of the whole file, which is checked before the
+   file is moved (renamed, not copied) into the content-addressed store that
+   _store_upload uses, and indexed in UserMediaFile.
+
+send_chat then takes upload_ids instead of file bytes (open_uploads()). A
+chunk only advances the offset with a conditional UPDATE, so a retried chunk
+racing the original cannot move it twice. A user may have UPLOAD_MAX_OPEN
+unfinished uploads; they are dropped after UPLOAD_EXPIRY_HOURS, when the user
+starts another upload or by enforce_retention's pass over all users.
+"""
+
+import hashlib
+import logging
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import ChunkedUpload
+from .purge import user_media_dir
+
+log = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = getattr(settings, "UPLOAD_MAX_BYTES", 50 * 1024 * 1024)
+UPLOAD_CHUNK_MAX_BYTES = getattr(settings, "UPLOAD_CHUNK_MAX_BYTES", 8 * 1024 * 1024)
+UPLOAD_EXPIRY_HOURS = getattr(settings, "UPLOAD_EXPIRY_HOURS", 24)
+UPLOAD_MAX_OPEN = getattr(settings, "UPLOAD_MAX_OPEN", 20)
+
+UPLOAD_DOCUMENT_EXTS = (".pdf", ".docx", ".txt")
+COPY_BUFFER = 64 * 1024
+
+
+class UploadError(Exception):
+    """A protocol error, with the HTTP status the view should answer with."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def part_path(upload) -> Path:
+    # In the user's cas/ dir so finalizing is a rename; index_user_media skips .incoming-* files
+    ext = Path(upload.filename).suffix.lower() or ".bin"
+    return user_media_dir(upload.user_id) / "cas" / f".incoming-{upload.pk.hex}{ext}"
+
+
+def _discard(upload):
+    part_path(upload).unlink(missing_ok=True)
+    upload.delete()
+
+
+def stale_uploads():
+    """Unfinished uploads that have not moved for UPLOAD_EXPIRY_HOURS."""
+    cutoff = timezone.now() - timedelta(hours=UPLOAD_EXPIRY_HOURS)
+    return ChunkedUpload.objects.filter(status="uploading", updated_at__lt=cutoff)
+
+
+def expire_uploads(user=None, pks=None) -> int:
+    """Drop stale uploads with their part files: the user's, those in pks, or all of them."""
+    stale = stale_uploads()
+    if user is not None:
+        stale = stale.filter(user=user)
+    if pks is not None:
+        stale = stale.filter(pk__in=pks)
+    stale = list(stale)
+    for upload in stale:
+        _discard(upload)
+    return len(stale)
+
+
+def start_upload(user, filename, size) -> ChunkedUpload:
+    from .views import ALLOWED_IMAGE_EXTS
+
+    filename = Path(str(filename or "")).name.strip()[:255]
+    if not filename:
+        raise UploadError("filename is required")
+    if not filename.lower().endswith(ALLOWED_IMAGE_EXTS + UPLOAD_DOCUMENT_EXTS):
+        raise UploadError("Unsupported file format.", status=415)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size must be an integer")
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadError(f"Files are limited to {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.", status=413)
+
+    expire_uploads(user)
+    if ChunkedUpload.objects.filter(user=user, status="uploading").count() >= UPLOAD_MAX_OPEN:
+        raise UploadError(
+            f"Too many unfinished uploads (at most {UPLOAD_MAX_OPEN}); finish or restart one of them.",
+            status=429,
+        )
+    upload = ChunkedUpload.objects.create(user=user, filename=filename, size=size)
+    part = part_path(upload)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    part.touch()
+    return upload
+
+
+def get_upload(user, upload_id) -> ChunkedUpload:
+    try:
+        return ChunkedUpload.objects.select_related("user").get(pk=upload_id, user=user)
+    except (ChunkedUpload.DoesNotExist, ValueError, TypeError):
+        raise UploadError("Upload not found", status=404)
+
+
+def write_chunk(upload, offset, stream, length) -> int:
+    """
+    Write `length` bytes from stream at `offset` (which must be the current
+    offset) straight to the part file. Returns the new offset.
+    """
+    if upload.status != "uploading":
+        raise UploadError("Upload is already finalized", status=409, offset=upload.offset)
+    try:
+        offset, length = int(offset), int(length)
+    except (TypeError, ValueError):
+        raise UploadError("offset and Content-Length are required")
+    if offset != upload.offset:
+        # The client lost track (e.g. a chunk landed but the response did not): resume from ours
+        raise UploadError("Offset does not match the upload", status=409, offset=upload.offset)
+    if length <= 0:
+        raise UploadError("Empty chunk")
+    if length > UPLOAD_CHUNK_MAX_BYTES:
+        raise UploadError(f"Chunks are limited to {UPLOAD_CHUNK_MAX_BYTES // (1024 * 1024)} MB.", status=413)
+    if offset + length > upload.size:
+        raise UploadError("Chunk runs past the declared size", status=413, offset=upload.offset)
+
+    written = 0
+    with part_path(upload).open("r+b") as out:
+        out.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER, length - written))
+            if not data:
+                break
+            out.write(data)
+            written += len(data)
+    if written != length:
+        raise UploadError("Chunk ended early", offset=upload.offset)
+
+    new_offset = offset + written
+    moved = ChunkedUpload.objects.filter(pk=upload.pk, status="uploading", offset=offset).update(
+        offset=new_offset, updated_at=timezone.now(),
+    )
+    if not moved:
+        # A retry of the same chunk got there first; report where the upload really is
+        upload.refresh_from_db(fields=["offset"])
+        return upload.offset
+    upload.offset = new_offset
+    return new_offset
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for data in iter(lambda: f.read(COPY_BUFFER), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload, sha256) -> ChunkedUpload:
+    """Check the digest and move the part file into the content-addressed store."""
+    from .views import _commit_upload
+
+    sha256 = str(sha256 or "").strip().lower()
+    if len(sha256) != 64:
+        raise UploadError("sha256 (hex) is required")
+    if upload.status == "complete":
+        if upload.sha256 != sha256:
+            raise UploadError("Upload was finalized with a different sha256", status=409)
+        return upload  # retried finalize
+    if upload.offset != upload.size:
+        raise UploadError("Upload is incomplete", status=409, offset=upload.offset)
+
+    part = part_path(upload)
+    try:
+        actual = _file_digest(part)
+    except FileNotFoundError:
+        # A concurrent finalize of the same upload already moved it
+        upload.refresh_from_db()
+        if upload.status == "complete" and upload.sha256 == sha256:
+            return upload
+        raise UploadError("Upload not found", status=404)
+    if actual != sha256:
+        # Some chunk was corrupted on the way; there is no telling which, so start over
+        log.warning("Chunked upload %s failed its digest check", upload.pk)
+        _discard(upload)
+        raise UploadError("sha256 does not match the uploaded bytes; please upload the file again", status=422)
+
+    try:
+        stored = _commit_upload(upload.user, part, actual, upload.size, upload.filename)
+    except FileNotFoundError:
+        # A concurrent finalize renamed the part file between our digest check and rename;
+        # the same bytes are now at their content address, so committing again finds them there
+        try:
+            stored = _commit_upload(upload.user, part, actual, upload.size, upload.filename)
+        except FileNotFoundError:
+            raise UploadError("Upload not found", status=404)
+    upload.status = "complete"
+    upload.sha256 = actual
+    upload.stored_path = stored.path.relative_to(settings.MEDIA_ROOT).as_posix()
+    upload.save(update_fields=["status", "sha256", "stored_path", "updated_at"])
+    return upload
+
+
+def upload_payload(upload) -> dict:
+    return {
+        "upload_id": str(upload.pk),
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.offset,
+        "status": upload.status,
+        "sha256": upload.sha256 or None,
+        "chunk_size": UPLOAD_CHUNK_MAX_BYTES,
+    }
+
+
+# =============================
+# Referencing finished uploads
+# =============================
+
+class StoredFile(File):
+    """A stored upload, usable wherever the chat pipeline takes an UploadedFile."""
+
+    def __init__(self, stored_path, name, sha256, size):
+        from .views import StoredUpload
+
+        path = Path(settings.MEDIA_ROOT) / stored_path
+        super().__init__(path.open("rb"), name=name)
+        # _store_upload and _upload_digest use this instead of writing/hashing again
+        self.stored = StoredUpload(path, sha256, size, name, False)
+
+    def temporary_file_path(self):
+        return str(self.stored.path)  # extraction reads from disk
+
+
+def upload_ids(data) -> list:
+    """upload_ids from a JSON/msgpack list or repeated form fields."""
+    ids = data.getlist("upload_ids") if hasattr(data, "getlist") else data.get("upload_ids")
+    if isinstance(ids, str):
+        ids = [ids]
+    return [str(i) for i in ids or [] if i]
+
+
+@contextmanager
+def open_uploads(user, ids):
+    """The user's finalized uploads as StoredFiles, in the order given; closed on exit."""
+    try:
+        wanted = [uuid.UUID(i) for i in ids]
+    except ValueError:
+        raise UploadError("Invalid upload id")
+    rows = ChunkedUpload.objects.filter(user=user, pk__in=wanted, status="complete").in_bulk()
+    missing = [str(i) for i in wanted if i not in rows]
+    if missing:
+        raise UploadError(f"Upload {missing[0]} not found or not finalized", status=404)
+
+    files = []
+    try:
+        for i in wanted:
+            row = rows[i]
+            files.append(StoredFile(row.stored_path, row.filename, row.sha256, row.size))
+        yield files
+    finally:
+        for f in files:
+            f.close()
+
+
+@contextmanager
+def open_user_media(user, names):
+    """Earlier uploads a message names ("compare with scan.png"), newest copy per name; closed on exit."""
+    from .views import _resolve_user_media
+
+    files, seen = [], set()
+    try:
+        for name in names:
+            row = _resolve_user_media(user, name)
+            if row is None or row.pk in seen:
+                continue
+            seen.add(row.pk)
+            try:
+                files.append(StoredFile(row.stored_path, row.display_name, row.sha256, row.size))
+            except FileNotFoundError:
+                continue  # purged since the lookup
+        yield files
+    finally:
+        for f in files:
+            f.close()
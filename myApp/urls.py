@@ -3,6 +3,7 @@ from django.contrib.auth import views as auth_views
 from . import views
 from . import product_views
 from . import billing_views
+from . import job_views
 from django.views.generic import RedirectView
 from .views import LegalView, terms_redirect, privacy_redirect
 from .views import WarmLoginView 
@@ -37,6 +38,7 @@ urlpatterns = [
     path('dashboard/analytics/', views.analytics_dashboard, name='analytics'),
     path('dashboard/analytics/export/', views.analytics_export, name='analytics_export'),
     path('dashboard/admin/users/', views.staff_users_dashboard, name='staff_users_dashboard'),
+    path('dashboard/admin/answer-cache/', views.answer_cache_stats, name='answer_cache_stats'),
 
     # API Endpoints
     path("api/summarize/", views.summarize_medical_record, name="summarize"),
@@ -103,6 +105,11 @@ urlpatterns = [
     path("api/chat/", views.send_chat, name="send_chat"),
     path("api/smart-suggestions/", views.smart_suggestions, name="smart_suggestions"),
 
+    # Background analysis jobs (run by `manage.py run_jobs`)
+    path("api/jobs/", job_views.submit_analysis_job, name="analysis_job_submit"),
+    path("api/jobs/<int:job_id>/", job_views.analysis_job_status, name="analysis_job_status"),
+    path("api/jobs/<int:job_id>/result/", job_views.analysis_job_result, name="analysis_job_result"),
+
 
     path("portal/", product_views.portal_home, name="portal_home"),
     path("portal/login/", product_views.OrgLockedLoginView.as_view(), name="portal_login"),
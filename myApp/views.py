@@ -14,14 +14,16 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from django.contrib.auth.forms import UserCreationForm
 
 from .models import MedicalSummary, Profile
+from .suggestions import get_suggestions, summary_hash
 
 # -------- Std libs
-import os, io, json, base64, mimetypes, tempfile, traceback
+import os, io, json, base64, hashlib, mimetypes, tempfile, traceback
+from typing import NamedTuple
 
 # -------- Files / parsing
-import fitz  # PyMuPDF
-import docx
 from PIL import Image
+from .image_pipeline import vision_data_uri
+from .extraction import ExtractionLimitError, extract_document
 
 # at top of file with other imports
 import re, uuid
@@ -32,8 +34,6 @@ from .utils import get_client_ip
 
 ALLOWED_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".heic", ".webp")
 USER_MEDIA_SUBDIR = getattr(settings, "USER_MEDIA_SUBDIR", "user_media")
-SESSION_IMAGE_INDEX = "known_images"  # {lower_filename: relative_path_from_MEDIA_ROOT}
-MAX_INDEXED_IMAGES = 100
 MAX_FILES_PER_UPLOAD = 15  # Allow up to 15 files (more than required 10)
 
 # views.py (top)
@@ -118,40 +118,48 @@ def _user_media_root(user) -> Path:
     root.mkdir(parents=True, exist_ok=True)
     return root
 
-def _index_known_image(request, display_name: str, abs_path: Path):
-    """Index by the *display* filename the user knows AND the stored filename."""
-    rel = abs_path.relative_to(settings.MEDIA_ROOT).as_posix()
-    idx = request.session.get(SESSION_IMAGE_INDEX, {})
-    # keep lowercase keys for case-insensitive lookups
-    for key in {display_name.lower(), abs_path.name.lower()}:
-        idx[key] = rel
-    # prune if too big (FIFO-ish)
-    if len(idx) > MAX_INDEXED_IMAGES:
-        # drop oldest ~10 items
-        for _ in range(10):
-            try:
-                k = next(iter(idx))
-                idx.pop(k, None)
-            except StopIteration:
-                break
-    request.session[SESSION_IMAGE_INDEX] = idx
-    request.session.modified = True
+def _index_user_media(user, stored) -> None:
+    """
+    Record a stored upload in UserMediaFile (one row per user + display name + content).
+    Re-uploading a file bumps its created_at, so the name resolves to the newest upload.
+    """
+    from django.db import IntegrityError
+    from .models import UserMediaFile
+
+    key = {"user": user, "display_name_lower": stored.display_name.lower()[:255], "sha256": stored.sha256}
+    fields = {
+        "display_name": stored.display_name[:255],
+        "stored_path": stored.path.relative_to(settings.MEDIA_ROOT).as_posix(),
+        "size": stored.size,
+        "created_at": timezone.now(),
+    }
+    try:
+        UserMediaFile.objects.update_or_create(**key, defaults=fields)
+    except IntegrityError:
+        # A concurrent upload of the same file created the row first
+        UserMediaFile.objects.filter(**key).update(**fields)
 
-def _resolve_indexed_image(request, filename: str) -> Optional[Path]:
-    idx = request.session.get(SESSION_IMAGE_INDEX, {})
-    rel = idx.get(filename.lower())
-    if not rel:
+def _resolve_user_media(user, filename: str):
+    """
+    Newest UserMediaFile the user uploaded under this display name — one indexed query.
+    A name pulled from free text may carry leading words ("my scan.png"), so its
+    trailing-word suffixes are tried too, longest first.
+    """
+    from .models import UserMediaFile
+
+    if not (user and user.is_authenticated and filename):
         return None
-    p = Path(settings.MEDIA_ROOT) / rel
-    return p if p.exists() else None
-
-def _scan_user_media_for_name(user, filename: str) -> Optional[Path]:
-    """Fallback: look for exact filename in the user's media dir."""
-    base = _user_media_root(user)
-    target = filename.lower()
-    for p in base.glob("**/*"):
-        if p.is_file() and p.suffix.lower() in ALLOWED_IMAGE_EXTS and p.name.lower() == target:
-            return p
+    words = filename.lower().split()
+    names = [" ".join(words[i:])[:255] for i in range(len(words))]
+    rows = list(
+        UserMediaFile.objects.filter(user=user, display_name_lower__in=names)
+        .order_by("-created_at")
+        .only("display_name", "display_name_lower", "stored_path", "sha256", "size")[:50]
+    )
+    for name in names:
+        for row in rows:
+            if row.display_name_lower == name and (Path(settings.MEDIA_ROOT) / row.stored_path).exists():
+                return row
     return None
 
 def _parse_image_filenames(text: str) -> list[str]:
@@ -167,20 +175,147 @@ def _parse_image_filenames(text: str) -> list[str]:
     candidates = [m.group(1) for m in re.finditer(pattern, text, flags=re.IGNORECASE)]
     return [c for c in candidates if "/" not in c and "\\" not in c][:5]  # cap to 5 per message
 
-def _save_copy_to_user_media(request, file_obj, display_name: str) -> Path:
+class StoredUpload(NamedTuple):
+    path: Path
+    sha256: str
+    size: int
+    display_name: str
+    temporary: bool  # guest uploads live in a temp file the caller must discard
+
+
+def _store_upload(user, file_obj, display_name: Optional[str] = None) -> StoredUpload:
     """
-    Save an uploaded file to the user's media folder with a unique name,
-    index it by the display name and stored name, and return the absolute path.
+    Stream an upload to disk exactly once while computing its SHA-256 and size.
+
+    Signed-in users get a content-addressed copy in their media folder
+    (<user_media>/<uid>/cas/ab/<sha256>.<ext>), indexed in UserMediaFile under its
+    display name; re-uploading the same bytes reuses the existing file. Guests (or
+    user=None, for callers that must not keep the file) get a temp file
+    (temporary=True) that the caller removes with _discard_temporary.
     """
-    base = _user_media_root(request.user)
+    stored = getattr(file_obj, "stored", None)
+    if stored is not None:
+        return stored  # already in the store (a finalized chunked upload, see uploads.py)
+
+    display_name = display_name or getattr(file_obj, "name", "") or "upload"
+    ext = Path(display_name).suffix.lower() or ".bin"
+    digest = hashlib.sha256()
+    size = 0
+
+    if user is not None and getattr(user, "is_authenticated", False):
+        base = _user_media_root(user) / "cas"
+        base.mkdir(parents=True, exist_ok=True)
+        incoming = base / f".incoming-{uuid.uuid4().hex}{ext}"
+        temporary = False
+    else:
+        fd, tmp_name = tempfile.mkstemp(suffix=ext)
+        os.close(fd)
+        incoming = Path(tmp_name)
+        temporary = True
+
+    try:
+        with incoming.open("wb") as out:
+            for chunk in file_obj.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+    except Exception:
+        incoming.unlink(missing_ok=True)
+        raise
+
+    sha = digest.hexdigest()
+    if temporary:
+        return StoredUpload(incoming, sha, size, display_name, True)
+    return _commit_upload(user, incoming, sha, size, display_name)
+
+
+def _commit_upload(user, incoming: Path, sha: str, size: int, display_name: str) -> StoredUpload:
+    """Move a fully written file from the user's cas/ dir to its content address and index it."""
+    base = _user_media_root(user) / "cas"
     ext = Path(display_name).suffix.lower() or ".bin"
-    unique_name = f"{Path(display_name).stem}-{uuid.uuid4().hex[:6]}{ext}"
-    dest = base / unique_name
-    with dest.open("wb") as out:
-        for chunk in file_obj.chunks():
-            out.write(chunk)
-    _index_known_image(request, display_name, dest)
-    return dest
+    dest = base / sha[:2] / f"{sha}{ext}"
+    if dest.exists():
+        incoming.unlink(missing_ok=True)  # same bytes already stored
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(incoming, dest)  # rename only, no second write
+    stored = StoredUpload(dest, sha, size, display_name, False)
+    _index_user_media(user, stored)
+    return stored
+
+
+def _discard_temporary(uploads):
+    for u in uploads:
+        if u.temporary:
+            try:
+                os.remove(u.path)
+            except Exception:
+                pass
+
+
+def _record_analysis_run(user, uploads, summary: str, tone: str, lang: str, care_setting=None, session=None):
+    """
+    Store a multi-file analysis once: one AnalysisRun with the combined summary
+    plus one small AnalysisRunFile per upload, in a single transaction. A
+    MedicalSummary row points at the run so the dashboards list it like any
+    other analysis.
+    """
+    from django.db import transaction
+    from .models import AnalysisRun, AnalysisRunFile
+
+    with transaction.atomic():
+        run = AnalysisRun.objects.create(
+            user=user,
+            session=session,
+            tone=tone,
+            lang=lang or "",
+            care_setting=care_setting or "",
+            summary=summary,
+            file_count=len(uploads),
+        )
+        AnalysisRunFile.objects.bulk_create([
+            AnalysisRunFile(run=run, position=i, filename=(u.display_name or u.path.name)[:255],
+                            sha256=u.sha256, size=u.size)
+            for i, u in enumerate(uploads)
+        ])
+        MedicalSummary.objects.create(
+            user=user,
+            uploaded_filename=", ".join(u.display_name or u.path.name for u in uploads)[:255],
+            tone=tone,
+            raw_text="(Image files via chat)",
+            summary=summary,
+            care_setting=care_setting or "hospital",
+            analysis_run=run,
+        )
+    return run
+
+
+def _upload_digest(file_obj) -> str:
+    """SHA-256 of an in-request upload without writing it anywhere; rewinds the file."""
+    stored = getattr(file_obj, "stored", None)
+    if stored is not None:
+        return stored.sha256
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+UPLOAD_RESULT_CACHE_TTL = getattr(settings, "UPLOAD_RESULT_CACHE_TTL", 24 * 3600)
+
+
+def _cached_by_digest(kind: str, digests, variant: str, compute):
+    """
+    Memoize an analysis of uploaded bytes (vision or document summary) by content digest,
+    so re-sending the same files with the same tone/lang skips the model calls.
+    """
+    from .cache_utils import cached_single_flight
+
+    fingerprint = hashlib.sha256(
+        ("|".join(digests) + "|" + variant).encode("utf-8")
+    ).hexdigest()
+    return cached_single_flight(f"upload_{kind}:{fingerprint}", compute, UPLOAD_RESULT_CACHE_TTL)
 
 
 # -------- OpenAI
@@ -188,6 +323,11 @@ from openai import OpenAI
 # Set timeout to prevent Railway 502 errors (30s max for HTTP requests)
 client = OpenAI(timeout=25.0)  # Slightly under Railway's typical 30s limit
 
+# Vision calls made inside an HTTP request must stay under the proxy limit;
+# background jobs (jobs.py) pass a longer timeout and bigger batches.
+VISION_TIMEOUT = 25.0
+MAX_IMAGES_PER_BATCH = 2
+
 # =============================
 #         PROMPTS
 # =============================
@@ -278,6 +418,16 @@ def _add_language_instruction(system_prompt: str, lang: str) -> str:
     return system_prompt + language_instruction
 
 
+def _profile_language(user) -> str:
+    """Preferred language from the user's profile; en-US for guests or on error."""
+    if user is not None and user.is_authenticated:
+        try:
+            return user.profile.language or "en-US"
+        except Exception:
+            pass
+    return "en-US"
+
+
 def _is_detailed(msg: str) -> bool:
     """Treat as detailed if >= 12 words or contains multiple clauses/signals."""
     if _wc(msg) >= 12:
@@ -770,41 +920,15 @@ VISION_FORMAT_PROMPT = (
     "Multi-Image Handling: All images analyzed together. Cross-image comparison when relevant. Context preserved across the image set."
 )
 
-# =============================
-#      FILE TEXT EXTRACTORS
-# =============================
-def extract_text_from_pdf(file):
-    pdf = fitz.open(stream=file.read(), filetype="pdf")
-    text = ""
-    for page in pdf:
-        text += page.get_text()
-    return text.strip()
-
-def extract_text_from_docx(file):
-    doc = docx.Document(file)
-    return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-
-# =============================
-#      IMAGE PREPROCESSING
-# =============================
-def preprocess_image_for_vision_api(image_path, resize_width=1024):
-    with Image.open(image_path) as img:
-        img = img.convert("L")  # grayscale
-        if img.width > resize_width:
-            w_percent = resize_width / float(img.width)
-            h_size = int(float(img.height) * float(w_percent))
-            img = img.resize((resize_width, h_size), Image.LANCZOS)
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG", optimize=True)
-        return base64.b64encode(buffer.getvalue()).decode()
+# File text extraction (PDF/DOCX/TXT) lives in extraction.py
 
 # =============================
 #  VISION INTERPRETATION (IMG)
 # =============================
-def extract_contextual_medical_insights_from_image(file_path: str, tone: str = "PlainClinical", lang: str = "en-US") -> str:
+def extract_contextual_medical_insights_from_image(file_path: str, tone: str = "PlainClinical", lang: str = "en-US",
+                                                   timeout: float = VISION_TIMEOUT, profile: str = None) -> str:
 
-    image_b64 = preprocess_image_for_vision_api(file_path)
-    data_uri = f"data:image/png;base64,{image_b64}"
+    data_uri = vision_data_uri(file_path, profile)
     
     # Override FULL BREAKDOWN MODE for images - use image-specific format instead
     base_prompt = get_system_prompt(tone)
@@ -859,7 +983,7 @@ Present as: "This image shows...", "You can see...", "What stands out...", "This
                 ]
             },
         ],
-        timeout=25.0,  # Explicit timeout to prevent Railway 502
+        timeout=timeout,  # Explicit timeout to prevent Railway 502
     )
     raw = resp.choices[0].message.content.strip()
 
@@ -871,24 +995,69 @@ Present as: "This image shows...", "You can see...", "What stands out...", "This
             {"role": "system", "content": system_prompt + "\n\nYou are analyzing and explaining what you see in the images. Present your findings as observations and explanations, not as instructions. Be specific about anatomical structures, dates, findings, and what they typically mean. Make it warm, detailed, and conversational - like walking someone through what the images show."},
             {"role": "user", "content": f"Rewrite this analysis to be warm and clear. Present it as 'Here's what I see' and 'This typically means' rather than 'You should do this' or 'Follow these steps'. Keep ALL the detailed observations, specific anatomical findings, date comparisons, and explanations. Make it feel like a knowledgeable medical explainer walking through the images:\n\n{raw}"},
         ],
-        timeout=25.0,  # Explicit timeout to prevent Railway 502
+        timeout=timeout,  # Explicit timeout to prevent Railway 502
     )
     return rewrite.choices[0].message.content.strip()
 
 # =============================
 #  MULTI-IMAGE VISION INTERPRETATION
 # =============================
-def extract_contextual_medical_insights_from_multiple_images(file_paths: list[str], tone: str = "PlainClinical", lang: str = "en-US") -> str:
+def extract_contextual_medical_insights_from_multiple_images(file_paths: list[str], tone: str = "PlainClinical", lang: str = "en-US",
+                                                             max_per_batch: int = MAX_IMAGES_PER_BATCH, on_batch=None,
+                                                             timeout: float = VISION_TIMEOUT, profile: str = None) -> str:
     """
     Process multiple medical images together in a single API call.
     This allows the AI to see all images in context and provide comprehensive analysis.
+
+    More than `max_per_batch` images are split into batches; `on_batch(done, total)`
+    is called after each batch so background jobs can report progress. `profile`
+    selects the payload encoding (image_pipeline.ENCODING_PROFILES; None = setting).
     """
     if not file_paths:
         return ""
     
     if len(file_paths) == 1:
         # Fall back to single image processing for consistency
-        return extract_contextual_medical_insights_from_image(file_paths[0], tone=tone, lang=lang)
+        summary = extract_contextual_medical_insights_from_image(file_paths[0], tone=tone, lang=lang, timeout=timeout, profile=profile)
+        if on_batch:
+            on_batch(1, 1)
+        return summary
+
+    # Limit images per call to avoid timeout (Railway has ~30s HTTP limit).
+    # Checked before encoding so oversized requests don't preprocess every image twice.
+    if len(file_paths) > max_per_batch:
+        # Process in batches and combine
+        log.info(f"Processing {len(file_paths)} images in batches of {max_per_batch} to avoid timeout")
+        total_batches = (len(file_paths) + max_per_batch - 1) // max_per_batch
+        batch_summaries = []
+        for batch_start in range(0, len(file_paths), max_per_batch):
+            batch_paths = file_paths[batch_start:batch_start + max_per_batch]
+            batch_no = batch_start // max_per_batch + 1
+            try:
+                log.info(f"Processing batch {batch_no} ({len(batch_paths)} images)")
+                if len(batch_paths) == 1:
+                    batch_summary = extract_contextual_medical_insights_from_image(batch_paths[0], tone=tone, lang=lang, timeout=timeout, profile=profile)
+                else:
+                    batch_summary = extract_contextual_medical_insights_from_multiple_images(
+                        batch_paths, tone=tone, lang=lang, max_per_batch=max_per_batch, timeout=timeout, profile=profile,
+                    )
+                batch_summaries.append(f"**Batch {batch_no} ({len(batch_paths)} images):**\n{batch_summary}")
+            except Exception as e:
+                log.error(f"Batch {batch_no} failed: {e}")
+                # Fallback: try individual processing for this batch
+                for i, file_path in enumerate(batch_paths, 1):
+                    try:
+                        summary = extract_contextual_medical_insights_from_image(file_path, tone=tone, lang=lang, timeout=timeout, profile=profile)
+                        batch_summaries.append(f"**Image {batch_start + i}:**\n{summary}")
+                    except Exception:
+                        batch_summaries.append(f"**Image {batch_start + i}:**\n(Unable to process this image)")
+            if on_batch:
+                on_batch(batch_no, total_batches)
+
+        if batch_summaries:
+            combined = "\n\n---\n\n".join(batch_summaries)
+            return f"I've analyzed {len(file_paths)} images in batches. Here's what I found:\n\n{combined}"
+        return "Failed to process any of the provided images. Please try with fewer images or check the file formats."
     
     # Override FULL BREAKDOWN MODE for images - use image-specific format instead
     base_prompt = get_system_prompt(tone)
@@ -949,8 +1118,7 @@ Here are the images to analyze:"""
     # Add all images to the content with clear labeling
     for i, file_path in enumerate(file_paths, 1):
         try:
-            image_b64 = preprocess_image_for_vision_api(file_path)
-            data_uri = f"data:image/png;base64,{image_b64}"
+            data_uri = vision_data_uri(file_path, profile)
             content_parts.append({
                 "type": "text",
                 "text": f"\n\n--- Image {i} of {len(file_paths)} ---"
@@ -967,40 +1135,6 @@ Here are the images to analyze:"""
         return "Failed to process the provided images."
     
     # First pass: interpret all images together
-    # Limit to 2 images per batch to avoid timeout (Railway has ~30s HTTP limit)
-    MAX_IMAGES_PER_BATCH = 2
-    if len(file_paths) > MAX_IMAGES_PER_BATCH:
-        # Process in batches of 2 and combine
-        log.info(f"Processing {len(file_paths)} images in batches of {MAX_IMAGES_PER_BATCH} to avoid timeout")
-        batch_summaries = []
-        for batch_start in range(0, len(file_paths), MAX_IMAGES_PER_BATCH):
-            batch_paths = file_paths[batch_start:batch_start + MAX_IMAGES_PER_BATCH]
-            try:
-                log.info(f"Processing batch {batch_start//MAX_IMAGES_PER_BATCH + 1} ({len(batch_paths)} images)")
-                if len(batch_paths) == 1:
-                    batch_summary = extract_contextual_medical_insights_from_image(batch_paths[0], tone=tone, lang=lang)
-                else:
-                    batch_summary = extract_contextual_medical_insights_from_multiple_images(batch_paths, tone=tone, lang=lang)
-                batch_summaries.append(f"**Batch {batch_start//MAX_IMAGES_PER_BATCH + 1} ({len(batch_paths)} images):**\n{batch_summary}")
-            except Exception as e:
-                log.error(f"Batch {batch_start//MAX_IMAGES_PER_BATCH + 1} failed: {e}")
-                # Fallback: try individual processing for this batch
-                for i, file_path in enumerate(batch_paths, 1):
-                    try:
-                        summary = extract_contextual_medical_insights_from_image(file_path, tone=tone, lang=lang)
-                        batch_summaries.append(f"**Image {batch_start + i}:**\n{summary}")
-                    except Exception:
-                        batch_summaries.append(f"**Image {batch_start + i}:**\n(Unable to process this image)")
-                continue
-        
-        if batch_summaries:
-            combined = "\n\n---\n\n".join(batch_summaries)
-            if len(file_paths) > MAX_IMAGES_PER_BATCH:
-                return f"I've analyzed {len(file_paths)} images in batches. Here's what I found:\n\n{combined}"
-            return combined
-        else:
-            return "Failed to process any of the provided images. Please try with fewer images or check the file formats."
-    
     try:
         resp = client.chat.completions.create(
             model="gpt-4o",
@@ -1009,7 +1143,7 @@ Here are the images to analyze:"""
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": content_parts}
             ],
-            timeout=25.0,  # Explicit timeout to prevent Railway 502
+            timeout=timeout,  # Explicit timeout to prevent Railway 502
         )
         raw = resp.choices[0].message.content.strip()
     except Exception as e:
@@ -1018,7 +1152,7 @@ Here are the images to analyze:"""
         individual_summaries = []
         for file_path in file_paths:
             try:
-                summary = extract_contextual_medical_insights_from_image(file_path, tone=tone, lang=lang)
+                summary = extract_contextual_medical_insights_from_image(file_path, tone=tone, lang=lang, timeout=timeout, profile=profile)
                 individual_summaries.append(summary)
             except Exception:
                 continue
@@ -1026,7 +1160,10 @@ Here are the images to analyze:"""
             raw = "\n\n".join([f"Image {i+1}:\n{summary}" for i, summary in enumerate(individual_summaries)])
         else:
             return "Failed to process any of the provided images. The images may be too large or in an unsupported format."
-    
+
+    if on_batch:
+        on_batch(1, 1)
+
     # Second pass: humanize/tone polish while maintaining structured detail
     try:
         rewrite = client.chat.completions.create(
@@ -1036,6 +1173,7 @@ Here are the images to analyze:"""
                 {"role": "system", "content": system_prompt + "\n\nYou are analyzing and describing what you see in these specific images. Structure your response as:\n1. Warm introduction (explaining what images show, not diagnosing)\n2. 'Big picture first' - brief summary\n3. Break down by anatomical region with specific observations\n4. Compare dates if visible\n5. Overall meaning in everyday language\n6. When to seek urgent attention (specific red flags)\n\nUse: 'These images show...', 'You can clearly see...', 'What stands out...', 'This typically means...' NOT generic advice sections like 'Common signs:', 'What you can do:', 'When to seek help:'"},
                 {"role": "user", "content": f"Rewrite this analysis to match the desired format. Start with a warm intro, then 'Big picture first', then break down findings by region being SPECIFIC about what's visible. Use 'These images show...', 'You can clearly see...', 'What stands out...' NOT generic advice. Keep ALL detailed observations, specific anatomical findings, date comparisons. Make it feel like walking through what's actually in these images:\n\n{raw}"},
             ],
+            timeout=timeout,
         )
         return rewrite.choices[0].message.content.strip()
     except Exception as e:
@@ -1071,6 +1209,7 @@ def summarize_medical_record(request):
     care_setting = norm_setting(request.data.get("care_setting"))
     request.session["tone"] = tone
     request.session["care_setting"] = care_setting
+    lang = request.data.get("lang") or _profile_language(request.user)
 
 
     if not uploaded_file:
@@ -1084,18 +1223,16 @@ def summarize_medical_record(request):
     try:
         # ---------- Images
         if file_name.endswith((".jpg", ".jpeg", ".png", ".heic", ".webp")):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as tmp:
-                for chunk in uploaded_file.chunks():
-                    tmp.write(chunk)
-                tmp_path = tmp.name
-
+            # Streamed to a temp file (with its digest for the vision cache) and deleted after:
+            # record summaries keep no copy of the image, as before
+            stored = _store_upload(None, uploaded_file)
             try:
-                summary = extract_contextual_medical_insights_from_image(tmp_path, tone=tone)
+                summary = _cached_by_digest(
+                    "vision", [stored.sha256], f"{tone}|en-US",
+                    lambda: extract_contextual_medical_insights_from_image(str(stored.path), tone=tone),
+                )
             finally:
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+                _discard_temporary([stored])
 
             # Save to DB
             MedicalSummary.objects.create(
@@ -1105,6 +1242,7 @@ def summarize_medical_record(request):
                 raw_text="(Image file)",
                 summary=summary,
                 care_setting=care_setting,
+                summary_hash=summary_hash(summary),  # suggestions come later from smart_suggestions
             )
 
             # Persist to session for chat context
@@ -1117,12 +1255,17 @@ def summarize_medical_record(request):
             return Response({"summary": summary})
 
         # ---------- Text docs
-        elif file_name.endswith(".pdf"):
-            raw_text = extract_text_from_pdf(uploaded_file)
-        elif file_name.endswith(".docx"):
-            raw_text = extract_text_from_docx(uploaded_file)
-        elif file_name.endswith(".txt"):
-            raw_text = uploaded_file.read().decode("utf-8", errors="ignore")
+        elif file_name.endswith((".pdf", ".docx", ".txt")):
+            # Read from the spooled temp file within the EXTRACT_* budgets;
+            # scanned PDF pages go through vision
+            try:
+                extraction = extract_document(
+                    uploaded_file, file_name, tone=tone, lang=lang,
+                    digest=_upload_digest(uploaded_file) if file_name.endswith(".pdf") else None,
+                )
+            except ExtractionLimitError as e:
+                return Response({"message": str(e)}, status=413)
+            raw_text = extraction.text
         else:
             return Response({
                 "message": "That file type isn’t supported yet. Please upload a PDF, DOCX, TXT, or an image (JPG/PNG/HEIC/WEBP)."
@@ -1160,6 +1303,7 @@ def summarize_medical_record(request):
             tone=tone,
             raw_text=raw_text,
             summary=summary,
+            summary_hash=summary_hash(summary),  # suggestions come later from smart_suggestions
         )
 
         request.session["latest_summary"] = summary
@@ -1169,7 +1313,7 @@ def summarize_medical_record(request):
         ]
         request.session.modified = True
 
-        return Response({"summary": summary})
+        return Response({"summary": summary, "extraction": extraction.stats.as_dict()})
 
     except Exception:
         # Log privately; keep user-facing copy calm and neutral
@@ -1454,556 +1598,26 @@ def get_faith_prompt(base_prompt: str, faith_setting: str) -> str:
 
 # ---------- main: send_chat (db persistence + sticky session) ----------
 
+from .chat_service import ChatService, uploaded_files
+
+
 @csrf_exempt
 @api_view(["POST"])
 @permission_classes([AllowAny])
 @parser_classes([MultiPartParser, FormParser])
 def send_chat(request):
-    # --- Inputs (needed early for tone inference)
-    user_message = (request.data.get("message") or "").strip()
-    files = request.FILES.getlist("files[]")
-    if not files:
-        files = request.FILES.getlist("files")
-    if not files and "file" in request.FILES:
-        files = [request.FILES["file"]]
-    has_files = bool(files)
-
-    # --- Tone: use explicit from request when provided; otherwise infer per message (dynamic update)
-    raw_tone = request.data.get("tone")
-    if raw_tone:
-        tone = normalize_tone(raw_tone)
-        request.session.pop("nm_inferred_tone", None)
-    else:
-        tone = normalize_tone(_infer_use_case(user_message, has_files, request.session))
-        request.session["nm_inferred_tone"] = tone
-    request.session["tone"] = tone
-
-    care_setting = norm_setting(request.data.get("care_setting") or request.session.get("care_setting"))
-    faith_setting = None
-    care_setting = None
-    if tone in ("Clinical", "Caregiver"):
-        care_setting = norm_setting(
-            request.data.get("care_setting") or request.session.get("care_setting")
-        )
-        request.session["care_setting"] = care_setting
-        request.session.pop("faith_setting", None)
-
-    elif tone == "Faith":
-        faith_setting = norm_faith_setting(
-            request.data.get("faith_setting") or request.session.get("faith_setting")
-        )
-        request.session["faith_setting"] = faith_setting
-        request.session.pop("care_setting", None)
-
-    else:
-        request.session.pop("care_setting", None)
-        request.session.pop("faith_setting", None)
-
-    # --- Language
-    lang = request.data.get("lang")
-    if request.user.is_authenticated:
-        from .models import Profile
-        profile, _ = Profile.objects.get_or_create(user=request.user)
-        if lang:
-            profile.language = lang
-            profile.save()
-        else:
-            lang = profile.language or "en-US"
-    else:
-        lang = lang or "en-US"
-
-    # --- Adaptive Response System (if enabled)
-    interaction_profile = None
-    adaptive_strategies = None
-    
-    if settings.ENABLE_ADAPTIVE_RESPONSE:
-        try:
-            from .preference_inference import PreferenceInference, SignalExtractor, ResponseStrategyResolver
-            
-            # Get or create interaction profile
-            session_id = request.data.get("session_id") or request.session.get("active_chat_session_id")
-            interaction_profile = PreferenceInference.get_default_profile(
-                user=request.user if request.user.is_authenticated else None,
-                session_id=session_id if not request.user.is_authenticated else None
-            )
-        except Exception as e:
-            # Graceful degradation - if adaptive system fails, continue without it
-            import logging
-            log = logging.getLogger(__name__)
-            log.warning(f"Adaptive response system error: {e}")
-            interaction_profile = None
-            adaptive_strategies = None
-
-    # --- System prompt
-    base_prompt = get_system_prompt(tone)
-
-    if tone == "Faith" and faith_setting:
-        system_prompt = get_faith_prompt(base_prompt, faith_setting)
-    elif tone == "Clinical":
-        system_prompt = get_setting_prompt(base_prompt, care_setting)
-    else:
-        system_prompt = base_prompt
-    
-    # --- Add language instruction to system prompt
-    system_prompt = _add_language_instruction(system_prompt, lang)
-
-    # --- Validate file count
-    if len(files) > MAX_FILES_PER_UPLOAD:
-        return JsonResponse({
-            "reply": f"Too many files. Maximum {MAX_FILES_PER_UPLOAD} files allowed per upload.",
-            "error": "MAX_FILES_EXCEEDED"
-        }, status=400)
-    
-    has_files = bool(files)
-    
-    # --- Mode header
-    mode, topic_hint = _classify_mode(user_message, has_files, request.session)
-    header = f"ResponseMode: {mode}" + (f"\nTopicHint: {topic_hint}" if topic_hint else "")
-
-    # --- Decide persistence
-    use_db = request.user.is_authenticated
-    session_obj = None
-    
-    # Note: interaction_profile and adaptive_strategies are set above if adaptive system is enabled
-
-    # 🔑 STICKY: prefer payload id, else the server-sticky id
-    incoming_session_id = request.data.get("session_id")
-    sticky_session_id = request.session.get("active_chat_session_id")
-    chosen_session_id = incoming_session_id or sticky_session_id
-
-    # --- Free account chat limit
-    if use_db and request.user.is_authenticated:
-        from .billing_utils import is_subscription_active, can_free_user_create_chat, get_free_chat_limit
-        if not is_subscription_active(request.user):
-            free_chat_limit = get_free_chat_limit(request.user) or 10
-            allowed, remaining, msg = can_free_user_create_chat(
-                request.user, existing_session_id=chosen_session_id
-            )
-            if not allowed:
-                return JsonResponse({
-                    "reply": msg,
-                    "error": "FREE_CHAT_LIMIT_EXCEEDED",
-                    "requires_subscription": True,
-                    "free_chats_used": free_chat_limit,
-                    "free_chat_limit": free_chat_limit,
-                }, status=403)
-
-    # --- Build initial chat_history (DB vs guest)
-    if use_db:
-        session_obj, _created = _ensure_session_for_user(
-            request.user, tone, lang,
-            first_user_msg=user_message or ("[attachments]" if has_files else "New chat"),
-            session_id=chosen_session_id
-        )
-        # remember sticky id on server
-        request.session["active_chat_session_id"] = session_obj.id
-        request.session.modified = True
-
-        chat_history = []
-        for m in (session_obj.messages or []):
-            r, c = m.get("role"), m.get("content")
-            if r and c is not None:
-                chat_history.append({"role": r, "content": c})
-        if not any(m.get("role") == "system" and str(m.get("content","")).startswith("ResponseMode:") for m in chat_history):
-            chat_history.insert(0, {"role": "system", "content": header})
-        if not any(m.get("role") == "system" and base_prompt in m.get("content","") for m in chat_history):
-            chat_history.insert(0, {"role": "system", "content": system_prompt})
-        # Always refresh main system prompt so language changes take effect immediately
-        for m in chat_history:
-            if m.get("role") == "system" and base_prompt in m.get("content", ""):
-                m["content"] = system_prompt
-                break
-    else:
-        summary_context = request.session.get("latest_summary", "")
-        chat_history = request.session.get(
-            "chat_history",
-            [{"role": "system", "content": system_prompt}, {"role": "system", "content": header}],
-        )
-        if not any(m.get("role") == "system" and str(m.get("content", "")).startswith("ResponseMode:") for m in chat_history):
-            chat_history.insert(1, {"role": "system", "content": header})
-        # Guest: always refresh main system prompt so language changes take effect
-        for m in chat_history:
-            if m.get("role") == "system" and base_prompt in m.get("content", ""):
-                m["content"] = system_prompt
-                break
-    
-    # --- Extract signals and update profile (Adaptive System) - after chat_history is built
-    if settings.ENABLE_ADAPTIVE_RESPONSE and interaction_profile:
-        try:
-            from .preference_inference import SignalExtractor, PreferenceInference, ResponseStrategyResolver
-            
-            # Extract signals from current interaction
-            signals = SignalExtractor.extract_all_signals(
-                user_message=user_message,
-                has_files=has_files,
-                conversation_history=chat_history
-            )
-            
-            # Detect topic change (simple heuristic: compare current message with last message)
-            topic_changed = False
-            if chat_history:
-                last_user_msg = next((m.get('content', '') for m in reversed(chat_history) if m.get('role') == 'user'), '')
-                # Simple topic change detection: significant vocabulary shift
-                if last_user_msg and user_message:
-                    last_words = set(last_user_msg.lower().split())
-                    current_words = set(user_message.lower().split())
-                    if last_words and current_words:
-                        overlap = len(last_words & current_words) / max(len(last_words), len(current_words), 1)
-                        topic_changed = overlap < 0.3  # Less than 30% word overlap suggests topic change
-            
-            # Update profile with new signals
-            interaction_profile = PreferenceInference.update_profile(
-                interaction_profile, 
-                signals, 
-                topic_changed=topic_changed
-            )
-            
-            # Resolve response strategies
-            adaptive_strategies = ResponseStrategyResolver.resolve_strategies(interaction_profile, tone)
-            
-            # Build adaptive system prompt (overrides the standard one)
-            adaptive_system_prompt = build_adaptive_system_prompt(
-                tone=tone,
-                care_setting=care_setting,
-                faith_setting=faith_setting,
-                lang=lang,
-                profile=interaction_profile,
-                strategies=adaptive_strategies
-            )
-            
-            # Update system prompt in chat_history if it was already inserted
-            for m in chat_history:
-                if m.get("role") == "system" and base_prompt in m.get("content", ""):
-                    m["content"] = adaptive_system_prompt
-                    break
-            # Also update the system_prompt variable for consistency
-            system_prompt = adaptive_system_prompt
-        except Exception as e:
-            # Graceful degradation - if adaptive system fails, use standard prompt
-            import logging
-            log = logging.getLogger(__name__)
-            log.warning(f"Adaptive response system error during processing: {e}")
-            # system_prompt already set above, continue with standard prompt
-
-    # --- Process files → combined_context
-    # Separate images from other files
-    image_files = []
-    other_files = []
-    for f in files:
-        fname_lower = f.name.lower()
-        if fname_lower.endswith(ALLOWED_IMAGE_EXTS):
-            image_files.append(f)
-        else:
-            other_files.append(f)
-    
-    combined_sections = []
-    
-    # Process images: in batches of 2-3 to avoid timeout
-    # For 5+ images, process in batches of 2-3 and combine
-    if len(image_files) >= 5:
-        # Process in batches of 2 to stay under timeout
-        log.info(f"Processing {len(image_files)} images in batches of 2 to avoid timeout")
-        batch_size = 2
-        for batch_start in range(0, len(image_files), batch_size):
-            batch_files = image_files[batch_start:batch_start + batch_size]
-            try:
-                # Save batch to temp files
-                batch_paths = []
-                temp_paths_to_cleanup = []
-                for img_file in batch_files:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(img_file.name)[1]) as tmp:
-                        for chunk in img_file.chunks():
-                            tmp.write(chunk)
-                        temp_path = tmp.name
-                    
-                    # Try to save to user media
-                    stored_path = None
-                    try:
-                        if request.user.is_authenticated:
-                            with open(temp_path, 'rb') as temp_file:
-                                from django.core.files import File
-                                django_file = File(temp_file, name=img_file.name)
-                                stored_path = _save_copy_to_user_media(request, django_file, img_file.name)
-                    except Exception:
-                        pass
-                    
-                    if stored_path and stored_path.exists():
-                        batch_paths.append(str(stored_path))
-                        try:
-                            os.remove(temp_path)
-                        except Exception:
-                            pass
-                    else:
-                        batch_paths.append(temp_path)
-                        temp_paths_to_cleanup.append(temp_path)
-                
-                # Process batch
-                if len(batch_paths) == 1:
-                    batch_summary = extract_contextual_medical_insights_from_image(batch_paths[0], tone=tone, lang=lang)
-                else:
-                    batch_summary = extract_contextual_medical_insights_from_multiple_images(batch_paths, tone=tone, lang=lang)
-                
-                # Combine filenames
-                batch_names = [f.name for f in batch_files]
-                combined_sections.append(f"{', '.join(batch_names)}\n{batch_summary}")
-                
-                # Cleanup temp files
-                for tmp_path in temp_paths_to_cleanup:
-                    try:
-                        os.remove(tmp_path)
-                    except Exception:
-                        pass
-                        
-            except Exception as e:
-                log.error(f"Batch {batch_start//batch_size + 1} failed: {e}")
-                # Fallback: process individually for this batch
-                for img_file in batch_files:
-                    try:
-                        fname, summary = summarize_single_file(
-                            img_file, tone=tone, system_prompt=system_prompt, user=request.user, request=request,
-                        )
-                        combined_sections.append(f"{fname}\n{summary}")
-                    except Exception:
-                        combined_sections.append(f"{img_file.name}\n(Unable to process this image)")
-    elif len(image_files) >= 2:
-        # Process all images together for better context understanding
-        image_paths = []
-        temp_paths_to_cleanup = []
-        
-        try:
-            for img_file in image_files:
-                # Save to temp file first (file objects can only be read once)
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(img_file.name)[1]) as tmp:
-                    for chunk in img_file.chunks():
-                        tmp.write(chunk)
-                    temp_path = tmp.name
-                
-                # Try to save a copy to user media (read from temp file)
-                stored_path = None
-                try:
-                    if request is not None and request.user.is_authenticated:
-                        # Reopen the temp file to save a copy
-                        with open(temp_path, 'rb') as temp_file:
-                            # Create a file-like object for _save_copy_to_user_media
-                            from django.core.files import File
-                            django_file = File(temp_file, name=img_file.name)
-                            stored_path = _save_copy_to_user_media(request, django_file, img_file.name)
-                except Exception:
-                    pass
-                
-                # Use stored path if available, otherwise use temp path
-                if stored_path and stored_path.exists():
-                    image_paths.append(str(stored_path))
-                    # Only cleanup temp if we successfully stored it
-                    try:
-                        os.remove(temp_path)
-                    except Exception:
-                        pass
-                else:
-                    image_paths.append(temp_path)
-                    temp_paths_to_cleanup.append(temp_path)
-            
-            # Process all images together
-            multi_image_summary = extract_contextual_medical_insights_from_multiple_images(
-                image_paths, tone=tone, lang=lang
-            )
-            
-            # Create a combined filename label
-            image_names = [f.name for f in image_files[:3]]
-            if len(image_files) > 3:
-                image_names.append(f"... and {len(image_files) - 3} more")
-            combined_sections.append(f"{', '.join(image_names)}\n{multi_image_summary}")
-            
-            # Save individual summaries to DB if user is authenticated
-            if request.user.is_authenticated:
-                for img_file in image_files:
-                    try:
-                        MedicalSummary.objects.create(
-                            user=request.user,
-                            uploaded_filename=img_file.name,
-                            tone=tone,
-                            raw_text="(Image file via chat - part of multi-image analysis)",
-                            summary=multi_image_summary,  # Same summary for all as they were analyzed together
-                        )
-                    except Exception:
-                        pass
-        
-        finally:
-            # Cleanup temp files
-            for tmp_path in temp_paths_to_cleanup:
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
-    
-    elif len(image_files) == 1:
-        # Single image - use existing single file processing
-        # Note: summarize_single_file will use the system_prompt which already includes language instruction
-        fname, summary = summarize_single_file(
-            image_files[0], tone=tone, system_prompt=system_prompt, user=request.user, request=request,
-        )
-        combined_sections.append(f"{fname}\n{summary}")
-    
-    # Process non-image files individually
-    # Note: summarize_single_file will use the system_prompt which already includes language instruction
-    for f in other_files:
-        fname, summary = summarize_single_file(
-            f, tone=tone, system_prompt=system_prompt, user=request.user, request=request,
-        )
-        combined_sections.append(f"{fname}\n{summary}")
-    
-    combined_context = "\n\n".join(combined_sections).strip()
-
-    # --- Case: only files
-    if files and not user_message:
-        reply_text = combined_context or "I couldn’t read any useful content from the attachments."
-        if use_db:
-            msgs = session_obj.messages or []
-            if not msgs:
-                msgs.extend([
-                    {"role": "system", "content": system_prompt, "ts": _now_iso()},
-                    {"role": "system", "content": header,         "ts": _now_iso()},
-                ])
-            msgs.append({"role": "user", "content": "(New attachments uploaded)", "ts": _now_iso(), "meta": {"has_files": True}})
-            msgs.append({"role": "assistant", "content": reply_text, "ts": _now_iso()})
-            
-            try:
-                current = (getattr(session_obj, "title", "") or "").strip().lower()
-                if current in ("", "new chat", "untitled"):
-                    ai_name = _ai_title(user_message="", files=files, reply=reply_text, lang=lang)
-                    if ai_name:
-                        session_obj.title = ai_name
-            except Exception:
-                # fall back quietly
-                if not getattr(session_obj, "title", None):
-                    session_obj.title = _derive_title(user_message="", files=files, reply=reply_text)
-                
-            session_obj.messages = _trim_history(msgs, keep=200)
-            session_obj.updated_at = timezone.now()
-            session_obj.save(update_fields=["messages", "updated_at"])
-            return JsonResponse({"reply": reply_text, "session_id": session_obj.id}, status=(200 if combined_context else 400))
-        else:
-            request.session["latest_summary"] = combined_context or summary_context
-            request.session["chat_history"] = [
-                {"role": "system", "content": system_prompt},
-                {"role": "system", "content": header},
-                {"role": "user",   "content": f"(Here’s the latest medical context):\n{combined_context or summary_context}"},
-            ]
-            request.session["nm_last_mode"] = "FULL"
-            request.session["nm_last_short_msg"] = ""
-            request.session["nm_last_ts"] = _now_ts()
-            request.session.modified = True
-            return JsonResponse({"reply": reply_text}, status=(200 if combined_context else 400))
-
-    # --- No input at all
-    if not files and not user_message:
-        return JsonResponse({"reply": "Hmm… I didn’t catch that. Can you try again?"})
-
-    # --- Prepare context for model call
-    if combined_context:
-        chat_history = [
-            {"role": "system", "content": system_prompt},
-            {"role": "system", "content": header},
-            {"role": "user",   "content": f"(Here’s the latest medical context):\n{combined_context}"},
-        ]
-        if not use_db:
-            request.session["latest_summary"] = combined_context
-    else:
-        if not use_db:
-            summary_context = request.session.get("latest_summary", "")
-            if summary_context and all("(Here’s the" not in m.get("content", "") for m in chat_history if m.get("role") == "user"):
-                chat_history.append({"role": "user", "content": f"(Here’s the medical context):\n{summary_context}"})
-
-    # --- Add user message to model history
-    chat_history.append({"role": "user", "content": user_message})
-
-    # --- Persist user turn pre-model (DB)
-    if use_db:
-        msgs = session_obj.messages or []
-        if not msgs:
-            msgs.extend([
-                {"role": "system", "content": system_prompt, "ts": _now_iso()},
-                {"role": "system", "content": header,         "ts": _now_iso()},
-            ])
-        if combined_context:
-            msgs.append({
-                "role": "user",
-                "content": f"(Here’s the latest medical context):\n{combined_context}",
-                "ts": _now_iso(),
-                "meta": {"context": "files"},
-            })
-        msgs.append({"role": "user", "content": user_message, "ts": _now_iso()})
-
-        if not session_obj.title:
-            session_obj.title = (user_message or "New chat")[:120]
-        session_obj.tone = tone
-        session_obj.lang = lang
-
-        session_obj.messages = _trim_history(msgs, keep=200)
-        session_obj.updated_at = timezone.now()
-        session_obj.save(update_fields=["messages", "updated_at", "title", "tone", "lang"])
-
-    # --- Call the model (OPTIMIZED: Single pass instead of two-pass for faster responses)
-    try:
-        # Single optimized call with balanced temperature for both accuracy and warmth
-        # The system_prompt already includes tone instructions, so we don't need a second pass
-        reply = client.chat.completions.create(
-            model="gpt-4o", 
-            temperature=0.5,  # Balanced between accuracy (0.3) and creativity (0.6)
-            messages=chat_history,
-        ).choices[0].message.content.strip()
-
-        if use_db:
-            msgs = session_obj.messages or []
-            msgs.append({"role":"assistant","content":reply,"ts":_now_iso()})
-
-            # 🔹 Auto-title if placeholder
-            try:
-                current = (getattr(session_obj, "title", "") or "").strip().lower()
-                if current in ("", "new chat", "untitled"):
-                    ai_name = _ai_title(user_message=user_message, files=files, reply=reply, lang=lang)
-                    if ai_name:
-                        session_obj.title = ai_name
-            except Exception:
-                if not getattr(session_obj, "title", None):
-                    session_obj.title = _derive_title(user_message=user_message, files=files, reply=reply)
-
-            session_obj.messages = _trim_history(msgs, keep=200)
-            session_obj.updated_at = timezone.now()
-            session_obj.save(update_fields=["messages","updated_at","title"])
-        else:
-            chat_history.append({"role": "assistant", "content": reply})
-            request.session["chat_history"] = chat_history[-10:]
-            if mode == "QUICK":
-                request.session["nm_last_mode"] = "QUICK"
-                request.session["nm_last_short_msg"] = user_message
-            else:
-                request.session["nm_last_mode"] = mode
-                request.session["nm_last_short_msg"] = ""
-            request.session["nm_last_ts"] = _now_ts()
-            request.session.modified = True
-
-        return JsonResponse({"reply": reply, "session_id": getattr(session_obj, "id", None)})
-
-    except Exception as e:
-        log.exception("send_chat failed")
-        error_msg = str(e).lower()
-        # Check for timeout-related errors
-        if "timeout" in error_msg or "502" in error_msg or "gateway" in error_msg:
-            return JsonResponse(
-                {
-                    "reply": "The image analysis is taking longer than expected. Please try with fewer images (5 or less) or try again in a moment.",
-                    "error": "TIMEOUT"
-                },
-                status=504,  # Gateway Timeout
-            )
-        return JsonResponse(
-            {
-                "reply": "Sorry, something went wrong while processing your request. Please try again with fewer images or contact support if this persists.",
-                "error": "PROCESSING_ERROR"
-            },
-            status=500,
-        )
+    """Web chat turn; the pipeline is ChatService.send (chat_service.py), state lives in the session."""
+    result = ChatService(request.session).send(
+        request.user,
+        request.data.get("session_id"),
+        request.data.get("message"),
+        uploaded_files(request.FILES),
+        tone=request.data.get("tone"),
+        lang=request.data.get("lang"),
+        care_setting=request.data.get("care_setting"),
+        faith_setting=request.data.get("faith_setting"),
+    )
+    return JsonResponse(result.as_dict(), status=result.status)
 
 # --- ChatSession actions: rename / archive toggle / delete --------------------
 import json
@@ -2013,7 +1627,7 @@ from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 
-from .models import ChatSession
+from .models import ChatSession, ChatSessionTombstone
 
 
 def _owned_session(request, pk: int) -> ChatSession:
@@ -2079,6 +1693,7 @@ def chat_session_delete(request, pk: int):
     """
     s = _owned_session(request, pk)
     s.delete()
+    ChatSessionTombstone.record(request.user.id, [pk])  # tells synced devices to drop it
 
     if request.session.get("active_chat_session_id") == pk:
         request.session.pop("active_chat_session_id", None)
@@ -2096,28 +1711,14 @@ def chat_session_delete(request, pk: int):
 def smart_suggestions(request):
     summary = request.data.get("summary", "") or request.session.get("latest_summary", "")
     tone = normalize_tone(request.data.get("tone") or request.session.get("tone") or "PlainClinical")
-    
+    lang = request.data.get("lang") or _profile_language(request.user)
 
     if not summary.strip():
         return JsonResponse({"suggestions": []})
 
-    prompt = (
-        "Based on the medical context below, suggest 3 thoughtful follow-up questions the user might ask next. "
-        "Focus on proactive, useful questions a patient or caregiver might not think to ask.\n\n"
-        f"{summary}"
-    )
-
-    resp = client.chat.completions.create(
-        model="gpt-4o",
-        temperature=0.6,
-        messages=[
-            {"role": "system", "content": get_system_prompt(tone)},
-
-            {"role": "user", "content": prompt},
-        ],
-    )
-    lines = [l.strip("- ").strip() for l in resp.choices[0].message.content.split("\n") if l.strip()]
-    return JsonResponse({"suggestions": [{"question": q} for q in lines[:3]]})
+    # Stored with the MedicalSummary, or memoized + coalesced per (summary hash, tone, lang)
+    questions = get_suggestions(summary, tone, lang, user=request.user)
+    return JsonResponse({"suggestions": [{"question": q} for q in questions]})
 
 @csrf_exempt
 @api_view(["POST"])
@@ -2486,12 +2087,9 @@ def analytics_export(request):
     """Export analytics data as PDF or CSV"""
     from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
     from django.db.models import Count
-    from .models import Visitor, PageView, UserSignup, UserSignin
-    from .analytics_views import get_analytics_data
     from django.utils import timezone
     from datetime import timedelta, datetime
     import csv
-    import json
     
     # Only staff can export
     if not request.user.is_staff:
@@ -2506,11 +2104,6 @@ def analytics_export(request):
     period = request.GET.get('period', '7d')
     today = timezone.now().date()
     
-    # Handle user export
-    if 'users_' in export_format:
-        format_type = export_format.replace('users_', '')
-        return export_users_list(request, format_type)
-    
     # Determine date range
     if period == 'today':
         start_date = today
@@ -2535,14 +2128,9 @@ def analytics_export(request):
         start_date = today - timedelta(days=7)
         end_date = today
     
-    # Get analytics data
-    from .analytics_views import get_analytics_data
-    data = get_analytics_data(
-        request=request,
-        start_date=start_date,
-        end_date=end_date,
-        comparison_enabled=False
-    )
+    # Read per-day rollups instead of recomputing the whole dashboard
+    from .analytics_rollups import export_data
+    data = export_data(start_date, end_date)
     
     if export_format == 'csv':
         response = HttpResponse(content_type='text/csv')
@@ -2558,6 +2146,8 @@ def analytics_export(request):
         writer.writerow(['Active Users', data['active_users']])
         writer.writerow(['Conversion Rate', f"{data['conversion_rate']}%"])
         writer.writerow(['Bounce Rate', f"{data['bounce_rate']}%"])
+        if data['missing_days']:
+            writer.writerow(['Days not rolled up yet', ' '.join(data['missing_days'])])
         writer.writerow([])
         writer.writerow(['Daily Stats'])
         writer.writerow(['Date', 'Visitors', 'Page Views', 'Signups', 'Signins'])
@@ -2603,14 +2193,12 @@ def analytics_export(request):
 
 @login_required
 def export_users_list(request, format_type='csv'):
-    """Export user list as CSV or PDF"""
-    from django.http import HttpResponse, HttpResponseForbidden
-    from django.contrib.auth import get_user_model
-    from .models import Profile
-    from django.db.models import Count, Max, Q
-    import csv
+    """Export user list as CSV or PDF, streamed in user batches (see exporters.py)"""
+    from django.http import FileResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
     from django.utils import timezone
+    from .exporters import stream_users_csv, write_users_pdf
     import logging
+    import tempfile
     
     logger = logging.getLogger(__name__)
     logger.info(f"Export users called with format_type: {format_type}")
@@ -2619,204 +2207,30 @@ def export_users_list(request, format_type='csv'):
     if not request.user.is_staff:
         return HttpResponseForbidden("You do not have permission to export user data.")
     
-    User = get_user_model()
-    
-    # Get all users with stats
-    users = User.objects.select_related('profile').annotate(
-        total_summaries=Count('summaries', distinct=True),
-        total_chat_sessions=Count('chatsession', distinct=True),
-        total_signins=Count('signin_records', filter=Q(signin_records__success=True), distinct=True),
-        last_signin=Max('signin_records__created_at', filter=Q(signin_records__success=True))
-    ).order_by('-date_joined')
-    
-    logger.info(f"Processing export with format_type: '{format_type}' (type: {type(format_type)})")
-    
-    # Debug: Print what we received
-    print(f"DEBUG: format_type = '{format_type}', type = {type(format_type)}")
+    stamp = timezone.now().strftime("%Y%m%d")
     
     if format_type == 'csv':
-        logger.info("Generating CSV export")
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="users_export_{timezone.now().strftime("%Y%m%d")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Username', 'Email', 'Display Name', 'First Name', 'Last Name',
-            'Profession', 'Language', 'Signup Date', 'Last Login', 'Total Signins',
-            'Total Summaries', 'Total Chat Sessions', 'Status', 'Is Staff',
-            'Signup IP', 'Signup Country', 'Last Login IP', 'Last Login Country'
-        ])
-        
-        for user in users:
-            profile = getattr(user, 'profile', None)
-            writer.writerow([
-                user.username,
-                user.email,
-                profile.display_name if profile else '',
-                user.first_name or '',
-                user.last_name or '',
-                profile.profession if profile else '',
-                profile.language if profile else 'en-US',
-                user.date_joined.strftime('%Y-%m-%d %H:%M:%S'),
-                user.last_login.strftime('%Y-%m-%d %H:%M:%S') if user.last_login else '',
-                user.total_signins or 0,
-                user.total_summaries or 0,
-                user.total_chat_sessions or 0,
-                'Active' if user.is_active else 'Inactive',
-                'Yes' if user.is_staff else 'No',
-                profile.signup_ip if profile else '',
-                profile.signup_country if profile else '',
-                profile.last_login_ip if profile else '',
-                profile.last_login_country if profile else '',
-            ])
-        
+        response = StreamingHttpResponse(stream_users_csv(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="users_export_{stamp}.csv"'
         return response
     
     elif format_type == 'pdf':
-        print("DEBUG: Entering PDF generation block")
-        logger.info("PDF format detected, attempting PDF generation with ReportLab")
         try:
-            from reportlab.lib.pagesizes import letter, A4
-            logger.info("ReportLab imported successfully")
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib import colors
-            from reportlab.lib.units import inch
-            from io import BytesIO
-            
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-            elements = []
-            styles = getSampleStyleSheet()
-            
-            # Custom styles
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                textColor=colors.HexColor('#059669'),
-                spaceAfter=30,
-                alignment=1  # Center
+            # Pages are drawn to a temp file, then streamed from disk
+            out = tempfile.TemporaryFile()
+            write_users_pdf(out, timezone.now())
+            logger.info(f"PDF generated successfully, size: {out.tell()} bytes")
+            out.seek(0)
+            return FileResponse(
+                out, as_attachment=True, filename=f"users_export_{stamp}.pdf", content_type='application/pdf',
             )
-            
-            # Title
-            title = Paragraph("User Directory Export", title_style)
-            elements.append(title)
-            
-            # Summary info
-            summary_text = f"<b>Export Date:</b> {timezone.now().strftime('%B %d, %Y at %H:%M')}<br/>"
-            summary_text += f"<b>Total Users:</b> {users.count()}<br/>"
-            summary_text += f"<b>Users in Report:</b> {min(users.count(), 100)}"
-            summary = Paragraph(summary_text, styles['Normal'])
-            elements.append(summary)
-            elements.append(Spacer(1, 20))
-            
-            # Table data
-            data = [['Username', 'Email', 'Name', 'Profession', 'Signup', 'Status', 'Activity']]
-            
-            # Limit to 100 users for PDF
-            users_list = list(users[:100])
-            
-            for user in users_list:
-                profile = getattr(user, 'profile', None)
-                
-                # Safely get display name
-                display_name = ''
-                if profile:
-                    display_name = profile.display_name or ''
-                
-                # Build name safely
-                first_part = display_name or user.first_name or user.username
-                last_part = user.last_name or ''
-                name = f"{first_part} {last_part}".strip()
-                if len(name) > 20:
-                    name = name[:17] + "..."
-                
-                activity = f"S:{user.total_summaries or 0} C:{user.total_chat_sessions or 0} L:{user.total_signins or 0}"
-                status = 'Active' if user.is_active else 'Inactive'
-                if user.is_staff:
-                    status += ' (Staff)'
-                
-                # Safely get profession
-                profession = '—'
-                if profile and profile.profession:
-                    profession = profile.profession[:15]
-                
-                data.append([
-                    user.username[:18] if len(user.username) > 18 else user.username,
-                    user.email[:25] if len(user.email) > 25 else user.email,
-                    name[:20] if len(name) > 20 else name,
-                    profession,
-                    user.date_joined.strftime('%Y-%m-%d'),
-                    status[:15],
-                    activity
-                ])
-            
-            # Create table
-            table = Table(data, colWidths=[1*inch, 2*inch, 1.5*inch, 1*inch, 0.8*inch, 1*inch, 1.2*inch])
-            table.setStyle(TableStyle([
-                # Header row
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#374151')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('TOPPADDING', (0, 0), (-1, 0), 12),
-                
-                # Data rows
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F9FAFB')]),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-            ]))
-            
-            elements.append(table)
-            
-            # Footer
-            elements.append(Spacer(1, 20))
-            footer_text = f"Generated on {timezone.now().strftime('%B %d, %Y at %H:%M')} | NeuroMed Aira Analytics Dashboard"
-            footer = Paragraph(footer_text, styles['Normal'])
-            elements.append(footer)
-            
-            # Build PDF
-            doc.build(elements)
-            
-            # Get PDF value
-            pdf = buffer.getvalue()
-            buffer.close()
-            
-            # Create response
-            logger.info(f"PDF generated successfully, size: {len(pdf)} bytes")
-            response = HttpResponse(pdf, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="users_export_{timezone.now().strftime("%Y%m%d")}.pdf"'
-            return response
-            
         except ImportError as e:
             # ReportLab not installed
             logger.error(f"ReportLab import error: {str(e)}")
-            from django.http import HttpResponse
             return HttpResponse(f"ReportLab not installed. Error: {str(e)}. Please install: pip install reportlab", status=500)
         except Exception as e:
-            # If PDF generation fails, show error with details
-            import traceback
-            error_details = traceback.format_exc()
-            logger.error(f"PDF export error: {str(e)}")
-            logger.error(error_details)
-            from django.http import HttpResponse
-            # Return error message so user knows what went wrong
-            return HttpResponse(
-                f"PDF generation failed: {str(e)}\n\nDetails:\n{error_details}", 
-                content_type='text/plain',
-                status=500
-            )
+            logger.exception(f"PDF export error: {str(e)}")
+            return HttpResponse("PDF generation failed. Please try again.", content_type='text/plain', status=500)
     
     logger.warning(f"Invalid export format: '{format_type}'. Expected 'csv' or 'pdf'")
     return HttpResponse(f"Invalid export format: '{format_type}'. Expected 'csv' or 'pdf'.", status=400)
@@ -2855,6 +2269,21 @@ def staff_users_dashboard(request):
     )
 
 
+@login_required
+def answer_cache_stats(request):
+    """Staff-only: hit-rate and size of the local answer cache."""
+    from django.http import HttpResponseForbidden
+    from .answer_cache import get_answer_cache
+
+    if not request.user.is_staff:
+        return HttpResponseForbidden("You do not have permission to view this page.")
+
+    cache = get_answer_cache()
+    if cache is None:
+        return JsonResponse({"enabled": False})
+    return JsonResponse({"enabled": True, **cache.stats()})
+
+
 @login_required
 def get_user_settings(request):
     profile, _ = Profile.objects.get_or_create(user=request.user)
@@ -3021,60 +2450,27 @@ def change_password(request):
 @require_http_methods(["POST"])
 @csrf_exempt
 def export_account_data(request):
-    """Export user account data (GDPR compliance)."""
+    """Export user account data (GDPR compliance), streamed; ?format=ndjson for one record per line."""
     try:
+        from django.http import StreamingHttpResponse
+        from .exporters import EXPORT_FORMATS, stream_account_export
+        
         user = request.user
-        profile, _ = Profile.objects.get_or_create(user=user)
+        fmt = (request.GET.get("format") or "json").lower()
+        if fmt not in EXPORT_FORMATS:
+            return JsonResponse({"error": f"Unsupported format '{fmt}'"}, status=400)
         
-        # Gather all user data
-        account_data = {
-            "account": {
-                "username": user.username,
-                "email": user.email,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "date_joined": user.date_joined.isoformat(),
-                "last_login": user.last_login.isoformat() if user.last_login else None,
-            },
-            "profile": {
-                "display_name": profile.display_name,
-                "profession": profile.profession,
-                "language": profile.language,
-                "plan": profile.plan,
-                "subscription_status": profile.subscription_status,
-                "subscription_ends_at": profile.subscription_ends_at.isoformat() if profile.subscription_ends_at else None,
-            },
-            "settings": profile.user_settings or {},
-            "subscriptions": [
-                {
-                    "plan": sub.plan,
-                    "status": sub.status,
-                    "current_period_end": sub.current_period_end.isoformat() if sub.current_period_end else None,
-                    "created_at": sub.created_at.isoformat(),
-                }
-                for sub in Subscription.objects.filter(user=user)
-            ],
-            "payments": [
-                {
-                    "plan_id": payment.plan_id,
-                    "amount": str(payment.amount),
-                    "currency": payment.currency,
-                    "status": payment.status,
-                    "created_at": payment.created_at.isoformat(),
-                    "paid_at": payment.paid_at.isoformat() if payment.paid_at else None,
-                }
-                for payment in Payment.objects.filter(user=user)
-            ],
-        }
+        def chunks():
+            try:
+                yield from stream_account_export(user, fmt)
+            except Exception:
+                # Headers are already sent; the client sees a truncated download
+                log.exception("Error streaming account export for user %s", user.pk)
+                raise
         
-        # Return as JSON download
-        from django.http import HttpResponse
-        import json as json_module
-        response = HttpResponse(
-            json_module.dumps(account_data, indent=2),
-            content_type='application/json'
-        )
-        response['Content-Disposition'] = f'attachment; filename="account_data_{user.id}_{timezone.now().strftime("%Y%m%d")}.json"'
+        response = StreamingHttpResponse(chunks(), content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="account_data_{user.id}_{timezone.now().strftime("%Y%m%d")}.{fmt}"'
+        response['Cache-Control'] = 'no-store'
         return response
     
     except Exception as e:
@@ -3104,8 +2500,14 @@ def delete_account(request):
         # Log the deletion
         log.info(f"Account deletion requested for user {user.id} ({user.email})")
         
-        # Delete user (this will cascade delete profile, subscriptions, payments, etc.)
-        user.delete()
+        # Lock the account out now (inactive users fail session and token auth);
+        # the data itself is deleted in batches by the purge_account job
+        from rest_framework.authtoken.models import Token
+        from .jobs import submit_purge_job
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        Token.objects.filter(user=user).delete()
+        job, _ = submit_purge_job(user, "purge_account", params={"user_id": user.id})
         
         # Logout user
         from django.contrib.auth import logout
@@ -3113,8 +2515,9 @@ def delete_account(request):
         
         return JsonResponse({
             "status": "success",
-            "message": "Account deleted successfully"
-        })
+            "message": "Your account has been deactivated and its data is being deleted",
+            "job_id": job.pk,
+        }, status=202)
     
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
@@ -3129,16 +2532,23 @@ def delete_account(request):
 @require_http_methods(["POST"])
 @csrf_exempt
 def clear_all_chat_history(request):
-    """Clear all chat sessions for the user."""
+    """Queue deletion of all the user's chat sessions; poll the returned status_url for progress."""
     try:
         from .models import ChatSession
-        deleted_count = ChatSession.objects.filter(user=request.user).delete()[0]
+        from .jobs import submit_purge_job
+        from .job_views import _job_payload
+        
+        # Only chats that exist now; a chat started while the purge runs is kept
+        max_id = ChatSession.objects.filter(user=request.user).order_by("-pk").values_list("pk", flat=True).first()
+        if max_id is None:
+            return JsonResponse({"status": "success", "message": "No chat history to delete", "deleted_count": 0})
+        job, _ = submit_purge_job(request.user, "purge_chat_history", params={"max_id": max_id})
         
         return JsonResponse({
-            "status": "success",
-            "message": f"Deleted {deleted_count} chat session(s)",
-            "deleted_count": deleted_count
-        })
+            "status": "queued",
+            "message": "Deleting your chat history",
+            "job": _job_payload(request, job),
+        }, status=202)
     except Exception as e:
         log.error(f"Error clearing chat history: {e}")
         return JsonResponse({
@@ -3390,35 +2800,17 @@ def summarize_single_file(file_obj, tone: str, system_prompt: str, user=None, re
 
     # ---- Images → vision
     if lower.endswith(ALLOWED_IMAGE_EXTS):
-        stored_path = None
+        # One streamed write: a content-addressed copy in per-user media (indexed for
+        # later filename lookups), or a temp file for guests.
+        stored = _store_upload(user if user is not None else getattr(request, "user", None), file_obj, fname)
 
-        # Try to persist a copy into per-user media + index it for later filename lookups
         try:
-            if request is not None:
-                stored_path = _save_copy_to_user_media(request, file_obj, fname)  # returns a Path
-        except Exception:
-            traceback.print_exc()
-            stored_path = None
-
-        # If we have a stored copy, analyze that; otherwise fall back to a temp file
-        if stored_path and stored_path.exists():
-            tmp_path = str(stored_path)
-            cleanup_after = False
-        else:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(lower)[1]) as tmp:
-                for chunk in file_obj.chunks():
-                    tmp.write(chunk)
-                tmp_path = tmp.name
-            cleanup_after = True
-
-        try:
-            summary = extract_contextual_medical_insights_from_image(tmp_path, tone=tone)
+            summary = _cached_by_digest(
+                "vision", [stored.sha256], f"{tone}|en-US",
+                lambda: extract_contextual_medical_insights_from_image(str(stored.path), tone=tone),
+            )
         finally:
-            if cleanup_after:
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+            _discard_temporary([stored])
 
         if user and getattr(user, "is_authenticated", False):
             MedicalSummary.objects.create(
@@ -3431,16 +2823,19 @@ def summarize_single_file(file_obj, tone: str, system_prompt: str, user=None, re
         return fname, summary
 
     # ---- Docs → extract + summarize
-    if lower.endswith(".pdf"):
-        raw_text = extract_text_from_pdf(file_obj)
-    elif lower.endswith(".docx"):
-        raw_text = extract_text_from_docx(file_obj)
-    elif lower.endswith(".txt"):
-        raw_text = file_obj.read().decode("utf-8", errors="ignore")
-    else:
+    if not lower.endswith((".pdf", ".docx", ".txt")):
         return fname, "Unsupported file format."
-
-    summary = summarize_text_block(raw_text, system_prompt)
+    digest = _upload_digest(file_obj)
+    try:
+        raw_text = extract_document(file_obj, fname, tone=tone, digest=digest).text
+    except ExtractionLimitError as e:
+        return fname, str(e)
+
+    prompt_key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    summary = _cached_by_digest(
+        "summary", [digest], prompt_key,
+        lambda: summarize_text_block(raw_text, system_prompt),
+    )
 
     if user and getattr(user, "is_authenticated", False):
         MedicalSummary.objects.create(
@@ -4656,12 +4051,34 @@ def google_oauth_callback(request):
         return HttpResponseBadRequest(f"An error occurred: {str(e)}")
 
 
+from rest_framework.decorators import renderer_classes
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class MP3Renderer(BaseRenderer):
+    """Raw audio for clients that send Accept: audio/mpeg; error payloads stay JSON."""
+    media_type = "audio/mpeg"
+    format = "mp3"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray)):
+            return data
+        response = (renderer_context or {}).get("response")
+        if response is not None:
+            response["Content-Type"] = "application/json"
+        return JSONRenderer().render(data)
+
+
 @api_view(["POST"])
+@renderer_classes([JSONRenderer, MP3Renderer])
 @csrf_exempt
 def text_to_speech(request):
     """
     Generate text-to-speech audio using OpenAI TTS API.
-    Filters out emojis and returns base64-encoded audio.
+    Filters out emojis and returns the MP3 as-is for Accept: audio/mpeg,
+    otherwise base64-encoded in JSON (a third larger, for older clients).
     Uses tts-1 model for cost efficiency.
     """
     import re
@@ -4720,6 +4137,8 @@ def text_to_speech(request):
         )
 
         audio_bytes = response.content
+        if request.accepted_renderer.format == "mp3":
+            return Response(audio_bytes, content_type="audio/mpeg")
         audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
 
         return JsonResponse({
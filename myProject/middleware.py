@@ -1,7 +1,18 @@
 """
 Custom middleware for the project.
 """
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
 
 
 class DisableCSRFForAPI(MiddlewareMixin):
@@ -25,3 +36,109 @@ class BusyModeMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # Placeholder - no action needed
         return None
+
+
+# Text-like payloads only; media is already compressed and HTML pages carry
+# CSRF tokens (BREACH), so neither is listed
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "image/svg+xml",
+)
+BROTLI_QUALITY = 6  # about gzip -6 speed; 11 (the library default) is far too slow for dynamic responses
+re_accepts_br = re.compile(r"\bbr\b")
+re_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def compression_exempt(view_func):
+    """Never compress this view's responses (e.g. already compressed or latency-sensitive streams)."""
+    @wraps(view_func)
+    def wrapped_view(*args, **kwargs):
+        return view_func(*args, **kwargs)
+    wrapped_view.compression_exempt = True
+    return wrapped_view
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli (when the optional `brotli` package is installed) or gzip for
+    responses of a COMPRESSIBLE_TYPES content type, at least
+    COMPRESSION_MIN_BYTES long (streams are always compressed, chunk by chunk).
+    Views decorated with @compression_exempt and paths under
+    COMPRESSION_EXEMPT_PATHS are passed through untouched. Like Django's
+    GZipMiddleware, gzip output gets random padding against BREACH.
+    """
+    max_random_bytes = 100
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, "compression_exempt", False):
+            request._compression_exempt = True
+        return None
+
+    def _encoding(self, request):
+        accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and re_accepts_br.search(accept):
+            return "br"
+        if re_accepts_gzip.search(accept):
+            return "gzip"
+        return None
+
+    def process_response(self, request, response):
+        if getattr(request, "_compression_exempt", False) or response.has_header("Content-Encoding"):
+            return response
+        if request.path.startswith(tuple(getattr(settings, "COMPRESSION_EXEMPT_PATHS", ()))):
+            return response
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type not in getattr(settings, "COMPRESSION_CONTENT_TYPES", COMPRESSIBLE_TYPES):
+            return response
+        if response.streaming:
+            if response.is_async:  # no async streams in this project; leave them alone
+                return response
+        elif len(response.content) < getattr(settings, "COMPRESSION_MIN_BYTES", 1024):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = self._encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes,
+                )
+            # Compressed size is unknown until the stream ends
+            del response.headers["Content-Length"]
+        else:
+            if encoding == "br":
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=self.max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # A compressed body is a different representation: strong ETags become weak
+        # (If-None-Match still matches them, see myApp/conditional.py)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
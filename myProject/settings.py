@@ -52,13 +52,80 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "")
 VOICE_ID_ENGLISH = os.getenv("VOICE_ID_ENGLISH", "")
 
+# Voice websocket (myApp/consumers.py): in-flight OpenAI/ElevenLabs calls per process, and their timeout in seconds
+VOICE_MAX_UPSTREAM_CALLS = int(os.getenv('VOICE_MAX_UPSTREAM_CALLS', '16'))
+VOICE_UPSTREAM_TIMEOUT = float(os.getenv('VOICE_UPSTREAM_TIMEOUT', '30'))
+
 # Feature Flags
 ENABLE_ADAPTIVE_RESPONSE = os.getenv('ENABLE_ADAPTIVE_RESPONSE', 'False').lower() == 'true'
 
-# File upload limits - allow larger images for mobile/medical uploads
-# Django defaults: 2.5 MB - too small for phone camera images
-FILE_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024   # 25 MB per file
-DATA_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024   # 30 MB total request
+# Local answer cache for file-less, history-free QUICK/EXPLAIN turns (opt-in)
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'False').lower() == 'true'
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.8'))  # cosine, 0-1
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(6 * 3600)))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '2000'))
+
+# Background analysis jobs (worker: python manage.py run_jobs)
+ANALYSIS_JOB_IMAGE_BATCH_SIZE = int(os.getenv('ANALYSIS_JOB_IMAGE_BATCH_SIZE', '4'))
+ANALYSIS_JOB_VISION_TIMEOUT = float(os.getenv('ANALYSIS_JOB_VISION_TIMEOUT', '120'))
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv('ANALYSIS_JOB_STALE_SECONDS', str(15 * 60)))
+ANALYSIS_JOB_HEARTBEAT_SECONDS = int(os.getenv('ANALYSIS_JOB_HEARTBEAT_SECONDS', '60'))  # must stay well under STALE
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '1000'))  # rows per DELETE in account/chat purges
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '200'))  # rows fetched per query by streaming exports
+EXPORT_USERS_PDF_MAX = int(os.getenv('EXPORT_USERS_PDF_MAX', '10000'))  # users drawn into the staff PDF export
+
+# Vision payload encoding: auto | legacy | xray | document | photo | compact
+# (see myApp/image_pipeline.py; benchmark with `python manage.py bench_vision_encoding`)
+VISION_ENCODING_PROFILE = os.getenv('VISION_ENCODING_PROFILE', 'auto')
+
+# Scanned PDF pages (little/no text layer) are rasterized and read by the vision model
+PDF_MIN_TEXT_CHARS = int(os.getenv('PDF_MIN_TEXT_CHARS', '50'))
+PDF_SCAN_DPI = int(os.getenv('PDF_SCAN_DPI', '150'))
+PDF_SCAN_MAX_EDGE = int(os.getenv('PDF_SCAN_MAX_EDGE', '2000'))  # pixels
+PDF_SCAN_MAX_PAGES = int(os.getenv('PDF_SCAN_MAX_PAGES', '10'))  # background jobs
+PDF_SCAN_MAX_PAGES_IN_REQUEST = int(os.getenv('PDF_SCAN_MAX_PAGES_IN_REQUEST', '3'))  # must fit the 120 s worker timeout
+
+# File uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to a temp file
+# instead of RAM (this is a spill threshold, not a size limit); extraction and
+# _store_upload read them from disk.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024    # 2 MB
+DATA_UPLOAD_MAX_MEMORY_SIZE = 30 * 1024 * 1024   # 30 MB of non-file form data
+
+# Document extraction budgets (myApp/extraction.py): larger files are refused,
+# longer documents are truncated with a note to the model
+EXTRACT_MAX_BYTES = int(os.getenv('EXTRACT_MAX_BYTES', str(25 * 1024 * 1024)))
+EXTRACT_MAX_PAGES = int(os.getenv('EXTRACT_MAX_PAGES', '200'))
+EXTRACT_MAX_CHARS = int(os.getenv('EXTRACT_MAX_CHARS', '150000'))
+
+# Resumable chunked uploads (myApp/uploads.py, api/mobile/uploads/)
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_EXPIRY_HOURS = int(os.getenv('UPLOAD_EXPIRY_HOURS', '24'))
+UPLOAD_MAX_OPEN = int(os.getenv('UPLOAD_MAX_OPEN', '20'))  # unfinished uploads per user
+
+# Cold storage (python manage.py compact_cold_data): compress old raw_text and idle chats
+COLD_STORAGE_IDLE_DAYS = int(os.getenv('COLD_STORAGE_IDLE_DAYS', '90'))
+COLD_STORAGE_CODEC = os.getenv('COLD_STORAGE_CODEC', 'zlib')  # zlib | zstd (needs zstandard)
+
+# Retention (python manage.py enforce_retention): data past the plan history window
+# plus grace is archived or deleted; user retention preferences always delete
+RETENTION_MODE = os.getenv('RETENTION_MODE', 'archive')  # archive | delete
+RETENTION_GRACE_DAYS = int(os.getenv('RETENTION_GRACE_DAYS', '30'))
+ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', '395'))
+
+# Analytics export: days (counting today) it may aggregate live; older days come from rollup_analytics
+ANALYTICS_EXPORT_LIVE_DAYS = int(os.getenv('ANALYTICS_EXPORT_LIVE_DAYS', '2'))
+
+# Mobile chat delta sync (api/mobile/chat/sync/): page size, and how long deleted-session tombstones are kept
+CHAT_SYNC_PAGE_SIZE = int(os.getenv('CHAT_SYNC_PAGE_SIZE', '100'))
+CHAT_TOMBSTONE_DAYS = int(os.getenv('CHAT_TOMBSTONE_DAYS', '90'))
+
+# Mobile batch endpoint (api/mobile/batch/): most sub-requests accepted in one batch
+MOBILE_BATCH_MAX_REQUESTS = int(os.getenv('MOBILE_BATCH_MAX_REQUESTS', '20'))
+
+# Response compression (myProject.middleware.CompressionMiddleware): brotli if installed, else gzip
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_EXEMPT_PATHS = [p.strip() for p in os.getenv('COMPRESSION_EXEMPT_PATHS', '').split(',') if p.strip()]
 
 
 INSTALLED_APPS = [
@@ -80,6 +147,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'myProject.middleware.CompressionMiddleware',  # before anything that reads or changes the body
     'corsheaders.middleware.CorsMiddleware',  # CORS must be early
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -273,8 +341,19 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "django_cache",   # table name
         "TIMEOUT": 10 * 60,           # 10 minutes (OTP TTL)
-    }
+    },
+    # Per-process tier for hot, short-lived lookups (mobile token auth)
+    "local": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "neuromed-local",
+        "TIMEOUT": 60,
+    },
 }
+# Seconds a mobile API token (with its user and profile) stays in the local cache; also the
+# staleness bound for changes that send no signal (see mobile_api/authentication.py)
+TOKEN_AUTH_CACHE_SECONDS = int(os.getenv('TOKEN_AUTH_CACHE_SECONDS', '60'))
+# How often another process's invalidation (a marker in the default cache) is checked for
+TOKEN_AUTH_RECHECK_SECONDS = int(os.getenv('TOKEN_AUTH_RECHECK_SECONDS', '5'))
 
 
 SESSION_COOKIE_SECURE = False      # True only in HTTPS
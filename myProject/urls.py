@@ -24,9 +24,16 @@ urlpatterns = [
     # Chat endpoints - NOTE: These are handled by myApp.urls for web app compatibility  
     # Mobile-specific endpoints moved to /api/mobile/ prefix to avoid conflicts
     path('api/mobile/chat/sessions/', mobile_views.chat_sessions, name='mobile_api_chat_sessions'),
+    path('api/mobile/chat/sync/', mobile_views.chat_sync, name='mobile_api_chat_sync'),
     path('api/mobile/chat/sessions/new/', mobile_views.create_chat_session, name='mobile_api_create_session'),
     path('api/mobile/chat/clear-session/', mobile_views.clear_session, name='mobile_api_clear_session'),
     path('api/mobile/send-chat/', mobile_views.send_chat, name='mobile_api_send_chat'),
+    path('api/mobile/uploads/', mobile_views.upload_start, name='mobile_api_upload_start'),
+    path('api/mobile/uploads/<uuid:upload_id>/', mobile_views.upload_chunk, name='mobile_api_upload_chunk'),
+    path('api/mobile/uploads/<uuid:upload_id>/finalize/', mobile_views.upload_finalize, name='mobile_api_upload_finalize'),
+    
+    # Launch requests (auth status, config, tones, settings, chat list) in one round trip
+    path('api/mobile/batch/', mobile_views.batch, name='mobile_api_batch'),
     
     # IMPORTANT: iOS app calls /api/send-chat/ directly, so we need to intercept it here
     # This route must come BEFORE myApp.urls to take precedence